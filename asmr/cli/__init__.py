@@ -2,6 +2,7 @@
 
 import click
 
+import asmr.cli.bench
 import asmr.cli.build
 import asmr.cli.dev
 import asmr.cli.design
@@ -30,6 +31,7 @@ main.add_command(project.new)
 # main.add_command(software.update) # TODO remove this if there are no problems encountered.
 main.add_command(update.main)
 main.add_command(oscilloscope.main)
+main.add_command(bench.main)
 
 
 @main.command('testing')
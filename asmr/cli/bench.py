@@ -0,0 +1,56 @@
+""" ASMR Benchmarks """
+
+import fnmatch
+import json
+
+import click
+
+import asmr.logging
+import asmr.design.benchmark
+
+
+#:::: Logging
+#::::::::::::
+log = asmr.logging.get_logger()
+
+
+@click.group('bench', help="benchmark toolkit performance")
+def main():
+    pass
+
+
+@main.command("design")
+@click.option('-o', '--output', default='bench-design.json', help="results file (.json)")
+@click.option('-k', '--match', multiple=True, help="only run workloads matching this glob [repeatable]")
+@click.option('--sizes', default=','.join(map(str, asmr.design.benchmark.GRID_SIZES)), help="comma separated grid sizes")
+@click.option('-r', '--repeat', default=1, help="runs per workload (the fastest is kept)", type=int)
+@click.option('-c', '--compare', default=None, help="baseline results file to compare against", type=click.Path(exists=True))
+@click.option('-l', '--list', 'list_only', is_flag=True, default=False, help="list the workloads and exit")
+def design(output, match, sizes, repeat, compare, list_only):
+    """ benchmark the capacitive grid and eurorack panel generators. """
+    jobs = asmr.design.benchmark.workloads(sizes=[int(s) for s in sizes.split(',')])
+    if len(match) > 0:
+        jobs = [job for job in jobs if any(fnmatch.fnmatch(job[0], m) for m in match)]
+
+    if list_only:
+        for name, _ in jobs:
+            print(name)
+        return
+
+    def progress(result):
+        rss = '?' if result['peak_rss'] is None else f"{result['peak_rss']/2**20:.1f}MiB"
+        log.info(f"{result['name']}: {result['seconds']*1000:.1f}ms "
+                 f"(generate {result['generate_seconds']*1000:.1f}ms, save {result['save_seconds']*1000:.1f}ms) "
+                 f"{result['shapes']} shapes, {result['bytes']} bytes, peak rss {rss}")
+
+    results = asmr.design.benchmark.run(jobs, repeat=repeat, progress=progress)
+    with open(output, 'w') as fd:
+        json.dump(results, fd, indent=2)
+    log.info(f"wrote {len(results['results'])} results to {output}")
+
+    if compare is not None:
+        with open(compare) as fd:
+            baseline = json.load(fd)
+        for name, seconds, rss in asmr.design.benchmark.compare(results, baseline):
+            rss = '' if rss is None else f", peak rss x{rss:.2f}"
+            log.info(f"{name}: time x{seconds:.2f}{rss}")
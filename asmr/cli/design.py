@@ -1,9 +1,18 @@
 """ ASMR Design Toolkit """
 
+import pathlib
+import time
+
 import click
+import toml
 
+import asmr.fs
 import asmr.logging
 import asmr.design
+import asmr.design.batch
+import asmr.design.drc
+import asmr.design.preview
+import asmr.design.spec
 import asmr.kicad
 
 
@@ -31,9 +40,12 @@ def main():
 @click.option('--padding', default=0.0, help="padding of sensor nodes", type=float)
 @click.option('-r', '--resolution', default=(1, 1), help="scale of rows/columns", type=(int, int))
 @click.option('--silk_scaling', default=(1, 1), help="scale of silkscreen rows/columns", type=(int, int))
-@click.option('-f', '--filename', required=True, help="output file (.svg|.kicad_mod)")
-@click.option('--fmt', default='0.6,#|0.6,#', help="row|column format string (<FILL_PERCENT>[,<PATTERN>][|][...]) PATTERN=/ \ #")
+@click.option('-f', '--filename', required=True, multiple=True, help="output file (.svg|.kicad_mod|.dxf|.gbr|.zip) [repeatable, generated once]")
+@click.option('--fmt', default='0.6,#|0.6,#', help="row|column format string (<FILL_PERCENT>[,<PATTERN>][|][...]) PATTERN=/ \ | - # + or angles in degrees")
 @click.option('--color', is_flag=True, default=False, help="color-codes electrodes for easier inspection")
+@click.option('--no-cache', is_flag=True, default=False, help="always regenerate instead of reusing a cached design")
+@click.option('--drc', is_flag=True, default=False, help="check the electrodes against the design rules")
+@click.option('--instancing', is_flag=True, default=False, help="store repeated nodes once and place them (interleaved, svg <defs>/<use>)")
 def touch_grid(filename,
                pattern,
                xsize,
@@ -46,7 +58,10 @@ def touch_grid(filename,
                resolution,
                silk_scaling,
                fmt,
-               color):
+               color,
+               no_cache,
+               drc,
+               instancing):
     """ generate capacitive touch design. """
     if pattern == 'interleaved':
         pattern = asmr.design.GridPattern.Interleaved
@@ -62,16 +77,168 @@ def touch_grid(filename,
                                                resolution=resolution,
                                                silk_scaling=silk_scaling,
                                                use_color=color,
-                                               fmt=fmt)
+                                               fmt=fmt,
+                                               instancing=instancing)
+
+    cache = None if no_cache else asmr.design.ArtifactCache()
+    result = grid.create(pattern, list(filename), cache=cache, drc=drc)
+    if result is None:
+        log.info(f"{', '.join(filename)} (cached)")
+        return
+    if result.separation < result.target_separation:
+        log.warning(f"electrodes are {result.separation:.4f}mm apart (asked for {result.target_separation}mm)")
+    if drc:
+        log_drc_report(result.drc)
+
+@main.command("drc")
+@click.argument('filename', type=click.Path(exists=True))
+@click.option('-s', '--separation', default=0.3, help="minimum separation between pads (mm)", type=float)
+@click.option('-w', '--min-width', default=asmr.design.drc.MIN_WIDTH, help="minimum trace width (mm)", type=float)
+@click.option('-n', '--max-violations', default=20, help="number of violations to list", type=int)
+def drc(filename, separation, min_width, max_violations):
+    """ check the copper of a footprint (.kicad_mod) against design rules. """
+    copper = asmr.design.drc.Copper.from_footprint(filename)
+    report = asmr.design.drc.check(copper, asmr.design.drc.DesignRules(separation, min_width=min_width))
+    log_drc_report(report, max_violations)
+
+def log_drc_report(report, max_violations=20):
+    for violation in report.violations[:max_violations]:
+        log.warning(str(violation))
+    if len(report.violations) > max_violations:
+        log.warning(f"... {len(report.violations) - max_violations} more")
+    measured = 'n/a' if report.min_separation is None else f"{report.min_separation:.4f}mm"
+    summary = (f"{report.primitives} primitives, {report.pairs} pairs measured, "
+               f"min separation {measured} (rule {report.rules.min_separation}mm)")
+    if report.ok():
+        log.info(f"drc passed: {summary}")
+    else:
+        log.error(f"drc failed with {len(report.violations)} violations: {summary}")
+
+@main.command("touch-grid-sweep")
+@click.option('-p', '--pattern',
+              default='interleaved',
+              type=click.Choice(['interleaved', 'diamond'], case_sensitive=False),
+              help="electrode pattern")
+@click.option('-x', '--xsize', default=1, help="X size", type=int)
+@click.option('-y', '--ysize', default=1, help="Y size", type=int)
+@click.option('--pitch', multiple=True, help="node size (mm) [repeatable]", type=float)
+@click.option('--xwidth', multiple=True, help="width of x electrode traces (mm) [repeatable]", type=float)
+@click.option('--ywidth', multiple=True, help="width of y electrode traces (mm) [repeatable]", type=float)
+@click.option('-s', '--separation', multiple=True, help="separation of traces [repeatable]", type=float)
+@click.option('--padding', multiple=True, help="padding of sensor nodes [repeatable]", type=float)
+@click.option('-r', '--resolution', default=(1, 1), help="scale of rows/columns", type=(int, int))
+@click.option('--silk_scaling', default=(1, 1), help="scale of silkscreen rows/columns", type=(int, int))
+@click.option('-f', '--filename', required=True, help="output filename template, e.g. sweep/grid-{pitch}-{separation}.svg")
+@click.option('--fmt', multiple=True, help="row|column format string [repeatable]")
+@click.option('--color', is_flag=True, default=False, help="color-codes electrodes for easier inspection")
+@click.option('-j', '--workers', default=None, help="number of worker processes (default: cpu count)", type=int)
+@click.option('--no-cache', is_flag=True, default=False, help="always regenerate instead of reusing cached designs")
+def touch_grid_sweep(filename,
+                     pattern,
+                     xsize,
+                     ysize,
+                     pitch,
+                     xwidth,
+                     ywidth,
+                     separation,
+                     padding,
+                     resolution,
+                     silk_scaling,
+                     fmt,
+                     color,
+                     workers,
+                     no_cache):
+    """ generate capacitive touch designs for every combination of parameters. """
+    pattern = asmr.design.GridPattern(pattern.lower())
+
+    grid = asmr.design.CapacitiveGridGenerator(size=(xsize, ysize),
+                                               pitch=6.0,
+                                               xwidth=0.5,
+                                               ywidth=0.5,
+                                               separation=0.3,
+                                               padding=0.0,
+                                               resolution=resolution,
+                                               silk_scaling=silk_scaling,
+                                               use_color=color,
+                                               fmt='0.6,#|0.6,#')
+    swept = {
+        'pitch': pitch,
+        'xwidth': xwidth,
+        'ywidth': ywidth,
+        'separation': separation,
+        'padding': padding,
+        'fmt': fmt,
+    }
+    params = {k: list(v) for k, v in swept.items() if len(v) > 0}
 
-    grid.create(pattern, filename)
+    cache = None if no_cache else asmr.design.ArtifactCache()
+    start = time.perf_counter()
+    results = grid.sweep(pattern, params, filename, workers=workers, cache=cache)
+    for result in results:
+        shapes = 'cached' if result['shapes'] is None else f"{result['shapes']} shapes"
+        log.info(f"{result['filename']}: {result['seconds']*1000:.1f}ms ({shapes})")
+    log.info(f"{len(results)} variants in {time.perf_counter() - start:.2f}s")
+
+@main.command("touch-grid-panel")
+@click.option('--sensor', 'sensors', multiple=True, required=True,
+              help="sensor on the panel as <PATTERN>:<X>x<Y>[:<COUNT>], e.g. diamond:8x8:4 [repeatable]")
+@click.option('--pitch', default=6.0, help="node size (mm)", type=float)
+@click.option('--xwidth', default=0.5, help="width of x electrode traces (mm)", type=float)
+@click.option('--ywidth', default=0.5, help="width of y electrode traces (mm)", type=float)
+@click.option('-s', '--separation', default=0.3, help="separation of traces", type=float)
+@click.option('--padding', default=0.0, help="padding of sensor nodes", type=float)
+@click.option('--fmt', default='0.6,#|0.6,#', help="row|column format string of diamond sensors")
+@click.option('-w', '--width', default=None, help="max width of the board area (mm)", type=float)
+@click.option('--spacing', default=2.0, help="width of the routed channels between boards (mm)", type=float)
+@click.option('--rail', default=5.0, help="width of the panel frame (mm)", type=float)
+@click.option('--no-fiducials', is_flag=True, default=False, help="omit the fiducials on the rail")
+@click.option('-f', '--filename', required=True, help="output file (.svg|.kicad_pcb)")
+def touch_grid_panel(sensors,
+                     pitch,
+                     xwidth,
+                     ywidth,
+                     separation,
+                     padding,
+                     fmt,
+                     width,
+                     spacing,
+                     rail,
+                     no_fiducials,
+                     filename):
+    """ panelize capacitive touch sensors. """
+    panel = asmr.design.SensorPanel(filename,
+                                    width=width,
+                                    spacing=spacing,
+                                    rail=rail,
+                                    fiducials=not no_fiducials)
+    for sensor in sensors:
+        fields = sensor.split(':')
+        xsize, ysize = (int(n) for n in fields[1].lower().split('x'))
+        generator = asmr.design.CapacitiveGridGenerator(size=(xsize, ysize),
+                                                        pitch=pitch,
+                                                        xwidth=xwidth,
+                                                        ywidth=ywidth,
+                                                        separation=separation,
+                                                        padding=padding,
+                                                        fmt=fmt)
+        count = int(fields[2]) if len(fields) > 2 else 1
+        panel.add(generator, asmr.design.GridPattern(fields[0].lower()), count)
+
+    start = time.perf_counter()
+    panel.save()
+    log.info(f"{filename}: {len(panel.instances)} boards of {len(panel.designs)} designs "
+             f"in {time.perf_counter() - start:.2f}s")
 
 @main.command("kicad-symbol")
 @click.option('-p', '--pins', default=1, help="number of pins", type=int)
-@click.option('-f', '--filename', required=True, help="output file (.svg|.kicad_mod)")
-def kicad_symbol(pins, filename):
+@click.option('-t', '--table', default=None, help="pin table (.csv|.toml) with number, name, type, side and group columns", type=click.Path(exists=True))
+@click.option('--sides', default=None, help="pins on the top, right, bottom and left side", type=(int, int, int, int))
+@click.option('-f', '--filename', required=True, help="output file (.kicad_sym)")
+def kicad_symbol(pins, table, sides, filename):
     """ generate a kicad symbol. """
-    sym = asmr.kicad.Symbol(filename, pins)
+    if sides is not None:
+        sides = dict(zip(asmr.kicad.PIN_SIDES, sides))
+    sym = asmr.kicad.Symbol(filename, pins, pins=table, sides=sides)
     sym.save()
 
 @main.command("eurorack-panel")
@@ -79,9 +246,97 @@ def kicad_symbol(pins, filename):
 @click.option('-u', '--hu', default=3, help="module HU", type=int)
 @click.option('-o', '--ovals', default=True, help="oval mounting holes", type=bool)
 @click.option('--show-pcb-zone', is_flag=True, default=False, help="show allowable pcb zone")
-@click.option('-f', '--filename', required=True, help="output file (.svg)")
-def eurorack_panel(hp, hu, ovals, show_pcb_zone, filename):
-    """ generate a eurorack panel svg. """
+@click.option('-f', '--filename', required=True, help="output file (.svg|.dxf|.gbr|.zip)")
+@click.option('--no-cache', is_flag=True, default=False, help="always regenerate instead of reusing a cached design")
+def eurorack_panel(hp, hu, ovals, show_pcb_zone, filename, no_cache):
+    """ generate a eurorack panel (svg, dxf or gerber). """
     panel = asmr.design.EurorackPanel(filename, hp, hu, ovals=ovals, pcb_zone=show_pcb_zone)
-    panel.render()
-    panel.save()
+
+    def generate():
+        panel.render()
+        panel.save()
+
+    if no_cache:
+        generate()
+        return
+    params = {'hp': hp, 'hu': hu, 'ovals': ovals, 'pcb_zone': show_pcb_zone}
+    if asmr.design.ArtifactCache().produce('eurorack-panel', params, filename, generate):
+        log.info(f"{filename} (cached)")
+
+@main.command("watch")
+@click.argument('spec', type=click.Path(exists=True))
+def watch(spec):
+    """ regenerate the designs of a spec (.toml) whenever it changes. """
+    workspace = asmr.design.spec.Workspace(spec)
+    regenerate(workspace)
+    # the outputs may be written next to the spec, only react to the spec itself.
+    for path in asmr.fs.watch([workspace.path.parent]):
+        if pathlib.Path(path).resolve() == workspace.path:
+            regenerate(workspace)
+
+@main.command("batch")
+@click.argument('spec', type=click.Path(exists=True))
+@click.option('-j', '--workers', default=None, help="number of worker processes (default: cpu count)", type=int)
+@click.option('--no-cache', is_flag=True, default=False, help="always regenerate instead of reusing cached designs")
+def batch(spec, workers, no_cache):
+    """ generate all designs of a spec (.toml) in a worker pool. """
+    path = pathlib.Path(spec).resolve()
+    try:
+        jobs = asmr.design.batch.jobs(asmr.design.spec.load(path), path.parent)
+    except (toml.TomlDecodeError, TypeError, ValueError, KeyError) as e:
+        log.error(f"{path}: {e}")
+        return
+    log.info(f"{path}: {len(jobs)} jobs")
+
+    def progress(result):
+        names = ', '.join(result['filenames'])
+        if result['error'] is not None:
+            log.error(f"{names}: {result['error']}")
+        elif len(result['cached']) == len(result['filenames']):
+            log.info(f"{names} (cached)")
+        else:
+            log.info(f"{names}: {result['seconds']*1000:.1f}ms")
+
+    start = time.perf_counter()
+    cache = None if no_cache else asmr.design.ArtifactCache()
+    results = asmr.design.batch.run(jobs, workers=workers, cache=cache, progress=progress)
+    failed = sum(1 for r in results if r['error'] is not None)
+    summary = f"{len(results) - failed} of {len(results)} jobs done in {time.perf_counter() - start:.2f}s"
+    if failed > 0:
+        log.error(summary)
+    else:
+        log.info(summary)
+
+@main.command("serve")
+@click.argument('spec', type=click.Path(exists=True))
+@click.option('--host', default='127.0.0.1', help="address to listen on")
+@click.option('--port', default=8000, help="port to listen on", type=int)
+def serve(spec, host, port):
+    """ live preview of the designs of a spec (.toml) in the browser. """
+    server = asmr.design.preview.PreviewServer(spec, host, port)
+    log_results(server.update(), server.error)
+    server.start()
+    log.info(f"serving previews of {server.workspace.path} on {server.url}")
+    try:
+        for path in asmr.fs.watch([server.workspace.path.parent], interval=0.1):
+            if pathlib.Path(path).resolve() == server.workspace.path:
+                log_results(server.update(), server.error)
+    finally:
+        server.stop()
+
+def log_results(results, error=None):
+    if error is not None:
+        log.error(error)
+        return
+    for filenames, rebuilt, seconds in results:
+        layers = ', '.join(rebuilt) if len(rebuilt) > 0 else 'nothing'
+        log.info(f"{', '.join(filenames)}: rebuilt {layers} in {seconds*1000:.1f}ms")
+
+def regenerate(workspace):
+    try:
+        results = workspace.regenerate()
+    except (toml.TomlDecodeError, TypeError, ValueError, KeyError) as e:
+        # keep watching, the spec is probably being edited.
+        log.error(f"{workspace.path}: {e}")
+        return
+    log_results(results)
@@ -1,2 +1,4 @@
+from .cache import ArtifactCache
 from .capacitive_grid import CapacitiveGridGenerator, GridPattern
 from .eurorack import EurorackPanel
+from .panelization import SensorPanel
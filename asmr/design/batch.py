@@ -0,0 +1,116 @@
+""" Batch generation of the designs of a spec file.
+
+The jobs of a spec (see spec.py) run in a pool of long-lived worker
+processes: the toolkit is imported once per worker instead of once per
+design. Identical designs are generated once and saved to all of their
+filenames.
+"""
+
+import concurrent.futures
+import json
+import time
+
+import asmr.kicad
+from . import spec as design_spec
+from .capacitive_grid import CapacitiveGridGenerator, GridPattern
+from .eurorack import EurorackPanel
+
+
+# defaults of the optional eurorack panel parameters, so that specs which
+# spell them out or not describe the same job.
+PANEL_DEFAULTS = {'ovals': True, 'pcb_zone': False}
+
+
+def jobs(spec: dict, root) -> list:
+    """ the designs of a spec as (kind, params, filenames) jobs.
+
+    designs with the same kind and parameters are merged into one job
+    which saves all of their (distinct) filenames.
+    """
+    designs = []
+    for generator, pattern, filenames in design_spec.touch_grids(spec, root):
+        designs.append(('touch-grid', {**vars(generator), 'pattern': pattern.value}, filenames))
+    for params, filenames in design_spec.eurorack_panels(spec, root):
+        designs.append(('eurorack-panel', {**PANEL_DEFAULTS, **params}, filenames))
+    for params, filenames in design_spec.entries(spec, 'kicad-symbol', root):
+        if isinstance(params.get('pins'), str):
+            # pin tables are relative to the spec, like the outputs.
+            params['pins'] = str(root/params['pins'])
+        designs.append(('kicad-symbol', params, filenames))
+
+    merged = {}
+    for kind, params, filenames in designs:
+        key = json.dumps({'kind': kind, 'params': params}, sort_keys=True, default=str)
+        if key not in merged:
+            merged[key] = (kind, params, [])
+        merged[key][2].extend(f for f in filenames if f not in merged[key][2])
+    return list(merged.values())
+
+
+def run_job(job) -> dict:
+    """ batch worker: generates one design and saves it to its filenames. """
+    kind, params, filenames, cache = job
+    start = time.perf_counter()
+    cached = []
+    try:
+        if kind == 'touch-grid':
+            params = dict(params)
+            pattern = GridPattern(params.pop('pattern', GridPattern.Interleaved.value))
+            generator = CapacitiveGridGenerator(**params)
+            # the batch is already spread across processes, export in this one.
+            if generator.create(pattern, filenames, cache=cache, workers=1) is None:
+                cached = filenames
+        elif kind == 'eurorack-panel':
+            panel = EurorackPanel(filenames[0], **params)
+
+            def generate(missing):
+                panel.render()
+                for filename in missing:
+                    panel.save(filename)
+
+            if cache is None:
+                generate(filenames)
+            else:
+                cached = cache.produce_all(kind, params, filenames, generate)
+        elif kind == 'kicad-symbol':
+            for filename in filenames:
+                asmr.kicad.Symbol(filename, **params).save()
+        error = None
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+    return {
+        'kind': kind,
+        'filenames': filenames,
+        'cached': cached,
+        'seconds': time.perf_counter() - start,
+        'error': error,
+    }
+
+
+def run(jobs, workers=None, cache=None, progress=None) -> list:
+    """ runs the jobs in a process pool, returns their results in job order.
+
+    a failing job does not stop the batch, its result holds the error.
+    progress is called with every result as soon as it is available.
+    """
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_job, (kind, params, filenames, cache)): i
+                   for i, (kind, params, filenames) in enumerate(jobs)}
+        results = [None]*len(futures)
+        for future in concurrent.futures.as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                # failures outside of run_job: pickling the job or its result, a crashed worker.
+                kind, _, filenames = jobs[i]
+                results[i] = {
+                    'kind': kind,
+                    'filenames': filenames,
+                    'cached': [],
+                    'seconds': 0.0,
+                    'error': f'{type(e).__name__}: {e}',
+                }
+            if progress is not None:
+                progress(results[i])
+    return results
@@ -0,0 +1,141 @@
+""" Standardized workloads for benchmarking the design generators.
+
+Every workload runs in a fresh process so that its peak RSS is not
+polluted by earlier workloads (or the imports of the caller).
+"""
+
+import concurrent.futures
+import os
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+
+import asmr
+from .capacitive_grid import CapacitiveGridGenerator, GridPattern
+from .eurorack import EurorackPanel
+
+
+GRID_SIZES   = (8, 16, 32, 64, 128)
+GRID_FORMATS = ('0.6,#|0.6,#', '1.0|1.0', '0.9,/|0.9,\\')
+GRID_OUTPUTS = ('svg', 'kicad_mod')
+PANEL_HPS    = (8, 42, 84)
+
+
+def workloads(sizes=GRID_SIZES) -> list:
+    """ returns the standard workloads as (name, params) pairs. """
+    jobs = []
+    for size in sizes:
+        for ext in GRID_OUTPUTS:
+            # the interleaved pattern does not use the fill format.
+            jobs.append((f'interleaved-{size}x{size}.{ext}', {
+                'kind': 'touch-grid',
+                'pattern': GridPattern.Interleaved.value,
+                'size': (size, size),
+                'fmt': GRID_FORMATS[0],
+                'ext': ext,
+            }))
+            for i, fmt in enumerate(GRID_FORMATS):
+                jobs.append((f'diamond-{size}x{size}-fmt{i}.{ext}', {
+                    'kind': 'touch-grid',
+                    'pattern': GridPattern.Diamond.value,
+                    'size': (size, size),
+                    'fmt': fmt,
+                    'ext': ext,
+                }))
+    for hp in PANEL_HPS:
+        jobs.append((f'eurorack-{hp}hp.svg', {'kind': 'eurorack-panel', 'hp': hp, 'hu': 3}))
+    return jobs
+
+
+def peak_rss():
+    """ peak resident set size of the current process in bytes (None if unsupported). """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macos bytes.
+    return rss if sys.platform == 'darwin' else rss*1024
+
+
+def run_workload(job) -> dict:
+    """ runs a single workload in the current process and measures it. """
+    name, params, directory = job
+    filename = str(pathlib.Path(directory)/name)
+
+    start = time.perf_counter()
+    if params['kind'] == 'touch-grid':
+        generator = CapacitiveGridGenerator(size=params['size'],
+                                            pitch=6.0,
+                                            xwidth=0.5,
+                                            ywidth=0.5,
+                                            separation=0.3,
+                                            fmt=params['fmt'])
+        grid = generator.new_grid(filename)
+        generator.build(GridPattern(params['pattern']), grid)
+        generated = time.perf_counter()
+        grid.save()
+        shapes = sum(len(layer) for layer in grid.layers.values())
+    elif params['kind'] == 'eurorack-panel':
+        panel = EurorackPanel(filename, params['hp'], params['hu'])
+        panel.render()
+        generated = time.perf_counter()
+        panel.save()
+        shapes = len(panel.outline)
+    saved = time.perf_counter()
+
+    size = os.path.getsize(filename)
+    os.remove(filename)
+    return {
+        'name': name,
+        'params': params,
+        'generate_seconds': generated - start,
+        'save_seconds': saved - generated,
+        'seconds': saved - start,
+        'peak_rss': peak_rss(),
+        'shapes': shapes,
+        'bytes': size,
+    }
+
+
+def run(jobs, repeat=1, progress=None) -> dict:
+    """ runs the workloads (each in a fresh process) and collects the results.
+
+    with repeat > 1 the fastest run of each workload is kept.
+    progress is called with every result as soon as it is available.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        # one process per run, so the peak RSS only covers that workload.
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as pool:
+            for name, params in jobs:
+                runs = [pool.submit(run_workload, (name, params, directory)).result() for _ in range(repeat)]
+                result = min(runs, key=lambda r: r['seconds'])
+                results.append(result)
+                if progress is not None:
+                    progress(result)
+    return {
+        'version': asmr.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(results: dict, baseline: dict) -> list:
+    """ pairs up the workloads of two result sets as (name, seconds ratio, peak rss ratio). """
+    before = {r['name']: r for r in baseline['results']}
+    changes = []
+    for result in results['results']:
+        if result['name'] not in before:
+            continue
+        old = before[result['name']]
+        rss = None
+        if result['peak_rss'] and old['peak_rss']:
+            rss = result['peak_rss'] / old['peak_rss']
+        changes.append((result['name'], result['seconds'] / old['seconds'], rss))
+    return changes
@@ -0,0 +1,117 @@
+""" Content-addressed cache of generated design artifacts. """
+
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+
+import asmr
+import asmr.fs
+
+
+DEFAULT_MAX_SIZE = 256*1024*1024 # bytes
+
+
+class ArtifactCache:
+    """ Size-bounded LRU cache of generated files keyed by their generator parameters.
+
+    Entries live under the asmr cache directory and are named after a hash
+    of the generator kind, its parameters, the output format and the
+    toolkit version. Reading an entry refreshes its modification time so
+    that the least recently used entries are evicted first.
+    """
+    def __init__(self, path: pathlib.Path=None, max_size=DEFAULT_MAX_SIZE):
+        self.path = asmr.fs.cache()/'design' if path is None else pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+
+    @staticmethod
+    def key(kind: str, params: dict, filename: str) -> str:
+        """ hash of everything which determines the contents of an artifact. """
+        ext = pathlib.Path(filename).suffix
+        payload = json.dumps({
+            'kind': kind,
+            'params': params,
+            'ext': ext,
+            # kicad files embed their own name, archives name their members after it.
+            'name': pathlib.Path(filename).stem if ext.startswith('.kicad') or ext == '.zip' else None,
+            'version': asmr.__version__,
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def entry(self, key: str) -> pathlib.Path:
+        return self.path/key
+
+    def fetch(self, key: str, filename: str) -> bool:
+        """ copies a cached artifact to filename, returns whether it was found. """
+        entry = self.entry(key)
+        try:
+            shutil.copyfile(entry, filename)
+            os.utime(entry)
+        except FileNotFoundError:
+            # never stored, or evicted by another process.
+            return False
+        return True
+
+    def store(self, key: str, filename: str):
+        """ adds a generated artifact to the cache and evicts old entries. """
+        # a temporary file per writer, processes may store the same key at once.
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(filename, tmp)
+            os.replace(tmp, self.entry(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.evict()
+
+    def produce(self, kind: str, params: dict, filename: str, generate) -> bool:
+        """ fetches the artifact from the cache or calls generate() and caches its output.
+
+        returns True if the artifact was served from the cache. outputs which
+        are written as several files (e.g. gerber layer sets) are not cached.
+        """
+        return len(self.produce_all(kind, params, [filename], lambda missing: generate())) > 0
+
+    def produce_all(self, kind: str, params: dict, filenames: list, generate) -> list:
+        """ like produce() for several outputs of a single generation.
+
+        generate(missing) is called once with the filenames which were not
+        found in the cache. returns the filenames served from the cache.
+        """
+        keys = {filename: self.key(kind, params, filename) for filename in filenames}
+        cached = [filename for filename in filenames if self.fetch(keys[filename], filename)]
+        missing = [filename for filename in filenames if filename not in cached]
+        if len(missing) == 0:
+            return cached
+        generate(missing)
+        for filename in missing:
+            if os.path.exists(filename):
+                self.store(keys[filename], filename)
+        return cached
+
+    def evict(self):
+        """ removes least recently used entries until the cache fits in max_size. """
+        entries = []
+        for entry in self.path.iterdir():
+            if entry.suffix == '.tmp':
+                continue
+            try:
+                entries.append((entry, entry.stat()))
+            except FileNotFoundError:
+                # evicted by another process meanwhile.
+                continue
+        entries.sort(key=lambda e: e[1].st_mtime)
+        total = sum(stat.st_size for _, stat in entries)
+        for entry, stat in entries:
+            if total <= self.max_size:
+                break
+            entry.unlink(missing_ok=True)
+            total -= stat.st_size
+
+    def clear(self):
+        for entry in self.path.iterdir():
+            entry.unlink(missing_ok=True)
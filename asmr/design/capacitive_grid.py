@@ -1,11 +1,18 @@
-import copy
+import concurrent.futures
+import itertools
+import math
+import os
+import pathlib
+import time
 from enum import Enum
 
-import svgwrite
-from svgwrite import mm
+import numpy as np
 
 import asmr.kicad
-from .gfx import Line, Rectangle, Diamond, SVG
+from . import gerber
+from .cache import ArtifactCache
+from .drc import check_grid
+from .gfx import Line, Rectangle, Diamond, CellArray, DXF, SVG, ShapeBuffer, ShapeView
 
 
 class GridPattern(Enum):
@@ -13,6 +20,21 @@ class GridPattern(Enum):
     Diamond     = 'diamond'
 
 
+# grid attributes each layer is generated from (besides the pattern), see
+# CapacitiveGrid.stale(). the solder mask is derived from the electrodes and
+# is rebuilt whenever they are.
+ELECTRODE_PARAMETERS = {
+    GridPattern.Interleaved: ('size', 'pitch', 'xwidth', 'ywidth', 'target_separation', 'margin', 'padding',
+                              'use_color', 'n_columns_per_pad', 'n_rows_per_pad', 'instancing'),
+    GridPattern.Diamond: ('size', 'pitch', 'xwidth', 'ywidth', 'target_separation', 'margin',
+                          'use_color', 'n_columns_per_pad', 'n_rows_per_pad', 'fmt_str'),
+}
+LAYER_PARAMETERS = {
+    'silkscreen': ('size', 'pitch', 'xwidth', 'ywidth', 'margin', 'silk_grid_scale_x', 'silk_grid_scale_y', 'use_color'),
+    'solder_mask': ('size', 'pitch', 'xwidth', 'margin', 'use_color', 'mask_electrode_x', 'mask_electrode_y'),
+}
+
+
 class CapacitiveGrid:
     def __init__(self,
                  filename: str,
@@ -28,7 +50,8 @@ class CapacitiveGrid:
                  n_rows_per_pad=1,     # each row pad is 2 rows
                  silk_scaling=(1, 1),
                  mask_electrodes=(False, True), # cover electrodes in solder mask
-                 fmt='1.0|1.0'):       # format string
+                 fmt='1.0|1.0',        # format string
+                 instancing=False):    # store repeated nodes as placed cells
         isExtensionless = len(filename.split('.')) < 2 # TODO check valid extensions
         self.ext = 'svg' if isExtensionless else filename.split('.')[-1]
         self.filename = f'{filename}.{fmt}' if isExtensionless else filename
@@ -37,6 +60,9 @@ class CapacitiveGrid:
         self.xwidth = xwidth
         self.ywidth = ywidth
         self.separation = separation
+        # the interleaved pattern rewrites separation with the gap its fingers
+        # actually get (plan.separation), which may be below the target.
+        self.target_separation = separation
         self.margin = margin
         self.padding = padding
         self.use_color = use_color
@@ -47,14 +73,18 @@ class CapacitiveGrid:
         self.mask_electrode_x = mask_electrodes[0]
         self.mask_electrode_y = mask_electrodes[1]
         self.fmt_str = fmt
+        self.instancing = instancing
         self.fmt = (
             {'fill': 6.0, 'pattern': '#'},
             {'fill': 6.0, 'pattern': '#'}
         )
+        self.drc = None
+        self.plan = None
+        self.built = {}   # layer -> parameters it was generated from
         self.layers = {
-            'electrodes': [],
-            'solder_mask': [],
-            'silkscreen': [],
+            'electrodes': ShapeBuffer(),
+            'solder_mask': ShapeBuffer(),
+            'silkscreen': ShapeBuffer(),
         }
 
         self.colors = {
@@ -68,33 +98,103 @@ class CapacitiveGrid:
     def parse_fmt(self):
         row_col = self.fmt_str.split('|')
         for i in range(len(row_col)):
-            float_pattern = row_col[i].split(',')
+            float_pattern = row_col[i].split(',', 1)
             self.fmt[i]['fill'] = float(float_pattern[0])
             if len(float_pattern) == 2:
                 self.fmt[i]['pattern'] = float_pattern[1]
 
-    def save(self):
-        if (self.ext == 'svg'):
-            self.save_svg()
-        elif self.ext == "kicad_mod":
-            self.save_kicad_footprint()
-
-    def save_svg(self):
-        svg = SVG(
-            self.filename,
-            [
-                *self.layers['electrodes'],
-                *self.layers['solder_mask'],
-                *self.layers['silkscreen'],
-            ])
-        svg.save()
-
-    def save_kicad_footprint(self):
-        footprint = asmr.kicad.Footprint(self.filename)
+    def parameters(self, pattern: GridPattern, layer: str) -> tuple:
+        """ the values a layer of the given pattern is generated from. """
+        names = ELECTRODE_PARAMETERS[pattern] if layer == 'electrodes' else LAYER_PARAMETERS[layer]
+        return (pattern,) + tuple(getattr(self, name) for name in names)
+
+    def stale(self, pattern: GridPattern) -> list:
+        """ the layers which have to be (re)generated for pattern, in build order. """
+        stale = [layer for layer in ('electrodes', 'silkscreen', 'solder_mask')
+                 if self.built.get(layer) != self.parameters(pattern, layer)]
+        if 'electrodes' in stale and 'solder_mask' not in stale:
+            stale.append('solder_mask')
+        return stale
+
+    def reuse(self, grid):
+        """ takes over the layers of a previously built grid.
+
+        a following build only regenerates the layers whose parameters
+        differ between both grids, the others are shared.
+        """
+        self.layers = dict(grid.layers)
+        self.built = dict(grid.built)
+        self.plan = grid.plan
+        self.separation = grid.separation
+
+    def save(self, filename=None):
+        """ saves the grid to filename (default: self.filename), the format follows its extension. """
+        filename = self.filename if filename is None else filename
+        ext = self.ext if filename == self.filename else pathlib.Path(filename).suffix[1:]
+        if (ext == 'svg'):
+            self.save_svg(filename)
+        elif ext == "kicad_mod":
+            self.save_kicad_footprint(filename)
+        elif ext in ('gbr', 'zip'):
+            self.save_gerber(filename)
+        elif ext == 'dxf':
+            self.save_dxf(filename)
+
+    def export(self, filenames, workers=None):
+        """ saves the grid to several files (of any format) concurrently.
+
+        the writers are pure python, so every file is written by its own
+        process (default: one per file, up to the cpu count) from a pickled
+        copy of the layers.
+        """
+        workers = min(len(filenames), os.cpu_count() or 1) if workers is None else workers
+        if len(filenames) == 1 or workers <= 1:
+            for filename in filenames:
+                self.save(filename)
+            return
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            # list() re-raises the first error of a writer.
+            list(pool.map(export_target, [(self, filename) for filename in filenames]))
+
+    def svg(self, filename=None) -> SVG:
+        """ the svg document of the grid. """
+        layers = [self.layers['electrodes'], self.layers['solder_mask'], self.layers['silkscreen']]
+        filename = self.filename if filename is None else filename
+        if any(isinstance(layer, CellArray) for layer in layers):
+            # cells are written as <defs>/<use>, the layers can't be merged into one buffer.
+            svg = SVG(filename)
+            for layer in layers:
+                svg.from_shapes(layer)
+            return svg
+        return SVG(filename, ShapeBuffer.concatenate(layers))
+
+    def save_svg(self, filename=None):
+        self.svg(filename).save()
+
+    def save_dxf(self, filename=None):
+        dxf = DXF(self.filename if filename is None else filename)
+        for layer in ('electrodes', 'solder_mask', 'silkscreen'):
+            dxf.from_shapes(self.layers[layer])
+        dxf.save()
+
+    def footprint(self, filename=None, merge=True):
+        footprint = asmr.kicad.Footprint(self.filename if filename is None else filename)
         footprint.pads_from_shapes(self.layers['electrodes'])
         footprint.mask_from_shapes(self.layers['solder_mask'])
         footprint.silkscreen_from_shapes(self.layers['silkscreen'])
-        footprint.save()
+        if merge:
+            footprint.merge_primitives()
+        return footprint
+
+    def save_kicad_footprint(self, filename=None):
+        self.footprint(filename).save()
+
+    def save_gerber(self, filename=None):
+        gerber.save(self.filename if filename is None else filename, {
+            'F_Cu': ('Copper,L1,Top', [self.layers['electrodes']]),
+            'F_Mask': ('Soldermask,Top', [self.layers['solder_mask']]),
+            'F_SilkS': ('Legend,Top', [self.layers['silkscreen']]),
+        })
 
 
 # TODO: incorporate grid x and y scale
@@ -158,20 +258,20 @@ def create_inverted_square_grid(grid: CapacitiveGrid, layer='solder_mask'):
                 group=layer,
             ))
 
-    for column in range(grid.size[0]):
-        for row in range(grid.size[1]):
-            x0 = column*grid.pitch + grid.margin + grid.xwidth
-            y0 = row*grid.pitch + grid.margin + grid.xwidth
-            grid.layers[layer].append(Rectangle(
-                x0,
-                y0,
-                x0+size,
-                y0+size,
-                width=grid.xwidth,
-                fill=True,
-                color=grid.colors[layer] if grid.use_color else '#000000',
-                group=layer,
-            ))
+    columns = np.arange(grid.size[0])[:, None]
+    rows = np.arange(grid.size[1])[None, :]
+    x0 = columns*grid.pitch + grid.margin + grid.xwidth + 0*rows
+    y0 = rows*grid.pitch + grid.margin + grid.xwidth + 0*columns
+    grid.layers[layer].add_rectangles(
+        x0,
+        y0,
+        x0+size,
+        y0+size,
+        width=grid.xwidth,
+        fill=True,
+        color=grid.colors[layer] if grid.use_color else '#000000',
+        group=layer,
+    )
 
 def create_square_grid(grid: CapacitiveGrid, layer='silkscreen'):
     x_scale = grid.silk_grid_scale_x
@@ -205,216 +305,299 @@ def create_square_grid(grid: CapacitiveGrid, layer='silkscreen'):
             group=layer,
         ))
 
-def create_interleaved_grid(grid: CapacitiveGrid, layer='electrodes'):
-    # calculate space between x-y electrodes from target separation
-    ydigits_per_node = 0
-    remaining_space = grid.pitch - grid.xwidth - 2*grid.padding
-    while remaining_space > (2*ydigits_per_node*grid.separation):
-        ydigits_per_node += 1
-        remaining_space = (grid.pitch - 2*grid.padding) - ydigits_per_node*((grid.xwidth + grid.ywidth)/2)
-    ydigits_per_node -= 1
-    remaining_space = (grid.pitch - 2*grid.padding) - ydigits_per_node*(grid.xwidth + grid.ywidth)
-    grid.separation = remaining_space / (2*ydigits_per_node)
-    # n_xdigits = (ydigits_per_node * grid.size[1]) + 1
-    xdigits_per_node = ydigits_per_node + 1
-    dy_xdigits = grid.separation*2 + grid.ywidth + grid.xwidth
+class GridLayoutPlan:
+    """ Geometry of one node of an interleaved grid, computed once per grid.
+
+    The templates are (k, 4) arrays of line rows (x0, y0, x1, y1) relative
+    to the node origin (column*pitch, row*pitch), margin included. The
+    generator tiles them across all nodes by translation.
+
+    separation is the gap the fingers actually get, which may be smaller
+    than the separation the grid asked for (see finger_count).
+    """
+    def __init__(self, grid: CapacitiveGrid):
+        pitch, padding, margin = grid.pitch, grid.padding, grid.margin
+        xwidth, ywidth = grid.xwidth, grid.ywidth
+
+        # the fingers are spread out evenly, which sets the actual separation.
+        self.ydigits = GridLayoutPlan.finger_count(pitch, xwidth, ywidth, grid.separation, padding)
+        self.xdigits = self.ydigits + 1
+        remaining_space = (pitch - 2*padding) - self.ydigits*(xwidth + ywidth)
+        separation = self.separation = remaining_space / (2*self.ydigits)
+        self.dy_xdigits = separation*2 + ywidth + xwidth
+        self.x_offset = ywidth/2
+        self.y_offset = xwidth/2
+        self.x_length = (pitch - 2*padding) - ywidth - 2*separation - xwidth
+        self.ylength = pitch - xwidth - ywidth - separation*2 - 2*padding
+        self.button_width = pitch - 2*padding
+        self.digit_length = (pitch + 2*padding)/2 - xwidth/2 - separation - ywidth/2 - 2*padding
+
+        # X electrode: the digits of a node (the column line spans the whole grid).
+        xcenter = pitch/2 + self.x_offset + margin
+        digit_y = padding + np.arange(self.xdigits)*self.dy_xdigits + self.y_offset + margin
+        self.x_template = np.column_stack([
+            np.full(self.xdigits, xcenter - self.x_length/2), digit_y,
+            np.full(self.xdigits, xcenter + self.x_length/2), digit_y,
+        ])
+
+        # Y electrode: [left line, right line, fingers..., connector to the next node]
+        left = self.x_offset + padding + margin
+        right = left + self.button_width
+        top = xwidth + separation + self.y_offset + padding + margin
+        finger_y = top + np.repeat(np.arange(self.ydigits), 2)*(xwidth + 2*separation + ywidth)
+        # even fingers are on the left side of the electrode, odd on the right.
+        even = np.arange(2*self.ydigits) % 2 == 0
+        finger_x = np.where(even, left, right)
+        self.y_template = np.vstack([
+            [left, top, left, top + self.ylength],
+            [right, top, right, top + self.ylength],
+            np.column_stack([finger_x, finger_y, np.where(even, finger_x + self.digit_length, finger_x - self.digit_length), finger_y]),
+            [right, top + self.ylength/2, pitch + left, top + self.ylength/2],
+        ])
+
+    @staticmethod
+    def finger_count(pitch, xwidth, ywidth, separation, padding) -> int:
+        """ the number of Y fingers per node, by the rule of the original generator.
+
+        n fingers fit while n*((xwidth + ywidth)/2 + 2*separation) < pitch - 2*padding.
+        only half of the trace widths are budgeted, so the fingers spread
+        out evenly (see GridLayoutPlan.separation) usually end up closer
+        than the given separation: it is a target, not a minimum.
+        """
+        space = pitch - 2*padding
+        half = (xwidth + ywidth)/2
+        fits = lambda n: space - n*half > 2*n*separation
+        if pitch - xwidth - 2*padding <= 0 or not fits(1):
+            raise ValueError(f'no room for interleaved fingers at pitch {pitch} (separation {separation})')
+        n = max(1, math.floor(space / (half + 2*separation)))
+        # settle rounding at the boundary with the exact condition.
+        while n > 1 and not fits(n):
+            n -= 1
+        while fits(n + 1):
+            n += 1
+        return n
+
+    @staticmethod
+    def tile(template, rows, columns, pitch):
+        """ translates a template to every node, returns x0, y0, x1, y1 arrays of shape (rows, columns, k). """
+        ox = (columns*pitch)[None, :, None]
+        oy = (rows*pitch)[:, None, None]
+        return np.broadcast_arrays(ox + template[:, 0], oy + template[:, 1], ox + template[:, 2], oy + template[:, 3])
 
-    x_offset = grid.ywidth/2
-    y_offset = grid.xwidth/2
 
-    for column in range(grid.size[0]):
-        group = f'pad={int(grid.size[1]/grid.n_rows_per_pad) + int((column-(column%grid.n_columns_per_pad))/grid.n_columns_per_pad)+1}'
-
-        # create X columns
-        xcenter = column*grid.pitch + grid.pitch/2 + x_offset
-        ylength = grid.pitch * grid.size[1]
-        grid.layers[layer].append(Line(
-            xcenter + grid.margin,
-            y_offset + grid.margin,
-            xcenter + grid.margin,
-            ylength + y_offset + grid.margin,
-            width=grid.xwidth,
-            color=grid.colors['x'] if grid.use_color else '#000000',
-            group=group,
-        ))
-
-        # iterate over columnar buttons
-        for node in range(grid.size[1]):
-            # the minimum columnar digits (surrounding each node)
-            min_x_digits = grid.size[1] + 1
-            node_y_offset = node * grid.pitch + grid.padding
-            x_length = (grid.pitch - 2*grid.padding) - grid.ywidth - (2*grid.separation) - grid.xwidth
-            for digit in range(xdigits_per_node):
-                x_start = xcenter - (x_length/2)
-                x_end   = xcenter + (x_length/2)
-                y = node_y_offset + digit * dy_xdigits + y_offset
-                grid.layers[layer].append(Line(
-                    x_start + grid.margin,
-                    y + grid.margin,
-                    x_end + grid.margin,
-                    y + grid.margin,
-                    width=grid.xwidth,
-                    color=grid.colors['x'] if grid.use_color else '#000000',
-                    linecap='round',
-                    group=group,
-                ))
-
-    # create row electrode patterns
-    for row in range(grid.size[1]):
-        group = f'pad={int((row-(row%grid.n_rows_per_pad))/grid.n_rows_per_pad) + 1}'
-
-        y_start = row*grid.pitch + grid.xwidth + grid.separation + y_offset + grid.padding
-        ylength = grid.pitch - grid.xwidth - grid.ywidth - grid.separation*2 - 2*grid.padding
-        for column in range(grid.size[0]):
-            xcenter = column*grid.pitch + x_offset + grid.padding
-
-            # column line
-            grid.layers[layer].append(Line(
-                xcenter + grid.margin,
-                y_start + grid.margin,
-                xcenter + grid.margin,
-                y_start+ylength + grid.margin,
-                width=grid.ywidth,
-                color=grid.colors['y'] if grid.use_color else '#000000',
-                group=group,
-            ))
-            button_width = grid.pitch - 2*grid.padding
-            grid.layers[layer].append(Line(
-                xcenter + grid.margin + button_width,
-                y_start + grid.margin,
-                xcenter + grid.margin + button_width,
-                y_start+ylength + grid.margin,
-                width=grid.ywidth,
-                color=grid.colors['y'] if grid.use_color else '#000000',
-                group=group,
-            ))
-
-
-            # fingers
-            for digit in range(ydigits_per_node):
-                digit_y = y_start + digit*(grid.xwidth + 2*grid.separation + grid.ywidth)
-                digit_length = None
-                digit_x_start = None
-                for side in range(2):
-                    if side == 0:
-                        # when side = 0, its the left side of the electrode
-                        digit_x_start = xcenter
-                        digit_length  = (grid.pitch + 2*grid.padding)/2 - grid.xwidth/2 - grid.separation - grid.ywidth/2 - 2*grid.padding
-                    elif side == 1:
-                        # when side = 1, its the right hand side of the electrode
-                        digit_x_start = xcenter + button_width
-                        digit_length  = -((grid.pitch + 2*grid.padding)/2 - grid.xwidth/2 - grid.separation - grid.ywidth/2 - 2*grid.padding)
-
-                    grid.layers[layer].append(Line(
-                        digit_x_start + grid.margin,
-                        digit_y + grid.margin,
-                        digit_x_start + digit_length + grid.margin,
-                        digit_y + grid.margin,
-                        width=grid.ywidth,
-                        color=grid.colors['y'] if grid.use_color else '#000000', #'#00FF00' if side == 0 else '#FFFF00',
-                        linecap='round',
-                        group=group,
-                    ))
-
-            # this button column is not on the end: draw a line connecting to the next electrode in the row
-            if column < (grid.size[0] - 1):
-                grid.layers[layer].append(Line(
-                    xcenter + grid.margin + button_width,
-                    y_start + grid.margin + ylength/2,
-                    (column+1)*grid.pitch + x_offset + grid.padding,
-                    y_start + grid.margin + ylength/2,
-                    width=grid.ywidth,
-                    color=grid.colors['y'] if grid.use_color else '#000000', #'#00FF00' if side == 0 else '#FFFF00',
-                    linecap='round',
-                    group=group,
-                ))
+def create_interleaved_grid(grid: CapacitiveGrid, layer='electrodes'):
+    plan = grid.plan = GridLayoutPlan(grid)
+    grid.separation = plan.separation
+    if grid.instancing:
+        create_interleaved_cells(grid, plan, layer)
+        return
 
+    ncolumns, nrows = grid.size
+    columns = np.arange(ncolumns)
+    rows = np.arange(nrows)
+    x_color = grid.colors['x'] if grid.use_color else '#000000'
+    y_color = grid.colors['y'] if grid.use_color else '#000000'
+
+    electrodes = grid.layers[layer]
+
+    # create X columns, each block row is [column line, node digits...]
+    x_groups = np.array([
+        f'pad={int(nrows/grid.n_rows_per_pad) + int((column-(column%grid.n_columns_per_pad))/grid.n_columns_per_pad)+1}'
+        for column in range(ncolumns)
+    ], dtype=object)
+    xcenter = columns*grid.pitch + grid.pitch/2 + plan.x_offset + grid.margin
+    dx0, dy0, dx1, dy1 = (np.swapaxes(v, 0, 1).reshape(ncolumns, -1)
+                          for v in GridLayoutPlan.tile(plan.x_template, rows, columns, grid.pitch))
+    x0 = np.column_stack([xcenter, dx0])
+    y0 = np.column_stack([np.full(ncolumns, plan.y_offset + grid.margin), dy0])
+    x1 = np.column_stack([xcenter, dx1])
+    y1 = np.column_stack([np.full(ncolumns, grid.pitch*nrows + plan.y_offset + grid.margin), dy1])
+    linecap = np.full(x0.shape, 'round', dtype=object)
+    linecap[:, 0] = 'butt'
+    electrodes.add_lines(
+        x0, y0, x1, y1,
+        width=grid.xwidth,
+        color=x_color,
+        linecap=linecap,
+        group=x_groups[:, None],
+    )
+
+    # create row electrode patterns, each block row is
+    # [left line, right line, fingers..., connector to next node]
+    y_groups = np.array([
+        f'pad={int((row-(row%grid.n_rows_per_pad))/grid.n_rows_per_pad) + 1}'
+        for row in range(nrows)
+    ], dtype=object)
+    x0, y0, x1, y1 = GridLayoutPlan.tile(plan.y_template, rows, columns, grid.pitch)
+    linecap = np.full(x0.shape, 'round', dtype=object)
+    linecap[..., 0:2] = 'butt'
+    # the last button column has no connector to a next electrode in the row.
+    valid = np.ones(x0.shape, dtype=bool)
+    valid[:, -1, -1] = False
+    electrodes.add_lines(
+        x0, y0, x1, y1,
+        width=grid.ywidth,
+        color=y_color,
+        linecap=linecap,
+        group=y_groups[:, None, None],
+        valid=valid,
+    )
 
 
 def create_diamond_grid(grid: CapacitiveGrid, layer='electrodes'):
-    # Y electrodes
-    for column in range(grid.size[0] + 1):
-        for row in range(grid.size[1]):
-            #group = f'pad={row + 1}'
-            group = f'pad={int((row-(row%grid.n_rows_per_pad))/grid.n_rows_per_pad) + 1}'
-            cutoff = 'none'
-            if column == 0:
-                cutoff = 'left'
-            elif column == grid.size[0]:
-                cutoff = 'right'
-            xpadding = grid.margin
-            ypadding = grid.margin + grid.separation + grid.xwidth/2
-            diamond = Diamond(
-                grid.pitch*column + xpadding,
-                grid.pitch*row + ypadding,
-                grid.pitch - 2*grid.separation,
-                color=grid.colors['x'] if grid.use_color else '#000000',
-                fill = grid.fmt[0]['fill'],
-                stroke_width = grid.xwidth,
-                group=group,
-                pattern=grid.fmt[0]['pattern'],
-                cutoff = cutoff,
-            )
-            grid.layers[layer].append(diamond)
-            if column < grid.size[0]:
-                # add horizontal connector line
-                grid.layers[layer].append(Line(
-                    diamond.x1,
-                    diamond.y1,
-                    diamond.x1 + grid.separation*2 + grid.xwidth,
-                    diamond.y1,
-                    width=min(grid.separation/2, grid.xwidth),
-                    color=grid.colors['x'] if grid.use_color else '#000000',
-                    linecap='round',
-                    group=group,
-                ))
+    ncolumns, nrows = grid.size
+    xpadding = grid.margin
+    ypadding = grid.margin + grid.separation + grid.xwidth/2
+    diagonal = grid.pitch - 2*grid.separation
+    x_color = grid.colors['x'] if grid.use_color else '#000000'
+    y_color = grid.colors['y'] if grid.use_color else '#000000'
+    y_groups = np.array([
+        f'pad={int((row-(row%grid.n_rows_per_pad))/grid.n_rows_per_pad) + 1}'
+        for row in range(nrows)
+    ], dtype=object)
+    x_groups = np.array([
+        f'pad={int(nrows/grid.n_rows_per_pad) + int((column-(column%grid.n_columns_per_pad))/grid.n_columns_per_pad)+1}'
+        for column in range(ncolumns)
+    ], dtype=object)
+
+    electrodes = ShapeBuffer()
+
+    # Y electrodes, each followed by a horizontal connector line
+    columns = np.arange(ncolumns + 1)[:, None]
+    rows = np.arange(nrows)[None, :]
+    x = grid.pitch*columns + xpadding + 0*rows
+    y = grid.pitch*rows + ypadding + 0*columns
+    cutoff = np.full(x.shape, 'none', dtype=object)
+    cutoff[0, :] = 'left'
+    cutoff[-1, :] = 'right'
+    electrodes.add_diamonds(
+        x,
+        y,
+        diagonal,
+        color=x_color,
+        fill=grid.fmt[0]['fill'],
+        stroke_width=grid.xwidth,
+        group=y_groups[None, :],
+        pattern=grid.fmt[0]['pattern'],
+        cutoff=cutoff,
+    )
+    # connectors start at the right vertex (x1, y1) of the diamonds.
+    h = grid.xwidth/2
+    half_diagonal = (diagonal - 2*h)/2
+    x_right = ((x + h) + half_diagonal)[:-1]
+    y_right = ((y + h) + half_diagonal)[:-1]
+    electrodes.add_lines(
+        x_right,
+        y_right,
+        x_right + grid.separation*2 + grid.xwidth,
+        y_right,
+        width=min(grid.separation/2, grid.xwidth),
+        color=x_color,
+        linecap='round',
+        group=y_groups[None, :],
+    )
+    n_diamonds = x.size
+    n_connectors = x_right.size
+    order = np.argsort(np.concatenate([2*np.arange(n_diamonds), 2*np.arange(n_connectors) + 1]), kind='stable')
+    electrodes = electrodes.take(order)
+
     # X electrodes
-    for column in range(grid.size[0]):
-        for row in range(grid.size[1] + 1):
-            #group = f'pad={grid.size[1] + column + 1}'
-            group = f'pad={int(grid.size[1]/grid.n_rows_per_pad) + int((column-(column%grid.n_columns_per_pad))/grid.n_columns_per_pad)+1}'
-
-            cutoff = 'none'
-            if row == 0:
-                cutoff = 'top'
-            elif row == grid.size[1]:
-                cutoff = 'bottom'
-            xpadding = grid.margin
-            ypadding = grid.margin + grid.separation + grid.xwidth/2
-            grid.layers[layer].append(Diamond(
-                grid.pitch*column + grid.pitch/2 + xpadding,
-                grid.pitch*row - grid.pitch/2 + ypadding,
-                grid.pitch - 2*grid.separation,
-                color=grid.colors['y'] if grid.use_color else '#000000',
-                fill = grid.fmt[1]['fill'],
-                stroke_width = grid.xwidth,
-                group=group,
-                pattern=grid.fmt[1]['pattern'],
-                cutoff = cutoff,
-            ))
+    columns = np.arange(ncolumns)[:, None]
+    rows = np.arange(nrows + 1)[None, :]
+    x = grid.pitch*columns + grid.pitch/2 + xpadding + 0*rows
+    y = grid.pitch*rows - grid.pitch/2 + ypadding + 0*columns
+    cutoff = np.full(x.shape, 'none', dtype=object)
+    cutoff[:, 0] = 'top'
+    cutoff[:, -1] = 'bottom'
+    electrodes.add_diamonds(
+        x,
+        y,
+        diagonal,
+        color=y_color,
+        fill=grid.fmt[1]['fill'],
+        stroke_width=grid.xwidth,
+        group=x_groups[:, None],
+        pattern=grid.fmt[1]['pattern'],
+        cutoff=cutoff,
+    )
+
+    grid.layers[layer].extend(electrodes)
+
 
 def generate_solder_mask(grid: CapacitiveGrid):
     if not grid.mask_electrode_x and not grid.mask_electrode_y:
         create_inverted_square_grid(grid)
         return
 
-    if grid.mask_electrode_y and not grid.mask_electrode_x:
-        for electrode in grid.layers['electrodes']:
-            n = int(electrode.group.split('=')[1])
-            if n > grid.size[1]:
-                e = copy.deepcopy(electrode)
-                e.group = 'solder_mask'
-                e.color= grid.colors['solder_mask']
-                grid.layers['solder_mask'].append(e)
-    if grid.mask_electrode_x and not grid.mask_electrode_y:
-        for electrode in grid.layers['electrodes']:
-            n = int(electrode.group.split('=')[1])
-            if n <= grid.size[1]:
-                e = copy.deepcopy(electrode)
-                e.group = 'solder_mask'
-                e.color= grid.colors['solder_mask']
-                grid.layers['solder_mask'].append(e)
+    electrodes = grid.layers['electrodes']
+    if isinstance(electrodes, CellArray):
+        # every placement array belongs to one kind of electrode.
+        is_x = [groups is not None and all(int(electrodes.groups[g].split('=')[1]) > grid.size[1] for g in set(groups.tolist()))
+                for _, _, _, groups in electrodes.placements]
+        keep = [i for i, x in enumerate(is_x) if x == (grid.mask_electrode_y and not grid.mask_electrode_x)]
+        if grid.mask_electrode_x != grid.mask_electrode_y:
+            grid.layers['solder_mask'] = electrodes.view(keep, color=grid.colors['solder_mask'], group='solder_mask')
+        return
+
+    is_x_electrode = np.array([
+        group is not None and int(group.split('=')[1]) > grid.size[1]
+        for group in electrodes.groups
+    ])[electrodes.data['group']]
 
+    if grid.mask_electrode_y and not grid.mask_electrode_x:
+        masked = np.flatnonzero(is_x_electrode)
+    elif grid.mask_electrode_x and not grid.mask_electrode_y:
+        masked = np.flatnonzero(~is_x_electrode)
+    else:
+        return
+    # the mask openings are exactly the electrode shapes, so the mask layer
+    # only references them instead of holding a restyled copy.
+    grid.layers['solder_mask'] = ShapeView(electrodes,
+                                           masked,
+                                           color=grid.colors['solder_mask'],
+                                           group='solder_mask')
+
+
+
+def create_interleaved_cells(grid: CapacitiveGrid, plan: GridLayoutPlan, layer='electrodes'):
+    """ interleaved electrodes as cells: the node templates of a plan placed at every node. """
+    ncolumns, nrows = grid.size
+    columns = np.arange(ncolumns)
+    rows = np.arange(nrows)
+    x_color = grid.colors['x'] if grid.use_color else '#000000'
+    y_color = grid.colors['y'] if grid.use_color else '#000000'
+    x_groups = [
+        f'pad={int(nrows/grid.n_rows_per_pad) + int((column-(column%grid.n_columns_per_pad))/grid.n_columns_per_pad)+1}'
+        for column in range(ncolumns)
+    ]
+    y_groups = [
+        f'pad={int((row-(row%grid.n_rows_per_pad))/grid.n_rows_per_pad) + 1}'
+        for row in range(nrows)
+    ]
+    dx, dy = np.meshgrid(columns*grid.pitch, rows*grid.pitch)
+    column_of = np.broadcast_to(np.array(x_groups, dtype=object), dx.shape)
+    row_of = np.broadcast_to(np.array(y_groups, dtype=object)[:, None], dx.shape)
+
+    def cell(template, width, color, linecaps):
+        shapes = ShapeBuffer()
+        shapes.add_lines(*template.T, width=width, color=color, linecap=np.array(linecaps, dtype=object))
+        return cells.add_cell(shapes)
+
+    cells = CellArray()
+    xcenter = grid.pitch/2 + plan.x_offset + grid.margin
+    column_line = cell(np.array([[xcenter, plan.y_offset + grid.margin,
+                                  xcenter, grid.pitch*nrows + plan.y_offset + grid.margin]]),
+                       grid.xwidth, x_color, ['butt'])
+    x_digits = cell(plan.x_template, grid.xwidth, x_color, ['round']*len(plan.x_template))
+    y_node = cell(plan.y_template[:-1], grid.ywidth, y_color, ['butt']*2 + ['round']*(len(plan.y_template) - 3))
+    connector = cell(plan.y_template[-1:], grid.ywidth, y_color, ['round'])
+
+    cells.place(column_line, columns*grid.pitch, 0, group=np.array(x_groups, dtype=object))
+    cells.place(x_digits, dx, dy, group=column_of)
+    cells.place(y_node, dx, dy, group=row_of)
+    # the last button column has no connector to a next electrode in the row.
+    cells.place(connector, dx[:, :-1], dy[:, :-1], group=row_of[:, :-1])
+    grid.layers[layer] = cells
 
 
 class CapacitiveGridGenerator:
@@ -428,7 +611,8 @@ class CapacitiveGridGenerator:
                  resolution=(1, 1),
                  silk_scaling=(1, 1),
                  use_color=False,
-                 fmt='1.0|1.0'):
+                 fmt='1.0|1.0',
+                 instancing=False):
         self.size = (1, 1) if size is None else size
         self.pitch = 5.0 if pitch is None else pitch
         self.xwidth = 0.5 if xwidth is None else xwidth
@@ -439,9 +623,11 @@ class CapacitiveGridGenerator:
         self.silk_scaling = (1, 1) if silk_scaling is None else silk_scaling
         self.use_color = False if use_color is None else use_color
         self.fmt = '1.0|1.0' if fmt is None else fmt
+        self.instancing = instancing
 
-    def create(self, pattern: GridPattern, filename: str) -> CapacitiveGrid:
-        grid = CapacitiveGrid(filename,
+    def new_grid(self, filename: str) -> CapacitiveGrid:
+        """ creates an empty grid with the parameters of this generator. """
+        return CapacitiveGrid(filename,
                               size = self.size,
                               pitch = self.pitch,
                               xwidth = self.xwidth,
@@ -452,14 +638,107 @@ class CapacitiveGridGenerator:
                               n_rows_per_pad=self.resolution[1],
                               silk_scaling=self.silk_scaling,
                               use_color = self.use_color,
-                              fmt=self.fmt)
-        if pattern is GridPattern.Interleaved:
-            create_interleaved_grid(grid)
+                              fmt=self.fmt,
+                              instancing=self.instancing)
+
+    def build(self, pattern: GridPattern, grid: CapacitiveGrid) -> list:
+        """ generates the layers of the grid without saving it.
+
+        only the layers whose parameters changed since they were built (see
+        CapacitiveGrid.reuse) are generated, returns their names.
+        """
+        stale = grid.stale(pattern)
+        for layer in stale:
+            grid.layers[layer] = ShapeBuffer()
+        if 'electrodes' in stale:
+            # the interleaved pattern rewrites the separation of its grid.
+            grid.separation = grid.target_separation
+            grid.plan = None
+            if pattern is GridPattern.Interleaved:
+                create_interleaved_grid(grid)
+            elif pattern is GridPattern.Diamond:
+                create_diamond_grid(grid)
+        if 'silkscreen' in stale:
             create_square_grid(grid)
+        if 'solder_mask' in stale:
             generate_solder_mask(grid)
-        elif pattern is GridPattern.Diamond:
-            create_diamond_grid(grid)
-            create_square_grid(grid)
-            generate_solder_mask(grid)
-
-        grid.save()
+        for layer in stale:
+            grid.built[layer] = grid.parameters(pattern, layer)
+        return stale
+
+    def create(self, pattern: GridPattern, filename, cache: ArtifactCache=None, drc=False, workers=None) -> CapacitiveGrid:
+        """ generates the grid and saves it to filename.
+
+        filename may also be a list of output files (e.g. ['grid.svg',
+        'grid.kicad_mod']): the grid is generated once and exported to all
+        of them concurrently (see CapacitiveGrid.export).
+        when a cache is given and an identical grid was generated before,
+        the cached file is copied to filename and None is returned (only
+        when every output was cached).
+        with drc, the design rule report of the electrodes is stored in
+        grid.drc: the grid is always generated then (the cache is bypassed,
+        the report is not stored with the outputs).
+        """
+        filenames = [filename] if isinstance(filename, (str, pathlib.Path)) else list(filename)
+        grid = self.new_grid(str(filenames[0]))
+        filenames = [grid.filename] + [str(f) for f in filenames[1:]]
+
+        def generate(missing):
+            self.build(pattern, grid)
+            if drc:
+                grid.drc = check_grid(grid)
+            grid.export(missing, workers)
+
+        if cache is None or drc:
+            generate(filenames)
+        elif len(cache.produce_all('touch-grid', {**vars(self), 'pattern': pattern.value}, filenames, generate)) == len(filenames):
+            return None
+        return grid
+
+    def sweep(self,
+              pattern: GridPattern,
+              params: dict,
+              filename: str,
+              workers: int=None,
+              cache: ArtifactCache=None) -> list:
+        """ generates every combination of the swept parameters across a process pool.
+
+        params maps generator fields to lists of values, the remaining fields
+        are taken from this generator. filename is formatted with the swept
+        fields and the variant index 'i' (e.g. 'grid-{pitch}-{separation}.svg').
+        returns a result per variant with its filename, parameters, generation
+        time (s) and shape count (None when served from the cache).
+        """
+        names = list(params.keys())
+        variants = []
+        for i, values in enumerate(itertools.product(*params.values())):
+            variant = dict(zip(names, values))
+            variants.append((pattern, {**vars(self), **variant}, filename.format(i=i, **variant), cache))
+
+        filenames = [v[2] for v in variants]
+        if len(set(filenames)) != len(filenames):
+            raise ValueError(f"sweep filename '{filename}' must be unique per variant (use the swept fields or {{i}})")
+        for f in set(pathlib.Path(f).parent for f in filenames):
+            f.mkdir(parents=True, exist_ok=True)
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(create_variant, variants))
+
+
+def export_target(job):
+    """ export worker: saves a grid to one of its output files. """
+    grid, filename = job
+    grid.save(filename)
+
+
+def create_variant(variant) -> dict:
+    """ sweep worker: creates a single grid variant and measures it. """
+    pattern, params, filename, cache = variant
+    start = time.perf_counter()
+    grid = CapacitiveGridGenerator(**params).create(pattern, filename, cache=cache)
+    return {
+        'filename': filename,
+        'params': params,
+        'seconds': time.perf_counter() - start,
+        'shapes': None if grid is None else sum(len(layer) for layer in grid.layers.values()),
+    }
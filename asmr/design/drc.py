@@ -0,0 +1,291 @@
+""" Design rule checks for generated copper.
+
+The copper is reduced to stroked segments (a centerline and a radius)
+and filled outlines, each belonging to a net. Candidate pairs of
+segments are found through a uniform grid over their bounding boxes, so
+the checks run in near-linear time in the number of primitives.
+
+Lines are checked as if they had round caps, which is conservative for
+butt caps.
+"""
+
+import numpy as np
+
+from .gfx import ShapeKind, ShapeRecords, hatch_lines
+
+
+EPSILON = 1e-9
+MIN_WIDTH = 0.127 # mm, typical fab minimum trace width
+
+
+class DesignRules:
+    def __init__(self, min_separation, min_width=MIN_WIDTH):
+        self.min_separation = min_separation
+        self.min_width = min_width
+
+
+class Violation:
+    def __init__(self, rule, nets, value, limit, location):
+        self.rule = rule           # 'separation', 'overlap' or 'width'
+        self.nets = nets
+        self.value = value
+        self.limit = limit
+        self.location = location   # (x, y)
+
+    def __str__(self):
+        nets = ' / '.join(str(n) for n in self.nets)
+        return f'{self.rule}: {nets} {self.value:.4f} < {self.limit:.4f} at ({self.location[0]:.3f}, {self.location[1]:.3f})'
+
+
+class Report:
+    def __init__(self, rules, violations, min_separation, primitives, pairs):
+        self.rules = rules
+        self.violations = violations
+        self.min_separation = min_separation  # smallest clearance between different nets (None if unmeasured)
+        self.primitives = primitives
+        self.pairs = pairs                    # candidate segment pairs which were measured
+
+    def ok(self):
+        return len(self.violations) == 0
+
+
+class Copper:
+    """ DRC input: stroked segments and filled outlines, each primitive belonging to a net. """
+    def __init__(self):
+        self.nets = []
+        self.widths = []     # checked stroke width per primitive (nan: not a stroke)
+        self.outlines = []   # vertices of filled primitives (None for strokes)
+        self.segments = []   # chunks of (x0, y0, x1, y1, radius, primitive) rows
+
+    def add_strokes(self, x0, y0, x1, y1, width, nets):
+        """ adds lines (arrays) of the given widths and nets. """
+        n = len(nets)
+        first = len(self.nets)
+        self.nets += list(nets)
+        self.widths += list(np.broadcast_to(width, (n,)))
+        self.outlines += [None]*n
+        self.segments.append(np.column_stack([
+            *np.broadcast_arrays(x0, y0, x1, y1, np.asarray(width)/2, np.arange(first, first + n)),
+        ]).astype(float).reshape(n, 6))
+
+    def add_outline(self, xs, ys, width, net, stroke=False):
+        """ adds a filled polygon with an outline of the given stroke width. """
+        primitive = len(self.nets)
+        self.nets.append(net)
+        self.widths.append(width if stroke else np.nan)
+        self.outlines.append((np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)))
+        xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+        self.segments.append(np.column_stack([
+            xs, ys, np.roll(xs, -1), np.roll(ys, -1), np.full(len(xs), width/2), np.full(len(xs), primitive),
+        ]))
+
+    @staticmethod
+    def from_shapes(shapes: ShapeRecords):
+        """ copper of a shape buffer, its groups are the nets. """
+        copper = Copper()
+        data = shapes.data
+        nets = np.array(shapes.groups, dtype=object)[data['group']]
+        lines = data['kind'] == ShapeKind.Line
+        copper.add_strokes(data['x0'][lines], data['y0'][lines], data['x1'][lines], data['y1'][lines],
+                           data['width'][lines], nets[lines])
+        rects = np.flatnonzero(data['kind'] == ShapeKind.Rectangle)
+        for r in rects:
+            x0, y0, x1, y1 = (data[k][r] for k in ('x0', 'y0', 'x1', 'y1'))
+            width = 0 if data['fill'][r] else data['width'][r]
+            copper.add_outline([x0, x1, x1, x0], [y0, y0, y1, y1], width, nets[r])
+        diamonds = np.flatnonzero(data['kind'] == ShapeKind.Diamond)
+        xs, ys = ShapeRecords.diamond_vertices(data[diamonds])
+        for d, dx, dy in zip(diamonds, xs, ys):
+            # hatched diamonds are an outline plus hatch lines of the stroke width.
+            copper.add_outline(dx, dy, data['width'][d], nets[d], stroke=data['fill'][d] < 1)
+        owner, x0, y0, x1, y1 = hatch_lines(xs, ys, data['a'][diamonds], data['width'][diamonds], data['fill'][diamonds],
+                                            data['cutoff'][diamonds], data['pattern'][diamonds], shapes.patterns)
+        copper.add_strokes(x0, y0, x1, y1, data['width'][diamonds][owner], nets[diamonds][owner])
+        curves = np.flatnonzero(data['kind'] == ShapeKind.Curve)
+        for c, points in zip(curves, shapes.curve_points(data[curves])):
+            xs, ys = np.array(points).T
+            copper.add_strokes(xs[:-1], ys[:-1], xs[1:], ys[1:], data['width'][c], [nets[c]]*(len(points) - 1))
+        return copper
+
+    @staticmethod
+    def from_footprint(filename):
+        """ copper of the custom pads of a .kicad_mod file, its pads are the nets. """
+        import asmr.kicad
+        copper = Copper()
+        for pad, primitives in asmr.kicad.read_footprint_pads(filename).items():
+            lines = np.array(primitives['lines'], dtype=float).reshape(-1, 5)
+            copper.add_strokes(*lines.T, [pad]*len(lines))
+            for points, width, fill in primitives['polygons']:
+                xs, ys = zip(*points)
+                copper.add_outline(xs, ys, width, pad, stroke=fill != 'solid')
+        return copper
+
+
+def run_starts(keys):
+    """ mask of the first element of each run of equal values in a sorted array. """
+    starts = np.ones(len(keys), dtype=bool)
+    starts[1:] = keys[1:] != keys[:-1]
+    return starts
+
+
+def grid_pairs(xmin, ymin, xmax, ymax, cell):
+    """ candidate pairs (i < j) of boxes sharing a cell of a uniform grid of the given cell size. """
+    ix0 = np.floor(xmin / cell).astype(np.int64)
+    iy0 = np.floor(ymin / cell).astype(np.int64)
+    nx = np.floor(xmax / cell).astype(np.int64) - ix0 + 1
+    ny = np.floor(ymax / cell).astype(np.int64) - iy0 + 1
+    counts = nx*ny
+    item = np.repeat(np.arange(len(xmin)), counts)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cx = ix0[item] + k % nx[item]
+    cy = iy0[item] + k // nx[item]
+    keys = (cx - cx.min())*(cy.max() - cy.min() + 1) + (cy - cy.min()) if len(item) else cx
+    order = np.argsort(keys, kind='stable')
+    keys, item = keys[order], item[order]
+
+    pairs = []
+    for d in range(1, len(item)):
+        same = keys[d:] == keys[:-d]
+        if not same.any():
+            break
+        pairs.append(np.column_stack([item[:-d][same], item[d:][same]]))
+    if len(pairs) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    pairs = np.sort(np.concatenate(pairs), axis=1)
+    n = len(xmin)
+    keys = np.sort(pairs[:, 0]*n + pairs[:, 1])
+    keys = keys[run_starts(keys)]
+    return np.column_stack([keys // n, keys % n])
+
+
+def point_segment(px, py, x0, y0, x1, y1):
+    """ distance from points to segments and the closest points on the segments. """
+    dx, dy = x1 - x0, y1 - y0
+    length = dx*dx + dy*dy
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(length > 0, ((px - x0)*dx + (py - y0)*dy) / length, 0)
+    t = np.clip(t, 0, 1)
+    cx, cy = x0 + t*dx, y0 + t*dy
+    return np.hypot(px - cx, py - cy), cx, cy
+
+
+def segment_distance(a, b):
+    """ distance between the centerlines of segment rows a and b, and the midpoint of the closest approach. """
+    ax0, ay0, ax1, ay1 = a[:, 0], a[:, 1], a[:, 2], a[:, 3]
+    bx0, by0, bx1, by1 = b[:, 0], b[:, 1], b[:, 2], b[:, 3]
+    candidates = [
+        (*point_segment(ax0, ay0, bx0, by0, bx1, by1), ax0, ay0),
+        (*point_segment(ax1, ay1, bx0, by0, bx1, by1), ax1, ay1),
+        (*point_segment(bx0, by0, ax0, ay0, ax1, ay1), bx0, by0),
+        (*point_segment(bx1, by1, ax0, ay0, ax1, ay1), bx1, by1),
+    ]
+    distance, cx, cy, px, py = (np.stack(c) for c in zip(*candidates))
+    best = distance.argmin(axis=0)
+    rows = np.arange(len(a))
+    distance = distance[best, rows]
+    x = (cx[best, rows] + px[best, rows])/2
+    y = (cy[best, rows] + py[best, rows])/2
+
+    # properly crossing segments touch even though no endpoint does.
+    def orientation(x0, y0, x1, y1, px, py):
+        return np.sign((x1 - x0)*(py - y0) - (y1 - y0)*(px - x0))
+    crossing = ((orientation(ax0, ay0, ax1, ay1, bx0, by0) * orientation(ax0, ay0, ax1, ay1, bx1, by1) < 0) &
+                (orientation(bx0, by0, bx1, by1, ax0, ay0) * orientation(bx0, by0, bx1, by1, ax1, ay1) < 0))
+    distance[crossing] = 0
+    return distance, x, y
+
+
+def inside(px, py, xs, ys):
+    """ whether points lie within polygons (one polygon per point, vertices padded to a common count). """
+    result = np.zeros(len(px), dtype=bool)
+    for i in range(xs.shape[1]):
+        x0, y0 = xs[:, i], ys[:, i]
+        x1, y1 = xs[:, (i + 1) % xs.shape[1]], ys[:, (i + 1) % xs.shape[1]]
+        crosses = (y0 > py) != (y1 > py)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xcross = x0 + (py - y0)*(x1 - x0)/(y1 - y0)
+        result ^= crosses & (px < xcross)
+    return result
+
+
+def check(copper: Copper, rules: DesignRules) -> Report:
+    """ runs the width, separation and overlap checks over the copper. """
+    violations = []
+    segments = np.concatenate(copper.segments) if copper.segments else np.zeros((0, 6))
+
+    widths = np.array(copper.widths, dtype=float)
+    thin = np.flatnonzero(widths < rules.min_width - EPSILON)
+    # segments are stored in primitive order, locate each at its first segment.
+    s = segments[np.searchsorted(segments[:, 5], thin)]
+    for p, width, x, y in zip(thin.tolist(), widths[thin].tolist(), ((s[:, 0] + s[:, 2])/2).tolist(), ((s[:, 1] + s[:, 3])/2).tolist()):
+        violations.append(Violation('width', (copper.nets[p],), width, rules.min_width, (x, y)))
+
+    # boxes grown by the clearance so that close segments share a cell.
+    grow = segments[:, 4] + rules.min_separation/2
+    xmin = np.minimum(segments[:, 0], segments[:, 2]) - grow
+    ymin = np.minimum(segments[:, 1], segments[:, 3]) - grow
+    xmax = np.maximum(segments[:, 0], segments[:, 2]) + grow
+    ymax = np.maximum(segments[:, 1], segments[:, 3]) + grow
+    cell = max(float(np.median(np.maximum(xmax - xmin, ymax - ymin))) if len(segments) else 1.0, EPSILON)
+    pairs = grid_pairs(xmin, ymin, xmax, ymax, cell)
+    owner = segments[:, 5].astype(np.int64)
+    ids = {}
+    net_ids = np.array([ids.setdefault(net, len(ids)) for net in copper.nets], dtype=np.int64)
+    pairs = pairs[net_ids[owner[pairs[:, 0]]] != net_ids[owner[pairs[:, 1]]]]
+
+    a, b = segments[pairs[:, 0]], segments[pairs[:, 1]]
+    distance, x, y = segment_distance(a, b)
+    clearance = distance - a[:, 4] - b[:, 4]
+
+    # filled outlines containing a primitive of another net.
+    contained = np.zeros(len(pairs), dtype=bool)
+    outlines = [o for o in copper.outlines if o is not None]
+    if len(outlines) > 0 and len(pairs) > 0:
+        k = max(len(o[0]) for o in outlines)
+        xs = np.full((len(copper.outlines), k), np.nan)
+        ys = np.full((len(copper.outlines), k), np.nan)
+        filled = np.zeros(len(copper.outlines), dtype=bool)
+        for p, outline in enumerate(copper.outlines):
+            if outline is not None:
+                n = len(outline[0])
+                xs[p, :n], ys[p, :n] = outline
+                xs[p, n:], ys[p, n:] = outline[0][-1], outline[1][-1]
+                filled[p] = True
+        for this, other in ((a, b), (b, a)):
+            p = this[:, 5].astype(np.int64)
+            test = filled[p]
+            contained[test] |= inside(other[test, 0], other[test, 1], xs[p[test]], ys[p[test]])
+    clearance[contained] = np.minimum(clearance[contained], 0)
+
+    min_separation = float(clearance.min()) if len(clearance) else None
+
+    # one violation per pair of primitives, at their closest approach.
+    bad = np.flatnonzero(clearance < rules.min_separation - EPSILON)
+    bad = bad[np.argsort(clearance[bad], kind='stable')]
+    primitives = np.sort(np.column_stack([owner[pairs[bad, 0]], owner[pairs[bad, 1]]]), axis=1)
+    keys = primitives[:, 0]*len(copper.nets) + primitives[:, 1]
+    order = np.argsort(keys, kind='stable')
+    first = order[run_starts(keys[order])]
+    bad = bad[np.sort(first)]
+    overlap = (clearance[bad] < -EPSILON) | contained[bad]
+    for pa, pb, value, is_overlap, vx, vy in zip(owner[pairs[bad, 0]].tolist(),
+                                                 owner[pairs[bad, 1]].tolist(),
+                                                 clearance[bad].tolist(),
+                                                 overlap.tolist(),
+                                                 x[bad].tolist(),
+                                                 y[bad].tolist()):
+        rule = 'overlap' if is_overlap else 'separation'
+        violations.append(Violation(rule, (copper.nets[pa], copper.nets[pb]), value, rules.min_separation, (vx, vy)))
+
+    return Report(rules, violations, min_separation, len(copper.nets), len(pairs))
+
+
+def check_grid(grid, min_width=MIN_WIDTH) -> Report:
+    """ checks the electrodes of a capacitive grid against its separation.
+
+    interleaved grids are checked against the separation their fingers
+    actually get (grid.plan.separation), which may be below the target.
+    """
+    separation = grid.target_separation if grid.plan is None else grid.plan.separation
+    return check(Copper.from_shapes(grid.layers['electrodes']),
+                 DesignRules(separation, min_width=min_width))
@@ -1,7 +1,9 @@
-import svgwrite
-from svgwrite import mm
+import pathlib
 
-from .gfx import Rectangle, SVG
+import numpy as np
+
+from . import gerber
+from .gfx import DXF, Rectangle, SVG, ShapeBuffer, ShapeKind, ShapeView
 
 # panel hp/u are adjusted to take the case spacing into account.
 #
@@ -20,7 +22,7 @@ MOUNT_HOLE_Y_OFFSET = 3.0
 class EurorackPanel:
     def __init__(self, filename, hp, hu, ovals=True, pcb_zone=False):
         self.filename       = filename
-        self.outline        = []
+        self.outline        = ShapeBuffer()
         self.ovals          = ovals
         self.show_pcb_zone  = pcb_zone
         self.width          = hp * PANEL_MM_PER_HP
@@ -95,9 +97,27 @@ class EurorackPanel:
                 fill=False,
             ))
 
-    def save(self):
-        svg = SVG(
-            self.filename,
-            self.outline
-        )
-        svg.save()
+    def svg(self, filename=None) -> SVG:
+        """ the svg document of the panel. """
+        return SVG(self.filename if filename is None else filename, self.outline)
+
+    def save(self, filename=None):
+        filename = self.filename if filename is None else filename
+        suffix = pathlib.Path(filename).suffix
+        if suffix in ('.gbr', '.zip'):
+            self.save_gerber(filename)
+            return
+        if suffix == '.dxf':
+            DXF(filename, self.outline).save()
+            return
+        self.svg(filename).save()
+
+    def save_gerber(self, filename=None):
+        """ saves the panel outline as an Edge_Cuts layer and the mounting holes as a drill file. """
+        data = self.outline.data
+        holes = (data['kind'] == ShapeKind.Rectangle) & (data['a'] > 0)
+        # the pcb zone is only a guide and not part of the panel.
+        edges = ShapeView(self.outline, np.flatnonzero(~holes)[:1])
+        gerber.save(self.filename if filename is None else filename,
+                    {'Edge_Cuts': ('Profile,NP', [edges])},
+                    holes=gerber.holes_from_shapes(self.outline))
@@ -0,0 +1,221 @@
+""" Gerber (RS-274X) and Excellon export of gfx shapes.
+
+Layers are streamed straight from shape buffers: apertures are defined
+the first time a width is used and draws are written as they come.
+Coordinates are in mm with the y axis flipped (gfx y points down, gerber
+y points up). Lines are drawn with circular apertures, so their ends are
+always round, just like kicad pad primitives.
+"""
+
+import pathlib
+import zipfile
+import io
+
+import numpy as np
+
+import asmr
+from .gfx import ShapeKind, ShapeRecords
+
+
+# aperture used for strokes of zero width.
+HAIRLINE = 0.01
+
+
+def point(x, y):
+    """ formats a point in the 4.6 format (y flipped). """
+    return f'X{round(x*1e6)}Y{round(-y*1e6)}'
+
+
+def coordinates(x, y):
+    """ formats coordinate arrays in the 4.6 format (y flipped). """
+    xs = np.rint(np.asarray(x)*1e6).astype(np.int64).tolist()
+    ys = np.rint(-np.asarray(y)*1e6).astype(np.int64).tolist()
+    return [f'X{a}Y{b}' for a, b in zip(xs, ys)]
+
+
+class GerberWriter:
+    """ Streams one gerber X2 layer, all shapes are dark (added). """
+    def __init__(self, fd, function):
+        self.fd = fd
+        self.apertures = {}
+        self.aperture = None
+        self.position = None
+        fd.write(f'%TF.GenerationSoftware,asmr,toolkit,{asmr.__version__}*%\n'
+                 f'%TF.FileFunction,{function}*%\n'
+                 '%TF.FilePolarity,Positive*%\n'
+                 '%FSLAX46Y46*%\n'
+                 '%MOMM*%\n'
+                 '%LPD*%\n'
+                 'G75*\n'
+                 'G01*\n')
+
+    def select(self, diameter):
+        """ selects the circular aperture of the given diameter, defining it on first use. """
+        diameter = round(diameter, 6)
+        if diameter not in self.apertures:
+            code = 10 + len(self.apertures)
+            self.apertures[diameter] = code
+            self.fd.write(f'%ADD{code}C,{diameter:.6f}*%\n')
+        code = self.apertures[diameter]
+        if code != self.aperture:
+            self.fd.write(f'D{code}*\n')
+            self.aperture = code
+
+    def draw(self, start, end, width):
+        """ strokes a line between two formatted points, skipping the move when already there. """
+        # zero width would be an invalid aperture, draw those as hairlines.
+        self.select(width if width > 0 else HAIRLINE)
+        if start != self.position:
+            self.fd.write(f'{start}D02*\n')
+        self.fd.write(f'{end}D01*\n')
+        self.position = end
+
+    def polygon(self, points, width, fill):
+        """ a closed polygon of formatted points, filled as a region and/or stroked with the given width. """
+        if fill:
+            self.fd.write(f'G36*\n{points[0]}D02*\n')
+            self.fd.writelines(f'{p}D01*\n' for p in points[1:])
+            self.fd.write(f'{points[0]}D01*\nG37*\n')
+            self.position = points[0]
+        if width > 0:
+            for start, end in zip(points, points[1:] + points[:1]):
+                # cutoff diamonds have a collapsed (zero length) edge.
+                if start != end:
+                    self.draw(start, end, width)
+
+    def rect(self, x0, y0, x1, y1, width, fill, rx=0, ry=0):
+        """ a rectangle with rounded corners, as a region or a stroked outline. """
+        # gerber arcs are circular, elliptical corners use the smaller radius.
+        r = min(rx, ry, (x1 - x0)/2, (y1 - y0)/2)
+        if r <= 0:
+            self.polygon(coordinates([x0, x1, x1, x0], [y0, y0, y1, y1]), 0 if fill else width, fill)
+            return
+        # counter-clockwise in gerber coordinates (y up): an edge, then a corner arc.
+        path = [
+            ((x1 - r, y1), None),
+            ((x1, y1 - r), (0, r)),
+            ((x1, y0 + r), None),
+            ((x1 - r, y0), (-r, 0)),
+            ((x0 + r, y0), None),
+            ((x0, y0 + r), (0, -r)),
+            ((x0, y1 - r), None),
+            ((x0 + r, y1), (r, 0)),
+        ]
+        start = point(x0 + r, y1)
+        body = []
+        for (x, y), arc in path:
+            if arc is None:
+                body.append(f'{point(x, y)}D01*\n')
+            else:
+                i, j = round(arc[0]*1e6), round(arc[1]*1e6)
+                body.append(f'G03*\n{point(x, y)}I{i}J{j}D01*\nG01*\n')
+        if fill:
+            self.fd.write(f'G36*\n{start}D02*\n')
+            self.fd.writelines(body)
+            self.fd.write('G37*\n')
+        else:
+            self.select(width if width > 0 else HAIRLINE)
+            self.fd.write(f'{start}D02*\n')
+            self.fd.writelines(body)
+        self.position = start
+
+    def write_buffer(self, buffer: ShapeRecords):
+        """ writes the shapes of a buffer without materializing them. """
+        data = buffer.data
+        diamonds = data[data['kind'] == ShapeKind.Diamond]
+        xs, ys = ShapeRecords.diamond_vertices(diamonds)
+        vertices = iter(zip(xs.tolist(), ys.tolist()))
+        hatches = iter(buffer.hatch(diamonds))
+        curves = iter(buffer.curve_points(data[data['kind'] == ShapeKind.Curve]))
+        starts = coordinates(data['x0'], data['y0'])
+        ends = coordinates(data['x1'], data['y1'])
+        columns = [data[k].tolist() for k in ('kind', 'x0', 'y0', 'x1', 'y1', 'width', 'fill', 'a', 'b')]
+        for start, end, (kind, x0, y0, x1, y1, width, fill, a, b) in zip(starts, ends, zip(*columns)):
+            if kind == ShapeKind.Line:
+                self.draw(start, end, width)
+            elif kind == ShapeKind.Rectangle:
+                self.rect(x0, y0, x1, y1, width, fill >= 1, a, b)
+            elif kind == ShapeKind.Diamond:
+                self.polygon(coordinates(*next(vertices)), width, fill >= 1)
+                for hx0, hy0, hx1, hy1 in next(hatches):
+                    self.draw(point(hx0, hy0), point(hx1, hy1), width)
+            elif kind == ShapeKind.Curve:
+                points = [point(x, y) for x, y in next(curves)]
+                for a, b in zip(points, points[1:]):
+                    self.draw(a, b, width)
+
+    def close(self):
+        self.fd.write('M02*\n')
+
+
+class ExcellonWriter:
+    """ Streams an Excellon drill file of round holes and routed slots (mm, decimal coordinates). """
+    def __init__(self, fd, holes, plated=False):
+        self.fd = fd
+        self.tools = {}
+        for diameter in sorted(set(round(h[2], 3) for h in holes)):
+            self.tools[diameter] = len(self.tools) + 1
+        fd.write('M48\n'
+                 f'; DRILL file asmr {asmr.__version__}\n'
+                 f'; #@! TF.FileFunction,{"Plated" if plated else "NonPlated"},1,2,{"PTH" if plated else "NPTH"}\n'
+                 'FMAT,2\n'
+                 'METRIC\n')
+        fd.writelines(f'T{tool}C{diameter:.3f}\n' for diameter, tool in self.tools.items())
+        fd.write('%\nG90\nG05\n')
+        # holes are (x0, y0, diameter, x1, y1), a slot when both ends differ.
+        for diameter, tool in self.tools.items():
+            fd.write(f'T{tool}\n')
+            for x0, y0, d, x1, y1 in holes:
+                if round(d, 3) != diameter:
+                    continue
+                if (x0, y0) == (x1, y1):
+                    fd.write(f'X{x0:.4f}Y{-y0:.4f}\n')
+                else:
+                    fd.write(f'X{x0:.4f}Y{-y0:.4f}G85X{x1:.4f}Y{-y1:.4f}\n')
+        fd.write('M30\n')
+
+
+def holes_from_shapes(buffer: ShapeRecords):
+    """ drill holes of fully rounded rectangles: circles and ovals (slots). """
+    holes = []
+    data = buffer.data
+    for record in data[(data['kind'] == ShapeKind.Rectangle) & (data['a'] > 0)]:
+        x0, y0, x1, y1 = (float(record[k]) for k in ('x0', 'y0', 'x1', 'y1'))
+        d = min(x1 - x0, y1 - y0)
+        r = d/2
+        if abs((x1 - x0) - (y1 - y0)) < 1e-6:
+            cx, cy = (x0 + x1)/2, (y0 + y1)/2
+            holes.append((cx, cy, d, cx, cy))
+        elif x1 - x0 > y1 - y0:
+            holes.append((x0 + r, y0 + r, d, x1 - r, y0 + r))
+        else:
+            holes.append((x0 + r, y0 + r, d, x0 + r, y1 - r))
+    return holes
+
+
+def save(filename, layers, holes=None):
+    """ saves gerber layers and an optional drill file.
+
+    layers maps a layer name (e.g. 'F_Cu') to (file function, shape buffers).
+    a .zip filename bundles all files in one archive, otherwise every layer
+    is written next to filename as '<stem>-<layer>.gbr' (and '<stem>-NPTH.drl').
+    """
+    path = pathlib.Path(filename)
+    names = {name: f'{path.stem}-{name}.gbr' for name in layers}
+
+    def write(open_file):
+        for name, (function, sources) in layers.items():
+            with open_file(names[name]) as fd:
+                writer = GerberWriter(fd, function)
+                for shapes in sources:
+                    writer.write_buffer(shapes)
+                writer.close()
+        if holes:
+            with open_file(f'{path.stem}-NPTH.drl') as fd:
+                ExcellonWriter(fd, holes)
+
+    if path.suffix == '.zip':
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            write(lambda name: io.TextIOWrapper(archive.open(name, 'w'), encoding='ascii', newline='\n'))
+    else:
+        write(lambda name: open(path.parent/name, 'w', newline='\n'))
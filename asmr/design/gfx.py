@@ -4,10 +4,14 @@ The shapes in this module can be translated into common graphical formats
 such as SVG, DXF, KICAD_MOD, etc.
 """
 
+import functools
 import math
+import re
+from enum import IntEnum
+from xml.etree import ElementTree
+from xml.sax.saxutils import quoteattr
 
-import svgwrite
-from svgwrite import mm
+import numpy as np
 
 
 class Line:
@@ -35,6 +39,10 @@ class Line:
     def get_height(self):
         return abs(self.y1 - self.y0)
 
+    def bounds(self):
+        """ returns the extents (xmin, ymin, xmax, ymax) of the shape. """
+        return (min(self.x0, self.x1), min(self.y0, self.y1), max(self.x0, self.x1), max(self.y0, self.y1))
+
 
 class Rectangle:
     def __init__(self,
@@ -65,16 +73,120 @@ class Rectangle:
     def get_height(self):
         return abs(self.y1 - self.y0)
 
+    def bounds(self):
+        """ returns the extents (xmin, ymin, xmax, ymax) of the shape. """
+        return (min(self.x0, self.x1), min(self.y0, self.y1), max(self.x0, self.x1), max(self.y0, self.y1))
+
+
+# max distance (mm) of flattened curves from the true curve.
+CURVE_TOLERANCE = 0.01
+
 
 class Curve:
-    def __init__(self):
-        # TODO (coco|2023.10.14) IMPLEMENT ME. should be cubic Bezier Curve.
-        pass
+    """ Cubic bezier from (x0, y0) to (x3, y3) with control points (x1, y1) and (x2, y2). """
+    def __init__(self,
+                 x0,
+                 y0,
+                 x1,
+                 y1,
+                 x2,
+                 y2,
+                 x3,
+                 y3,
+                 width=0.5,
+                 color='#000000',
+                 linecap='butt',
+                 group=None):
+        self.x0 = x0
+        self.y0 = y0
+        self.x1 = x1
+        self.y1 = y1
+        self.x2 = x2
+        self.y2 = y2
+        self.x3 = x3
+        self.y3 = y3
+        self.width = width
+        self.color = color
+        self.linecap = linecap
+        self.group = group
+
+    def points(self):
+        return ((self.x0, self.y0), (self.x1, self.y1), (self.x2, self.y2), (self.x3, self.y3))
+
+    def flatten(self, tolerance=CURVE_TOLERANCE):
+        """ returns the polyline points approximating the curve within tolerance (memoized). """
+        return flatten_curve(*self.points(), tolerance)
+
+    def lines(self, tolerance=CURVE_TOLERANCE):
+        """ returns the curve as Line shapes. """
+        points = self.flatten(tolerance)
+        return [Line(x0, y0, x1, y1, width=self.width, color=self.color, linecap=self.linecap, group=self.group)
+                for (x0, y0), (x1, y1) in zip(points, points[1:])]
+
     def get_width(self):
-        pass
+        xmin, _, xmax, _ = self.bounds()
+        return xmax - xmin
 
     def get_height(self):
-        pass
+        _, ymin, _, ymax = self.bounds()
+        return ymax - ymin
+
+    def bounds(self):
+        """ returns the extents (xmin, ymin, xmax, ymax) of the shape. """
+        return curve_bounds(*self.points())
+
+
+def curve_bounds(p0, p1, p2, p3):
+    """ exact extents (xmin, ymin, xmax, ymax) of a cubic bezier. """
+    extents = []
+    for a, b, c, d in zip(p0, p1, p2, p3):
+        # extrema are at the roots of the derivative (a quadratic in t).
+        qa, qb, qc = -a + 3*b - 3*c + d, 2*(a - 2*b + c), b - a
+        if abs(qa) < 1e-12:
+            roots = [-qc/qb] if abs(qb) > 1e-12 else []
+        else:
+            discriminant = qb*qb - 4*qa*qc
+            roots = [] if discriminant < 0 else [(-qb + sign*math.sqrt(discriminant))/(2*qa) for sign in (-1, 1)]
+        values = [a, d] + [(1 - t)**3*a + 3*(1 - t)**2*t*b + 3*(1 - t)*t**2*c + t**3*d for t in roots if 0 < t < 1]
+        extents.append((min(values), max(values)))
+    (xmin, xmax), (ymin, ymax) = extents
+    return (xmin, ymin, xmax, ymax)
+
+
+def chord_distance(p, a, b):
+    """ distance of point p to the chord a-b. """
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    length = dx*dx + dy*dy
+    t = 0 if length == 0 else min(1, max(0, ((p[0] - a[0])*dx + (p[1] - a[1])*dy)/length))
+    return math.hypot(p[0] - a[0] - t*dx, p[1] - a[1] - t*dy)
+
+
+@functools.lru_cache(maxsize=2**16)
+def flatten_curve(p0, p1, p2, p3, tolerance=CURVE_TOLERANCE):
+    """ flattens a cubic bezier by adaptive subdivision, returns the polyline points (x, y) as a tuple.
+
+    pieces are halved (de Casteljau) until they are within tolerance of
+    their chord, so flat stretches get few segments and tight bends many.
+    results are memoized per control points and tolerance.
+    """
+    points = [p0]
+    stack = [(p0, p1, p2, p3, 0)]
+    while stack:
+        a, b, c, d, depth = stack.pop()
+        # the curve deviates at most 3/4 of its control points' distance from the chord.
+        if depth >= 16 or 0.75*max(chord_distance(b, a, d), chord_distance(c, a, d)) <= tolerance:
+            points.append(d)
+            continue
+        ab = ((a[0] + b[0])/2, (a[1] + b[1])/2)
+        bc = ((b[0] + c[0])/2, (b[1] + c[1])/2)
+        cd = ((c[0] + d[0])/2, (c[1] + d[1])/2)
+        abc = ((ab[0] + bc[0])/2, (ab[1] + bc[1])/2)
+        bcd = ((bc[0] + cd[0])/2, (bc[1] + cd[1])/2)
+        mid = ((abc[0] + bcd[0])/2, (abc[1] + bcd[1])/2)
+        # the second half is pushed first so the first half is emitted first.
+        stack.append((mid, bcd, cd, d, depth + 1))
+        stack.append((a, ab, abc, mid, depth + 1))
+    return tuple(points)
 
 
 class Diamond:
@@ -92,16 +204,35 @@ class Diamond:
         color = f'{color}FF' if len(color) == 7 else color
 
         h = stroke_width/2
-        self.x0 = x0 + h
-        self.y0 = y0 + h
-        self.diagonal = diagonal - 2*h
+        self.build(x0 + h,
+                   y0 + h,
+                   diagonal - 2*h,
+                   fill=fill,
+                   color=color if fill == 1 else f'{color[:-2]}00',
+                   stroke_width=stroke_width,
+                   pattern=pattern,
+                   cutoff=cutoff,
+                   group=group)
+
+    @staticmethod
+    def from_apex(x0, y0, diagonal, **kwargs):
+        """ creates a diamond from its top vertex and diagonal (both stroke adjusted). """
+        diamond = Diamond.__new__(Diamond)
+        diamond.build(x0, y0, diagonal, **kwargs)
+        return diamond
+
+    def build(self, x0, y0, diagonal, fill, color, stroke_width, pattern, cutoff, group, fill_lines=None):
+        self.apex = (x0, y0)
+        self.x0 = x0
+        self.y0 = y0
+        self.diagonal = diagonal
         self.x1 = self.x0 + self.diagonal/2
         self.y1 = self.y0 + self.diagonal/2
         self.x2 = self.x0
         self.y2 = self.y0 + self.diagonal
         self.x3 = self.x0 - self.diagonal/2
         self.y3 = self.y0 + self.diagonal/2
-        self.color = color if fill == 1 else f'{color[:-2]}00'
+        self.color = color
         self.fill = fill
         self.stroke_width = stroke_width
         self.pattern = pattern
@@ -110,7 +241,11 @@ class Diamond:
         self.fill_lines = []
 
         self.apply_cutoff()
-        self.generate_fill_lines()
+        if fill_lines is None:
+            self.generate_fill_lines()
+        else:
+            # precomputed by a batch hatch_lines call.
+            self.fill_lines = fill_lines
 
     def get_width(self):
         return abs(self.x1 - self.x3)
@@ -118,6 +253,12 @@ class Diamond:
     def get_height(self):
         return abs(self.y1 - self.y0)
 
+    def bounds(self):
+        """ returns the extents (xmin, ymin, xmax, ymax) of the shape. """
+        xs = (self.x0, self.x1, self.x2, self.x3)
+        ys = (self.y0, self.y1, self.y2, self.y3)
+        return (min(xs), min(ys), max(xs), max(ys))
+
     def apply_cutoff(self):
         if self.cutoff == 'none':
             return
@@ -135,161 +276,1460 @@ class Diamond:
             self.y3 = self.y0
 
     def generate_fill_lines(self):
-        if self.fill == 1 or self.fill == 0:
+        owner, x0, y0, x1, y1 = hatch_lines(
+            np.array([[self.x0, self.x1, self.x2, self.x3]]),
+            np.array([[self.y0, self.y1, self.y2, self.y3]]),
+            np.array([self.diagonal]),
+            np.array([self.stroke_width]),
+            np.array([self.fill]),
+            np.array([CUTOFFS.index(self.cutoff)]),
+            np.zeros(1, dtype=np.intp),
+            [self.pattern],
+        )
+        color = f'{self.color[:-2]}FF'
+        self.fill_lines = [
+            Line(*coords, width=self.stroke_width, color=color, group=self.group)
+            for coords in zip(x0.tolist(), y0.tolist(), x1.tolist(), y1.tolist())
+        ]
+
+
+class ShapeKind(IntEnum):
+    Line      = 0
+    Rectangle = 1
+    Diamond   = 2
+    Curve     = 3
+
+
+LINECAPS = ('butt', 'round', 'square')
+CUTOFFS  = ('none', 'top', 'right', 'bottom', 'left')
+# record columns which hold lengths and coordinates (see ShapeBuffer).
+GEOMETRY_COLUMNS = ('x0', 'y0', 'x1', 'y1', 'width', 'a', 'b')
+
+
+def codes(values, table):
+    """ maps a value (or array of values) to its index in a fixed table. """
+    if np.ndim(values) == 0:
+        return table.index(values)
+    lookup = {v: i for i, v in enumerate(table)}
+    return np.vectorize(lookup.__getitem__, otypes=[np.uint8])(values)
+
+
+def number_list(values) -> list:
+    """ a float column as python numbers, zeros as the int 0.
+
+    records store every coordinate as a float, while the generators place
+    shapes at the literal 0, which the writers print as "0" (not "0.0").
+    """
+    values = np.asarray(values)
+    numbers = values.astype(object)
+    numbers[values == 0] = 0
+    return numbers.tolist()
+
+
+# hatch directions in degrees (y axis pointing down, like SVG).
+HATCH_ANGLES = {'/': 135.0, '\\': 45.0, '|': 90.0, '-': 0.0}
+HATCH_ALIASES = {'#': '/\\', '+': '|-'}
+
+# the diagonal hatches run parallel to the diamond edges. their segments are
+# spanned between two vertices stepped along the edges, per cutoff:
+#   (start vertex, start x/y step, end vertex, end x/y step)
+# (indexed like CUTOFFS, the steps are multiples of the hatch offset.)
+EDGE_HATCHES = {
+    '/': (
+        (0, 1, 1, 3, 1, 1),
+        (3, 2, 0, 3, 1, 1),
+        (0, 0, 2, 3, 1, 1),
+        (0, 1, 1, 3, 2, 0),
+        (0, 1, 1, 3, 0, 2),
+    ),
+    '\\': (
+        (0, -1, 1, 1, -1, 1),
+        (0, -2, 0, 1, -1, 1),
+        (0, -1, 1, 0, 0, 2),
+        (0, -1, 1, 1, -2, 0),
+        (0, 0, 2, 1, -1, 1),
+    ),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def hatch_families(pattern):
+    """ parses a hatch pattern into its line families.
+
+    A pattern is made of the characters '/', '\\', '|', '-' and the
+    combinations '#' (= '/\\') and '+' (= '|-'), or of comma separated
+    angles in degrees, e.g. '30,120'. Diagonal families are returned as
+    '/' or '\\', all others as their angle.
+    """
+    families = []
+    for part in (pattern or '').split(','):
+        part = part.strip()
+        try:
+            angles = [float(part) % 180]
+        except ValueError:
+            chars = ''.join(HATCH_ALIASES.get(c, c) for c in part)
+            if any(c not in HATCH_ANGLES for c in chars):
+                raise ValueError(f'invalid hatch pattern: {pattern!r}')
+            angles = [HATCH_ANGLES[c] for c in chars]
+        for angle in angles:
+            family = {135.0: '/', 45.0: '\\'}.get(angle, angle)
+            if family not in families:
+                families.append(family)
+    return tuple(families)
+
+
+def hatch_lines(xs, ys, diagonal, stroke_width, fill, cutoff, pattern, patterns):
+    """ computes the hatch fill segments of a batch of diamonds at once.
+
+    xs and ys are the (n, 4) vertices (cutoffs applied), cutoff holds
+    CUTOFFS codes and pattern indices into the patterns table. The lines
+    are spaced so that 'fill' of each diamond is covered by strokes of
+    stroke_width. Returns (owner, x0, y0, x1, y1) arrays, ordered by owner
+    and in the pattern's family order within each diamond.
+    """
+    # float_power calls pow() like python's ** does, np.square rounds differently.
+    side = np.sqrt(np.float_power(diagonal, 2)/2)
+    hatched = (fill != 1) & (fill != 0) & (stroke_width > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n = np.where(hatched, np.floor((side / stroke_width) * fill), 0).astype(np.int64)
+        dh = side / n
+    delta = np.sqrt(np.float_power(dh, 2)/2)
+
+    chunks = []
+    for code in np.unique(pattern[n > 1]):
+        for rank, family in enumerate(hatch_families(patterns[code])):
+            idx = np.flatnonzero((pattern == code) & (n > 1))
+            if isinstance(family, str):
+                counts = n[idx] - 1
+            else:
+                theta = math.radians(family)
+                normal = -math.sin(theta)*xs[idx] + math.cos(theta)*ys[idx]
+                counts = np.ceil((normal.max(axis=1) - normal.min(axis=1)) / dh[idx]).astype(np.int64) - 1
+                counts = np.maximum(counts, 0)
+            owner = np.repeat(idx, counts)
+            i = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+            if isinstance(family, str):
+                segments = edge_hatch(xs, ys, delta, cutoff, EDGE_HATCHES[family], owner, i)
+            else:
+                segments = clipped_hatch(xs, ys, dh, family, owner, i)
+            chunks.append((owner, np.full(len(owner), rank), i, *segments))
+
+    if len(chunks) == 0:
+        empty = np.zeros(0)
+        return np.zeros(0, dtype=np.intp), empty, empty, empty, empty
+    owner, rank, i, x0, y0, x1, y1 = (np.concatenate(c) for c in zip(*chunks))
+    order = np.lexsort((i, rank, owner))
+    return owner[order], x0[order], y0[order], x1[order], y1[order]
+
+
+def edge_hatch(xs, ys, delta, cutoff, table, owner, i):
+    """ diagonal hatch segments, stepped along the diamond edges. """
+    sv, sx, sy, ev, ex, ey = np.array(table)[cutoff[owner]].T
+    d = delta[owner]
+    return (
+        sx*i*d + xs[owner, sv],
+        sy*i*d + ys[owner, sv],
+        ex*i*d + xs[owner, ev],
+        ey*i*d + ys[owner, ev],
+    )
+
+
+def clipped_hatch(xs, ys, dh, angle, owner, i):
+    """ hatch segments at an arbitrary angle, clipped to the (convex) diamond outline. """
+    theta = math.radians(angle)
+    ux, uy = math.cos(theta), math.sin(theta)
+    px, py = xs[owner], ys[owner]
+    # signed distance of the vertices to each hatch line.
+    normal = -uy*px + ux*py
+    dist = normal - (normal.min(axis=1) + i*dh[owner])[:, None]
+    nx, ny, ndist = (np.roll(v, -1, axis=1) for v in (px, py, dist))
+    crossing = (dist*ndist <= 0) & (dist != ndist)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(crossing, dist / (dist - ndist), 0)
+    cx = px + t*(nx - px)
+    cy = py + t*(ny - py)
+    along = ux*cx + uy*cy
+    rows = np.arange(len(owner))
+    first = np.where(crossing, along, np.inf).argmin(axis=1)
+    last = np.where(crossing, along, -np.inf).argmax(axis=1)
+    return cx[rows, first], cy[rows, first], cx[rows, last], cy[rows, last]
+
+
+class ShapeRecords:
+    """ Read interface shared by ShapeBuffer and ShapeView.
+
+    Subclasses provide 'data' (structured records) and the 'colors',
+    'groups', 'patterns' and 'controls' tables the records refer to.
+    """
+    @staticmethod
+    def diamond_vertices(data):
+        """ returns the (n, 4) x and y vertex arrays of diamond records, cutoffs applied. """
+        x0 = data['x0'][:, None]
+        y0 = data['y0'][:, None]
+        d = data['a'][:, None]
+        xs = np.hstack([x0, x0 + d/2, x0, x0 - d/2])
+        ys = np.hstack([y0, y0 + d/2, y0 + d, y0 + d/2])
+        # a cutoff collapses one vertex onto the next one (see Diamond.apply_cutoff).
+        for cutoff, (i, j) in (('top', (0, 1)), ('right', (1, 2)), ('bottom', (2, 3)), ('left', (3, 0))):
+            rows = data['cutoff'] == CUTOFFS.index(cutoff)
+            xs[rows, i] = xs[rows, j]
+            ys[rows, i] = ys[rows, j]
+        return xs, ys
+
+    @staticmethod
+    def extents(data, controls=()):
+        """ returns the per-record (xmin, ymin, xmax, ymax) extents as arrays.
+
+        curves are measured exactly, which needs the 'controls' table of the records.
+        """
+        xmin = np.minimum(data['x0'], data['x1'])
+        ymin = np.minimum(data['y0'], data['y1'])
+        xmax = np.maximum(data['x0'], data['x1'])
+        ymax = np.maximum(data['y0'], data['y1'])
+        diamonds = data['kind'] == ShapeKind.Diamond
+        if np.any(diamonds):
+            xs, ys = ShapeRecords.diamond_vertices(data[diamonds])
+            xmin[diamonds] = xs.min(axis=1)
+            ymin[diamonds] = ys.min(axis=1)
+            xmax[diamonds] = xs.max(axis=1)
+            ymax[diamonds] = ys.max(axis=1)
+        for i in np.flatnonzero(data['kind'] == ShapeKind.Curve):
+            x0, y0, x3, y3, control = (data[k][i].item() for k in ('x0', 'y0', 'x1', 'y1', 'a'))
+            x1, y1, x2, y2 = controls[int(control)]
+            xmin[i], ymin[i], xmax[i], ymax[i] = curve_bounds((x0, y0), (x1, y1), (x2, y2), (x3, y3))
+        return xmin, ymin, xmax, ymax
+
+    def bounds(self):
+        """ returns the extents (xmin, ymin, xmax, ymax) of all shapes, cached until the buffer changes. """
+        if self._bounds is None and len(self) > 0:
+            xmin, ymin, xmax, ymax = ShapeRecords.extents(self.data, self.controls)
+            self._bounds = (float(xmin.min()), float(ymin.min()), float(xmax.max()), float(ymax.max()))
+        return self._bounds
+
+    def hatch(self, data):
+        """ returns the hatch segments of each diamond record in data as lists of (x0, y0, x1, y1). """
+        xs, ys = ShapeRecords.diamond_vertices(data)
+        owner, x0, y0, x1, y1 = hatch_lines(xs, ys,
+                                            data['a'],
+                                            data['width'],
+                                            data['fill'],
+                                            data['cutoff'],
+                                            data['pattern'],
+                                            self.patterns)
+        segments = list(zip(x0.tolist(), y0.tolist(), x1.tolist(), y1.tolist()))
+        splits = np.searchsorted(owner, np.arange(len(data) + 1)).tolist()
+        return [segments[a:b] for a, b in zip(splits, splits[1:])]
+
+    def curve_points(self, data, tolerance=CURVE_TOLERANCE):
+        """ returns the flattened polyline points of each curve record in data (memoized per curve). """
+        columns = [data[k].tolist() for k in ('x0', 'y0', 'x1', 'y1', 'a')]
+        return [flatten_curve((x0, y0), *zip(*[iter(self.controls[int(control)])]*2), (x3, y3), tolerance)
+                for x0, y0, x3, y3, control in zip(*columns)]
+
+    def __iter__(self):
+        """ materializes the records as gfx shapes. """
+        return self.materialize(self.data)
+
+    def materialize(self, data):
+        """ yields the gfx shapes of records which refer to the tables of this object. """
+        hatches = iter(self.hatch(data[data['kind'] == ShapeKind.Diamond]))
+        rows = zip(*[number_list(data[k]) if k in GEOMETRY_COLUMNS else data[k].tolist() for k in ShapeBuffer.dtype.names])
+        for kind, linecap, pattern, cutoff, color, group, x0, y0, x1, y1, width, fill, a, b in rows:
+            if kind == ShapeKind.Line:
+                yield Line(x0, y0, x1, y1,
+                           width=width,
+                           color=self.colors[color],
+                           linecap=LINECAPS[linecap],
+                           group=self.groups[group])
+            elif kind == ShapeKind.Rectangle:
+                yield Rectangle(x0, y0, x1, y1,
+                                width=width,
+                                fill=bool(fill),
+                                color=self.colors[color],
+                                rx=a,
+                                ry=b,
+                                group=self.groups[group])
+            elif kind == ShapeKind.Diamond:
+                hatch_color = f'{self.colors[color][:-2]}FF'
+                yield Diamond.from_apex(x0, y0, a,
+                                        fill=fill,
+                                        color=self.colors[color],
+                                        stroke_width=width,
+                                        pattern=self.patterns[pattern],
+                                        cutoff=CUTOFFS[cutoff],
+                                        group=self.groups[group],
+                                        fill_lines=[
+                                            Line(*segment, width=width, color=hatch_color, group=self.groups[group])
+                                            for segment in next(hatches)
+                                        ])
+            elif kind == ShapeKind.Curve:
+                cx1, cy1, cx2, cy2 = self.controls[int(a)]
+                yield Curve(x0, y0, cx1, cy1, cx2, cy2, x1, y1,
+                            width=width,
+                            color=self.colors[color],
+                            linecap=LINECAPS[linecap],
+                            group=self.groups[group])
+
+
+class ShapeBuffer(ShapeRecords):
+    """ Compact array-backed store of shapes.
+
+    Each shape is one record of typed columns; colors, groups and fill
+    patterns are interned into per-buffer tables and referenced by id
+    (group id 0 is reserved for 'no group'). The geometry columns are
+    interpreted according to the shape kind:
+
+      Line      (x0, y0) -> (x1, y1), width, linecap
+      Rectangle (x0, y0) -> (x1, y1), width, fill (0|1), a=rx, b=ry
+      Diamond   apex (x0, y0), a=diagonal, width=stroke, fill, pattern, cutoff
+      Curve     (x0, y0) -> (x1, y1), width, linecap, a=id of the control
+                points (x1, y1, x2, y2) in the 'controls' table
+
+    Iterating over a buffer materializes the equivalent gfx shapes.
+    """
+    dtype = np.dtype([
+        ('kind', 'u1'),
+        ('linecap', 'u1'),
+        ('pattern', 'u1'),
+        ('cutoff', 'u1'),
+        ('color', 'u2'),
+        ('group', 'u2'),
+        ('x0', 'f8'),
+        ('y0', 'f8'),
+        ('x1', 'f8'),
+        ('y1', 'f8'),
+        ('width', 'f8'),
+        ('fill', 'f8'),
+        ('a', 'f8'),
+        ('b', 'f8'),
+    ])
+    # the column holding the ids of each interned table (controls are in 'a').
+    id_columns = {'colors': 'color', 'groups': 'group', 'patterns': 'pattern'}
+
+    def __init__(self):
+        self.colors = []
+        self.groups = [None]
+        self.patterns = []
+        self.controls = []
+        self._ids = {
+            'colors': {},
+            'groups': {None: 0},
+            'patterns': {},
+            'controls': {},
+        }
+        self._chunks = []
+        self._rows = []
+        self._bounds = None
+        self.revision = 0
+
+    @property
+    def data(self):
+        """ the records of this buffer as a single structured array. """
+        self._flush()
+        if len(self._chunks) != 1:
+            self._chunks = [np.concatenate(self._chunks) if self._chunks else np.empty(0, dtype=ShapeBuffer.dtype)]
+        return self._chunks[0]
+
+    def changed(self):
+        """ invalidates cached state after the records were modified. """
+        self._bounds = None
+        self.revision += 1
+
+    def _flush(self):
+        if len(self._rows) > 0:
+            self._chunks.append(np.array(self._rows, dtype=ShapeBuffer.dtype))
+            self._rows = []
+
+    def intern(self, table, values):
+        """ returns the id(s) of a value (or array of values) in the named table. """
+        ids = self._ids[table]
+        if np.ndim(values) == 0:
+            if isinstance(values, np.ndarray):
+                values = values.item()
+            if values not in ids:
+                column = ShapeBuffer.id_columns[table]
+                if len(ids) > np.iinfo(ShapeBuffer.dtype[column]).max:
+                    raise ValueError(f'too many {table} in one buffer ({len(ids)}), the {column} column is {ShapeBuffer.dtype[column]}')
+                ids[values] = len(ids)
+                getattr(self, table).append(values)
+            return ids[values]
+        uniques, inverse = np.unique(np.asarray(values, dtype=object), return_inverse=True)
+        uids = np.array([self.intern(table, v) for v in uniques], dtype=np.uint16)
+        return uids[inverse].reshape(np.shape(values))
+
+    def add(self, kind, valid=None, **columns):
+        """ adds a block of shapes in row-major order of the broadcast columns.
+
+        shapes for which 'valid' is False are dropped.
+        """
+        shape = np.broadcast_shapes(np.shape(kind), *[np.shape(v) for v in columns.values()])
+        block = np.zeros(int(np.prod(shape)), dtype=ShapeBuffer.dtype)
+        block['kind'] = np.broadcast_to(kind, shape).ravel()
+        for k, v in columns.items():
+            block[k] = np.broadcast_to(v, shape).ravel()
+        if valid is not None:
+            block = block[np.broadcast_to(valid, shape).ravel()]
+        self._flush()
+        self._chunks.append(block)
+        self.changed()
+
+    def add_lines(self, x0, y0, x1, y1, width=0.5, color='#000000', linecap='butt', group=None, valid=None):
+        self.add(ShapeKind.Line,
+                 valid=valid,
+                 x0=x0,
+                 y0=y0,
+                 x1=x1,
+                 y1=y1,
+                 width=width,
+                 color=self.intern('colors', color),
+                 linecap=codes(linecap, LINECAPS),
+                 group=self.intern('groups', group))
+
+    def add_rectangles(self, x0, y0, x1, y1, width=0.5, fill=True, color='#000000', rx=0, ry=0, group=None, valid=None):
+        self.add(ShapeKind.Rectangle,
+                 valid=valid,
+                 x0=x0,
+                 y0=y0,
+                 x1=x1,
+                 y1=y1,
+                 width=width,
+                 fill=np.asarray(fill, dtype=float),
+                 a=rx,
+                 b=ry,
+                 color=self.intern('colors', color),
+                 group=self.intern('groups', group))
+
+    def add_diamonds(self,
+                     x0,
+                     y0,
+                     diagonal,
+                     fill=1.0,
+                     color='#000000FF',
+                     stroke_width=0,
+                     pattern='#',
+                     cutoff='none',
+                     group=None,
+                     valid=None):
+        """ vectorized equivalent of constructing gfx.Diamond shapes. """
+        # normalize color, diamonds which aren't solid have a transparent fill.
+        normalize = np.vectorize(lambda c: f'{c}FF' if len(c) == 7 else c, otypes=[object])
+        opaque = normalize(color)
+        transparent = np.vectorize(lambda c: f'{c[:-2]}00', otypes=[object])(opaque)
+        color = np.where(np.asarray(fill) == 1,
+                         self.intern('colors', opaque),
+                         self.intern('colors', transparent))
+
+        h = np.asarray(stroke_width)/2
+        self.add(ShapeKind.Diamond,
+                 valid=valid,
+                 x0=x0 + h,
+                 y0=y0 + h,
+                 a=diagonal - 2*h,
+                 width=stroke_width,
+                 fill=fill,
+                 color=color,
+                 pattern=self.intern('patterns', pattern),
+                 cutoff=codes(cutoff, CUTOFFS),
+                 group=self.intern('groups', group))
+
+    def control_ids(self, x1, y1, x2, y2):
+        """ interns control points (arrays) of curves, identical curves share their entry. """
+        ids = self._ids['controls']
+        shape = np.broadcast_shapes(np.shape(x1), np.shape(y1), np.shape(x2), np.shape(y2))
+        result = []
+        for control in zip(*(np.broadcast_to(v, shape).ravel().tolist() for v in (x1, y1, x2, y2))):
+            if control not in ids:
+                ids[control] = len(ids)
+                self.controls.append(control)
+            result.append(ids[control])
+        return np.array(result, dtype=float).reshape(shape)
+
+    def add_curves(self, x0, y0, x1, y1, x2, y2, x3, y3, width=0.5, color='#000000', linecap='butt', group=None, valid=None):
+        self.add(ShapeKind.Curve,
+                 valid=valid,
+                 x0=x0,
+                 y0=y0,
+                 x1=x3,
+                 y1=y3,
+                 a=self.control_ids(x1, y1, x2, y2),
+                 width=width,
+                 color=self.intern('colors', color),
+                 linecap=codes(linecap, LINECAPS),
+                 group=self.intern('groups', group))
+
+    def append(self, shape):
+        """ appends a single gfx shape. """
+        color = self.intern('colors', shape.color)
+        group = self.intern('groups', shape.group)
+        if shape.__class__ is Line:
+            row = (ShapeKind.Line, LINECAPS.index(shape.linecap), 0, 0, color, group,
+                   shape.x0, shape.y0, shape.x1, shape.y1, shape.width, 0, 0, 0)
+        elif shape.__class__ is Rectangle:
+            row = (ShapeKind.Rectangle, 0, 0, 0, color, group,
+                   shape.x0, shape.y0, shape.x1, shape.y1, shape.width, float(shape.fill), shape.rx, shape.ry)
+        elif shape.__class__ is Diamond:
+            row = (ShapeKind.Diamond, 0, self.intern('patterns', shape.pattern), CUTOFFS.index(shape.cutoff), color, group,
+                   *shape.apex, 0, 0, shape.stroke_width, shape.fill, shape.diagonal, 0)
+        elif shape.__class__ is Curve:
+            control = self.control_ids(shape.x1, shape.y1, shape.x2, shape.y2).item()
+            row = (ShapeKind.Curve, LINECAPS.index(shape.linecap), 0, 0, color, group,
+                   shape.x0, shape.y0, shape.x3, shape.y3, shape.width, 0, control, 0)
+        else:
+            raise TypeError(f'unsupported shape {shape.__class__.__name__}')
+        self._rows.append(row)
+        self.changed()
+
+    def extend(self, shapes):
+        """ appends an iterable of gfx shapes or the contents of another buffer. """
+        if not isinstance(shapes, ShapeRecords):
+            for shape in shapes:
+                self.append(shape)
             return
 
-        # determine the number of lines per angle given the fill
-        side_length = math.sqrt((self.diagonal**2)/2)
-        n = math.floor((side_length / self.stroke_width) * self.fill)
-        dh = side_length / n
-        delta = math.sqrt((dh**2)/2)
-
-        xstart = self.x0
-        ystart = self.y0
-        xend = self.x3
-        yend = self.y3
-        xstart_coef = 1
-        xend_coef = 1
-        ystart_coef = 1
-        yend_coef = 1
-
-        if self.pattern == '#' or self.pattern == '/':
-            if self.cutoff == 'top':
-                xstart = self.x3
-                ystart = self.y3
-                xstart_coef = 2
-                ystart_coef = 0
-            elif self.cutoff == 'right':
-                xstart_coef = 0
-                ystart_coef = 2
-            elif self.cutoff == 'left':
-                xend_coef = 0
-                yend_coef = 2
-            elif self.cutoff == 'bottom':
-                xend_coef = 2
-                yend_coef = 0
-
-            for i in range(1, n):
-                self.fill_lines.append(Line(
-                    xstart_coef*i*delta + xstart,
-                    ystart_coef*i*delta + ystart,
-                    xend_coef*i*delta + xend,
-                    yend_coef*i*delta + yend,
-                    width=self.stroke_width,
-                    color=f'{self.color[:-2]}FF',
-                    group=self.group
-                ))
-        if self.pattern == '#' or self.pattern == '\\':
-            xstart = self.x0
-            ystart = self.y0
-            xend = self.x1
-            yend = self.y1
-            xstart_coef = -1
-            xend_coef = -1
-            ystart_coef = 1
-            yend_coef = 1
-
-            if self.cutoff == 'top':
-                xstart_coef = -2
-                ystart_coef = 0
-            elif self.cutoff == 'right':
-                xend = self.x0
-                yend = self.y0
-                xend_coef = 0
-                yend_coef = 2
-            elif self.cutoff == 'left':
-                xstart_coef = 0
-                ystart_coef = 2
-            elif self.cutoff == 'bottom':
-                xend_coef = -2
-                yend_coef = 0
-            for i in range(1, n):
-                self.fill_lines.append(Line(
-                    xstart_coef*i*delta + xstart,
-                    ystart_coef*i*delta + ystart,
-                    xend_coef*i*delta + xend,
-                    yend_coef*i*delta + yend,
-                    width=self.stroke_width,
-                    color=f'{self.color[:-2]}FF',
-                    group=self.group
-                ))
+        block = shapes.data.copy()
+        for table in ('colors', 'groups', 'patterns'):
+            column = table[:-1]
+            remap = np.array([self.intern(table, v) for v in getattr(shapes, table)], dtype=np.uint16)
+            if len(remap) > 0:
+                block[column] = remap[block[column]]
+        curves = block['kind'] == ShapeKind.Curve
+        if np.any(curves):
+            remap = self.control_ids(*np.array(shapes.controls, dtype=float).reshape(-1, 4).T)
+            block['a'][curves] = remap[block['a'][curves].astype(np.int64)]
+        self._flush()
+        self._chunks.append(block)
+        self.changed()
+
+    def take(self, indices):
+        """ returns a new buffer with the shapes at the given indices. """
+        buffer = ShapeBuffer()
+        buffer.colors = list(self.colors)
+        buffer.groups = list(self.groups)
+        buffer.patterns = list(self.patterns)
+        buffer.controls = list(self.controls)
+        buffer._ids = {table: dict(ids) for table, ids in self._ids.items()}
+        buffer._chunks = [self.data[indices]]
+        return buffer
+
+    def restyle(self, color=None, group=None):
+        """ sets the color and/or group of every shape in the buffer. """
+        data = self.data
+        if color is not None:
+            data['color'] = self.intern('colors', color)
+        if group is not None:
+            data['group'] = self.intern('groups', group)
+
+    @staticmethod
+    def concatenate(buffers):
+        buffer = ShapeBuffer()
+        for b in buffers:
+            buffer.extend(b)
+        return buffer
+
+    def __len__(self):
+        return sum(len(c) for c in self._chunks) + len(self._rows)
+
+
+
+class ShapeView(ShapeRecords):
+    """ Lightweight selection of the shapes of a ShapeBuffer.
+
+    A view only holds the indices of the selected records and optional
+    color/group overrides, the geometry stays in the underlying buffer.
+    """
+    def __init__(self, buffer: ShapeBuffer, indices, color=None, group=None):
+        self.buffer = buffer
+        self.indices = np.asarray(indices, dtype=np.uint32)
+        self.color = color
+        self.group = group
+        self._bounds = None
+        self._revision = None
+
+    @property
+    def colors(self):
+        return self.buffer.colors if self.color is None else [self.color]
+
+    @property
+    def groups(self):
+        return self.buffer.groups if self.group is None else [None, self.group]
+
+    @property
+    def patterns(self):
+        return self.buffer.patterns
+
+    @property
+    def controls(self):
+        return self.buffer.controls
+
+    @property
+    def data(self):
+        """ the selected records with the style overrides applied (a temporary copy). """
+        data = self.buffer.data[self.indices]
+        if self.color is not None:
+            data['color'] = 0
+        if self.group is not None:
+            data['group'] = 1
+        return data
+
+    def bounds(self):
+        if self._revision != self.buffer.revision:
+            self._bounds = None
+            self._revision = self.buffer.revision
+        return super().bounds()
+
+    def __len__(self):
+        return len(self.indices)
+
+
+class CellArray(ShapeRecords):
+    """ Hierarchical shapes: cells (templates of shapes) placed at many offsets.
+
+    Only the templates and the placements are stored, the records of the
+    placed shapes are expanded on demand: 'data' expands everything at
+    once, iterating expands one placement array at a time. Each placement
+    can set the group of its shapes (e.g. the pad of a grid node). Curves
+    can't be placed since their control points are absolute.
+    """
+    def __init__(self, templates=None, color=None, group=None):
+        self.templates = ShapeBuffer() if templates is None else templates
+        self.cells = []        # (start, stop) records of each cell in templates
+        self.placements = []   # (cell, dx, dy, group ids or None)
+        self.color = color
+        self.group = group
+        self._bounds = None
+        self.revision = 0
+
+    def add_cell(self, shapes) -> int:
+        """ adds a template (a buffer or a list of gfx shapes), returns its cell id. """
+        start = len(self.templates)
+        self.templates.extend(shapes)
+        if np.any(self.templates.data['kind'][start:] == ShapeKind.Curve):
+            raise TypeError('curves can not be placed in cells')
+        self.cells.append((start, len(self.templates)))
+        return len(self.cells) - 1
+
+    def place(self, cell, dx, dy, group=None):
+        """ places a cell at the (arrays of) offsets, optionally setting the group per placement. """
+        groups = None if group is None else self.templates.intern('groups', group)
+        dx, dy, groups = np.broadcast_arrays(dx, dy, -1 if groups is None else groups)
+        dx, dy = dx.ravel().astype(float), dy.ravel().astype(float)
+        groups = None if group is None else groups.ravel().astype(np.uint16)
+        self.placements.append((cell, dx, dy, groups))
+        self._bounds = None
+        self.revision += 1
+
+    def view(self, placements, color=None, group=None):
+        """ returns the given placement arrays (indices) as a cell array sharing the templates. """
+        view = CellArray(self.templates, color=color, group=group)
+        view.cells = self.cells
+        view.placements = [self.placements[i] for i in placements]
+        return view
+
+    @property
+    def colors(self):
+        return self.templates.colors if self.color is None else [self.color]
+
+    @property
+    def groups(self):
+        return self.templates.groups if self.group is None else [None, self.group]
+
+    @property
+    def patterns(self):
+        return self.templates.patterns
+
+    @property
+    def controls(self):
+        return self.templates.controls
+
+    def expand(self, placement):
+        """ the records of a placement array (templates translated to each offset). """
+        cell, dx, dy, groups = placement
+        start, stop = self.cells[cell]
+        template = self.templates.data[start:stop]
+        data = np.tile(template, len(dx))
+        shift_x = np.repeat(dx, len(template))
+        shift_y = np.repeat(dy, len(template))
+        # rectangles and lines move both corners, diamonds only have an apex.
+        moves = data['kind'] != ShapeKind.Diamond
+        data['x0'] += shift_x
+        data['y0'] += shift_y
+        data['x1'] += np.where(moves, shift_x, 0)
+        data['y1'] += np.where(moves, shift_y, 0)
+        if groups is not None:
+            data['group'] = np.repeat(groups, len(template))
+        if self.color is not None:
+            data['color'] = 0
+        if self.group is not None:
+            data['group'] = 1
+        return data
+
+    @property
+    def data(self):
+        """ all placed records (a temporary expansion). """
+        blocks = [self.expand(p) for p in self.placements]
+        return np.concatenate(blocks) if blocks else np.empty(0, dtype=ShapeBuffer.dtype)
+
+    def bounds(self):
+        """ extents of all placements, computed from the cell extents without expanding them. """
+        if self._bounds is None and len(self) > 0:
+            xmin, ymin, xmax, ymax = ShapeRecords.extents(self.templates.data, self.controls)
+            bounds = []
+            for cell, dx, dy, _ in self.placements:
+                start, stop = self.cells[cell]
+                if stop > start and len(dx) > 0:
+                    bounds.append((float(xmin[start:stop].min() + dx.min()), float(ymin[start:stop].min() + dy.min()),
+                                   float(xmax[start:stop].max() + dx.max()), float(ymax[start:stop].max() + dy.max())))
+            self._bounds = union_bounds(bounds)
+        return self._bounds
+
+    def __iter__(self):
+        for placement in self.placements:
+            yield from self.materialize(self.expand(placement))
+
+    def __len__(self):
+        return sum(len(dx)*(self.cells[cell][1] - self.cells[cell][0]) for cell, dx, _, _ in self.placements)
+
+
+def union_bounds(bounds):
+    """ returns the extents enclosing all of the given extents (None entries are skipped). """
+    bounds = [b for b in bounds if b is not None]
+    if len(bounds) == 0:
+        return None
+    return (
+        min(b[0] for b in bounds),
+        min(b[1] for b in bounds),
+        max(b[2] for b in bounds),
+        max(b[3] for b in bounds),
+    )
+
+
+def bounds_of(shapes):
+    """ returns the extents of a ShapeBuffer or an iterable of shapes in a single pass. """
+    if isinstance(shapes, ShapeRecords):
+        return shapes.bounds()
+    xmin = ymin = math.inf
+    xmax = ymax = -math.inf
+    for shape in shapes:
+        b = shape.bounds()
+        xmin = min(xmin, b[0])
+        ymin = min(ymin, b[1])
+        xmax = max(xmax, b[2])
+        ymax = max(ymax, b[3])
+    return None if xmin == math.inf else (xmin, ymin, xmax, ymax)
+
+
+class SVGWriter:
+    """ Streams SVG elements straight to a file handle.
+
+    Shapes are written as soon as they are given to the writer. A <g>
+    element is opened whenever the group of the incoming shape changes
+    and closed when the next group starts; a group which is re-entered
+    later in the stream is reopened with the same class.
+    """
+    def __init__(self, fd, width, height, origin=(0, 0), scale=1):
+        self.fd = fd
+        self.group = None
+        self.groups = set()
+        self.base = '    '
+        self.indent = self.base
+        # groups within definitions are classes, their ids could clash between definitions.
+        self.defining = False
+        self.cell_count = 0
+        fd.write('<?xml version="1.0" encoding="utf-8" ?>\n')
+        fd.write('<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+                 f'baseProfile="full" height="{height}mm" version="1.1" viewBox="{origin[0]} {origin[1]} {width} {height}" width="{width}mm">\n')
+        fd.write(f'  <g transform="scale({scale})">\n')
+
+    def set_group(self, group):
+        if group == self.group:
+            return
+        if self.group is not None:
+            self.fd.write(f'{self.base}</g>\n')
+        if group is not None:
+            attr = 'class' if group in self.groups or self.defining else 'id'
+            self.fd.write(f'{self.base}<g {attr}={quoteattr(group)}>\n')
+            if not self.defining:
+                self.groups.add(group)
+        self.group = group
+        self.indent = self.base if group is None else f'{self.base}  '
+
+    def line(self, x0, y0, x1, y1, width, color, linecap):
+        c = SVG.convert_hex_color(color)
+        self.fd.write(f'{self.indent}<line stroke="{c[0]}" stroke-linecap="{linecap}" stroke-opacity="{c[1]}" '
+                      f'stroke-width="{width}" x1="{x0}" x2="{x1}" y1="{y0}" y2="{y1}"/>\n')
+
+    def rect(self, x0, y0, x1, y1, width, fill, color, rx, ry):
+        c = SVG.convert_hex_color(color)
+        self.fd.write(f'{self.indent}<rect fill="{c[0] if fill else "none"}" height="{y1-y0}" opacity="{c[1]}" '
+                      f'rx="{rx}" ry="{ry}" stroke="{c[0]}" stroke-width="{0 if fill else width}" '
+                      f'width="{x1-x0}" x="{x0}" y="{y0}"/>\n')
+
+    def polygon(self, points, width, fill, color):
+        c = SVG.convert_hex_color(color)
+        pts = ' '.join(f'{x},{y}' for x, y in points)
+        self.fd.write(f'{self.indent}<polygon fill="{c[0] if fill else "none"}" points="{pts}" stroke="{c[0]}" '
+                      f'stroke-linejoin="round" stroke-width="{width}"/>\n')
+
+    def curve(self, points, width, color, linecap):
+        c = SVG.convert_hex_color(color)
+        (x0, y0), (x1, y1), (x2, y2), (x3, y3) = points
+        self.fd.write(f'{self.indent}<path d="M{x0},{y0} C{x1},{y1} {x2},{y2} {x3},{y3}" fill="none" stroke="{c[0]}" '
+                      f'stroke-linecap="{linecap}" stroke-opacity="{c[1]}" stroke-width="{width}"/>\n')
+
+    def circle(self, cx, cy, r, width, fill, color):
+        c = SVG.convert_hex_color(color)
+        self.fd.write(f'{self.indent}<circle cx="{cx}" cy="{cy}" fill="{c[0] if fill else "none"}" opacity="{c[1]}" '
+                      f'r="{r}" stroke="{c[0]}" stroke-width="{0 if fill else width}"/>\n')
+
+    def define(self, id, sources):
+        """ writes shapes (lists or buffers) as a <g> which can be instanced with use(). """
+        self.set_group(None)
+        self.fd.write(f'{self.base}<defs>\n{self.base}  <g id={quoteattr(id)}>\n')
+        self.base = f'{self.base}    '
+        self.indent = self.base
+        self.defining = True
+        for shapes in sources:
+            if isinstance(shapes, ShapeRecords):
+                self.write_buffer(shapes)
+            else:
+                for shape in shapes:
+                    self.write(shape)
+        self.set_group(None)
+        self.defining = False
+        self.base = self.base[:-4]
+        self.indent = self.base
+        self.fd.write(f'{self.base}  </g>\n{self.base}</defs>\n')
+
+    def use(self, id, x, y):
+        """ instances a definition translated by (x, y). """
+        self.fd.write(f'{self.indent}<use transform="translate({x},{y})" xlink:href={quoteattr("#" + id)}/>\n')
+
+    def write_cells(self, cells):
+        """ writes a CellArray as one definition per cell and a <use> per placement. """
+        ids = []
+        for start, stop in cells.cells:
+            ids.append(f'cell-{self.cell_count}')
+            self.cell_count += 1
+            template = ShapeView(cells.templates, np.arange(start, stop), color=cells.color)
+            self.define(ids[-1], [template])
+        for cell, dx, dy, groups in cells.placements:
+            names = [None]*len(dx) if groups is None else [cells.templates.groups[g] for g in groups.tolist()]
+            for x, y, name in zip(dx.tolist(), dy.tolist(), names):
+                self.set_group(cells.group or name)
+                self.use(ids[cell], x, y)
+
+    def write(self, shape):
+        """ writes a single gfx shape. """
+        self.set_group(shape.group)
+        if shape.__class__ is Line:
+            self.line(shape.x0, shape.y0, shape.x1, shape.y1, shape.width, shape.color, shape.linecap)
+        elif shape.__class__ is Rectangle:
+            self.rect(shape.x0, shape.y0, shape.x1, shape.y1, shape.width, shape.fill, shape.color, shape.rx, shape.ry)
+        elif shape.__class__ is Diamond:
+            self.polygon(
+                [(shape.x0, shape.y0),
+                 (shape.x1, shape.y1),
+                 (shape.x2, shape.y2),
+                 (shape.x3, shape.y3)],
+                shape.stroke_width,
+                shape.fill >= 1,
+                shape.color,
+            )
+            for line in shape.fill_lines:
+                self.write(line)
+        elif shape.__class__ is Curve:
+            self.curve(shape.points(), shape.width, shape.color, shape.linecap)
+
+    def write_buffer(self, buffer, order=None):
+        """ writes the shapes of a buffer (in the given order) without materializing them. """
+        data = buffer.data if order is None else buffer.data[order]
+        diamonds = data[data['kind'] == ShapeKind.Diamond]
+        xs, ys = ShapeRecords.diamond_vertices(diamonds)
+        vertices = iter(zip(xs.tolist(), ys.tolist()))
+        hatches = iter(buffer.hatch(diamonds))
+        columns = [number_list(data[k]) if k in GEOMETRY_COLUMNS else data[k].tolist() for k in ShapeBuffer.dtype.names]
+        for kind, linecap, pattern, cutoff, color, group, x0, y0, x1, y1, width, fill, a, b in zip(*columns):
+            self.set_group(buffer.groups[group])
+            if kind == ShapeKind.Line:
+                self.line(x0, y0, x1, y1, width, buffer.colors[color], LINECAPS[linecap])
+            elif kind == ShapeKind.Rectangle:
+                self.rect(x0, y0, x1, y1, width, fill, buffer.colors[color], a, b)
+            elif kind == ShapeKind.Diamond:
+                self.polygon(zip(*next(vertices)), width, fill >= 1, buffer.colors[color])
+                hatch_color = f'{buffer.colors[color][:-2]}FF'
+                for segment in next(hatches):
+                    self.line(*segment, width, hatch_color, 'butt')
+            elif kind == ShapeKind.Curve:
+                cx1, cy1, cx2, cy2 = buffer.controls[int(a)]
+                self.curve(((x0, y0), (cx1, cy1), (cx2, cy2), (x1, y1)), width, buffer.colors[color], LINECAPS[linecap])
+
+    def close(self):
+        self.set_group(None)
+        self.fd.write('  </g>\n')
+        self.fd.write('</svg>\n')
+
+
+class DXFWriter:
+    """ Streams DXF (R12, ASCII) entities straight to a file handle.
+
+    Strokes are written as centerlines (LINE and POLYLINE entities, curves
+    flattened),
+    rounded rectangle corners as polyline arcs (bulges) and filled shapes
+    additionally as SOLID entities. Groups map to layers, the y axis is
+    flipped since DXF y points up.
+    """
+    def __init__(self, fd, bounds=(0, 0, 0, 0), layers=()):
+        self.fd = fd
+        self.layer = '0'
+        xmin, ymin, xmax, ymax = bounds
+        fd.write('  0\nSECTION\n  2\nHEADER\n'
+                 '  9\n$ACADVER\n  1\nAC1009\n'
+                 '  9\n$INSUNITS\n 70\n4\n'
+                 f'  9\n$EXTMIN\n 10\n{xmin}\n 20\n{-ymax + 0.0}\n 30\n0.0\n'
+                 f'  9\n$EXTMAX\n 10\n{xmax}\n 20\n{-ymin + 0.0}\n 30\n0.0\n'
+                 '  0\nENDSEC\n')
+        names = ['0'] + sorted(set(DXFWriter.layer_name(layer) for layer in layers) - {'0'})
+        fd.write(f'  0\nSECTION\n  2\nTABLES\n  0\nTABLE\n  2\nLAYER\n 70\n{len(names)}\n')
+        for name in names:
+            fd.write(f'  0\nLAYER\n  2\n{name}\n 70\n0\n 62\n7\n  6\nCONTINUOUS\n')
+        fd.write('  0\nENDTAB\n  0\nENDSEC\n  0\nSECTION\n  2\nENTITIES\n')
+
+    @staticmethod
+    def layer_name(group):
+        """ layer names may only contain letters, digits, '$', '-' and '_'. """
+        if group is None:
+            return '0'
+        return ''.join(c if c.isalnum() or c in '$-_' else '_' for c in group)
+
+    def set_group(self, group):
+        self.layer = DXFWriter.layer_name(group)
+
+    def line(self, x0, y0, x1, y1):
+        self.fd.write(f'  0\nLINE\n  8\n{self.layer}\n'
+                      f' 10\n{x0}\n 20\n{-y0 + 0.0}\n 30\n0.0\n'
+                      f' 11\n{x1}\n 21\n{-y1 + 0.0}\n 31\n0.0\n')
+
+    def polyline(self, points, bulges=None, closed=True):
+        """ a polyline, bulges (tan of a quarter of the arc angle) start at their vertex. """
+        self.fd.write(f'  0\nPOLYLINE\n  8\n{self.layer}\n 66\n1\n 10\n0.0\n 20\n0.0\n 30\n0.0\n 70\n{int(closed)}\n')
+        for i, (x, y) in enumerate(points):
+            bulge = f' 42\n{bulges[i]}\n' if bulges is not None and bulges[i] != 0 else ''
+            self.fd.write(f'  0\nVERTEX\n  8\n{self.layer}\n 10\n{x}\n 20\n{-y + 0.0}\n 30\n0.0\n{bulge}')
+        self.fd.write(f'  0\nSEQEND\n  8\n{self.layer}\n')
+
+    def solid(self, points):
+        """ a filled triangle or quadrilateral. """
+        # SOLID vertices are given in 'Z' order: the last two are swapped.
+        p = list(points) + [points[-1]]*(4 - len(points))
+        self.fd.write(f'  0\nSOLID\n  8\n{self.layer}\n' + ''.join(
+            f' 1{i}\n{x}\n 2{i}\n{-y + 0.0}\n 3{i}\n0.0\n'
+            for i, (x, y) in enumerate((p[0], p[1], p[3], p[2]))))
+
+    def rect(self, x0, y0, x1, y1, fill, rx, ry):
+        # polyline arcs are circular, elliptical corners use the smaller radius.
+        r = min(rx, ry, (x1 - x0)/2, (y1 - y0)/2)
+        if r <= 0:
+            points = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+            self.polyline(points)
+            if fill:
+                self.solid(points)
+            return
+        # counter-clockwise once flipped: every edge is followed by a quarter arc.
+        bulge = math.tan(math.pi/8)
+        self.polyline([(x0 + r, y1), (x1 - r, y1), (x1, y1 - r), (x1, y0 + r),
+                       (x1 - r, y0), (x0 + r, y0), (x0, y0 + r), (x0, y1 - r)],
+                      [0, bulge]*4)
+
+    def polygon(self, points, fill):
+        # drop collapsed edges (cut off diamonds).
+        points = [p for i, p in enumerate(points) if p != points[i - 1]]
+        self.polyline(points)
+        if fill:
+            self.solid(points)
+
+    def circle(self, cx, cy, r):
+        self.fd.write(f'  0\nCIRCLE\n  8\n{self.layer}\n 10\n{cx}\n 20\n{-cy + 0.0}\n 30\n0.0\n 40\n{r}\n')
+
+    def write(self, shape):
+        """ writes a single gfx shape. """
+        self.set_group(shape.group)
+        if shape.__class__ is Line:
+            self.line(shape.x0, shape.y0, shape.x1, shape.y1)
+        elif shape.__class__ is Rectangle:
+            self.rect(shape.x0, shape.y0, shape.x1, shape.y1, shape.fill, shape.rx, shape.ry)
+        elif shape.__class__ is Diamond:
+            self.polygon(
+                [(shape.x0, shape.y0),
+                 (shape.x1, shape.y1),
+                 (shape.x2, shape.y2),
+                 (shape.x3, shape.y3)],
+                shape.fill >= 1,
+            )
+            for line in shape.fill_lines:
+                self.write(line)
+        elif shape.__class__ is Curve:
+            self.polyline(shape.flatten(), closed=False)
+
+    def write_buffer(self, buffer, order=None):
+        """ writes the shapes of a buffer (in the given order) without materializing them. """
+        data = buffer.data if order is None else buffer.data[order]
+        diamonds = data[data['kind'] == ShapeKind.Diamond]
+        xs, ys = ShapeRecords.diamond_vertices(diamonds)
+        vertices = iter(zip(xs.tolist(), ys.tolist()))
+        hatches = iter(buffer.hatch(diamonds))
+        curves = iter(buffer.curve_points(data[data['kind'] == ShapeKind.Curve]))
+        columns = [data[k].tolist() for k in ('kind', 'group', 'x0', 'y0', 'x1', 'y1', 'fill', 'a', 'b')]
+        for kind, group, x0, y0, x1, y1, fill, a, b in zip(*columns):
+            self.set_group(buffer.groups[group])
+            if kind == ShapeKind.Line:
+                self.line(x0, y0, x1, y1)
+            elif kind == ShapeKind.Rectangle:
+                self.rect(x0, y0, x1, y1, fill, a, b)
+            elif kind == ShapeKind.Diamond:
+                self.polygon(list(zip(*next(vertices))), fill >= 1)
+                for segment in next(hatches):
+                    self.line(*segment)
+            elif kind == ShapeKind.Curve:
+                self.polyline(next(curves), closed=False)
+
+    def close(self):
+        self.fd.write('  0\nENDSEC\n  0\nEOF\n')
+
+
+# svg lengths in mm, unitless lengths are px.
+SVG_UNITS = {'mm': 1.0, 'cm': 10.0, 'in': 25.4, 'pt': 25.4/72, 'pc': 25.4/6, 'px': 25.4/96, '': 25.4/96}
+SVG_SKIPPED = {'defs', 'clipPath', 'mask', 'symbol', 'marker', 'pattern', 'metadata', 'title', 'desc', 'style', 'script', 'text'}
+SVG_INHERITED = ('stroke', 'stroke-width', 'stroke-linecap', 'stroke-opacity', 'fill', 'fill-opacity', 'opacity')
+SVG_COLORS = {'black': '#000000', 'white': '#ffffff', 'red': '#ff0000', 'green': '#008000', 'blue': '#0000ff'}
+SVG_NUMBER = re.compile(r'[-+]?(?:\d*\.\d+|\d+\.?)(?:[eE][-+]?\d+)?')
+SVG_PATH_TOKEN = re.compile(r'[MmZzLlHhVvCcSsQqTtAa]|[-+]?(?:\d*\.\d+|\d+\.?)(?:[eE][-+]?\d+)?')
+SVG_TRANSFORM = re.compile(r'(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)')
+
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+def compose(m, n):
+    """ returns the affine transform m·n, transforms are (a, b, c, d, e, f) like svg matrix(). """
+    a, b, c, d, e, f = m
+    return (a*n[0] + c*n[1], b*n[0] + d*n[1],
+            a*n[2] + c*n[3], b*n[2] + d*n[3],
+            a*n[4] + c*n[5] + e, b*n[4] + d*n[5] + f)
+
+
+def parse_transform(text):
+    """ parses an svg transform attribute into an affine transform. """
+    m = IDENTITY
+    for name, args in SVG_TRANSFORM.findall(text or ''):
+        v = [float(x) for x in SVG_NUMBER.findall(args)]
+        if name == 'matrix':
+            t = tuple(v[:6])
+        elif name == 'translate':
+            t = (1, 0, 0, 1, v[0], v[1] if len(v) > 1 else 0)
+        elif name == 'scale':
+            t = (v[0], 0, 0, v[1] if len(v) > 1 else v[0], 0, 0)
+        elif name == 'rotate':
+            r = math.radians(v[0])
+            t = (math.cos(r), math.sin(r), -math.sin(r), math.cos(r), 0, 0)
+            if len(v) == 3:
+                t = compose(compose((1, 0, 0, 1, v[1], v[2]), t), (1, 0, 0, 1, -v[1], -v[2]))
+        elif name == 'skewX':
+            t = (1, 0, math.tan(math.radians(v[0])), 1, 0, 0)
+        else:
+            t = (1, math.tan(math.radians(v[0])), 0, 1, 0, 0)
+        m = compose(m, t)
+    return m
+
+
+def flatten_quadratic(p0, p1, p2, tolerance):
+    """ returns the points (excluding p0) of a polyline within tolerance of a quadratic bezier. """
+    p0, p1, p2 = np.asarray(p0, float), np.asarray(p1, float), np.asarray(p2, float)
+    # the deviation of n chords is bounded by max|B''|/(8n²).
+    m = 2*np.hypot(*(p0 - 2*p1 + p2))
+    n = max(1, math.ceil(math.sqrt(m/(8*tolerance))))
+    t = (np.arange(1, n + 1)/n)[:, None]
+    return (1 - t)**2*p0 + 2*(1 - t)*t*p1 + t**2*p2
+
+
+def flatten_cubic(p0, p1, p2, p3, tolerance):
+    """ returns the points (excluding p0) of a polyline within tolerance of a cubic bezier. """
+    points = flatten_curve(*(tuple(np.asarray(p, float).tolist()) for p in (p0, p1, p2, p3)), tolerance)
+    return np.array(points[1:])
+
+
+def flatten_arc(p0, rx, ry, rotation, large, sweep, p1, tolerance):
+    """ returns the points (excluding p0) of a polyline within tolerance of an svg elliptical arc. """
+    (x1, y1), (x2, y2) = p0, p1
+    rx, ry = abs(rx), abs(ry)
+    if rx == 0 or ry == 0 or (x1, y1) == (x2, y2):
+        return np.array([[x2, y2]], dtype=float)
+    # endpoint to center parameterization (svg implementation notes, F.6.5).
+    phi = math.radians(rotation)
+    cos, sin = math.cos(phi), math.sin(phi)
+    dx, dy = (x1 - x2)/2, (y1 - y2)/2
+    x1p, y1p = cos*dx + sin*dy, -sin*dx + cos*dy
+    scale = x1p**2/rx**2 + y1p**2/ry**2
+    if scale > 1:
+        rx, ry = rx*math.sqrt(scale), ry*math.sqrt(scale)
+    num = rx**2*ry**2 - rx**2*y1p**2 - ry**2*x1p**2
+    den = rx**2*y1p**2 + ry**2*x1p**2
+    coef = math.sqrt(max(0, num/den))*(-1 if large == sweep else 1)
+    cxp, cyp = coef*rx*y1p/ry, -coef*ry*x1p/rx
+    cx = cos*cxp - sin*cyp + (x1 + x2)/2
+    cy = sin*cxp + cos*cyp + (y1 + y2)/2
+    theta = math.atan2((y1p - cyp)/ry, (x1p - cxp)/rx)
+    dtheta = math.atan2((-y1p - cyp)/ry, (-x1p - cxp)/rx) - theta
+    if sweep and dtheta < 0:
+        dtheta += 2*math.pi
+    elif not sweep and dtheta > 0:
+        dtheta -= 2*math.pi
+    # a chord spanning the angle a deviates r(1 - cos(a/2)) from the arc.
+    r = max(rx, ry)
+    step = 2*math.acos(max(-1.0, 1 - tolerance/r))
+    n = max(1, math.ceil(abs(dtheta)/step))
+    t = theta + dtheta*np.arange(1, n + 1)/n
+    xs = cx + rx*np.cos(t)*cos - ry*np.sin(t)*sin
+    ys = cy + rx*np.cos(t)*sin + ry*np.sin(t)*cos
+    xs[-1], ys[-1] = x2, y2
+    return np.stack([xs, ys], axis=1)
+
+
+def path_polylines(d, tolerance):
+    """ flattens svg path data into a list of (points, closed) polylines. """
+    tokens = SVG_PATH_TOKEN.findall(d or '')
+    polylines = []
+    points = []
+    position = start = np.zeros(2)
+    control = None   # (command, point) of the last curve, for smooth curves
+    command = None
+    i = 0
+
+    def numbers(n):
+        nonlocal i
+        values = [float(t) for t in tokens[i:i + n]]
+        i += n
+        return values
+
+    def flag():
+        # arc flags may be written without separators ('a1 1 0 01 5 5').
+        nonlocal i
+        token = tokens[i]
+        if len(token) > 1 and token[0] in '01':
+            tokens[i] = token[1:]
+            return token[0] == '1'
+        i += 1
+        return float(token) != 0
+
+    def finish(closed):
+        nonlocal points
+        if len(points) > 1:
+            polylines.append((np.array(points), closed))
+        points = []
+
+    while i < len(tokens):
+        if tokens[i].isalpha():
+            command = tokens[i]
+            i += 1
+            if command in 'Zz':
+                finish(True)
+                position, control = start, None
+                points = []
+                continue
+        elif command is None:
+            raise ValueError(f'svg path data does not start with a command: {d[:32]}')
+        relative = command.islower()
+        origin = position if relative else np.zeros(2)
+        c = command.upper()
+        # smooth curves only reflect the control point of a curve of their own kind.
+        previous = control[1] if control is not None and control[0] == {'S': 'C', 'T': 'Q'}.get(c) else None
+        control = None
+        if c == 'M':
+            finish(False)
+            position = start = origin + numbers(2)
+            points = [position]
+            # further coordinate pairs are implicit line commands.
+            command = 'l' if relative else 'L'
+            continue
+        if len(points) == 0:
+            points = [position]
+        if c == 'L':
+            new = [origin + numbers(2)]
+        elif c == 'H':
+            x = numbers(1)[0] + (position[0] if relative else 0)
+            new = [np.array([x, position[1]])]
+        elif c == 'V':
+            y = numbers(1)[0] + (position[1] if relative else 0)
+            new = [np.array([position[0], y])]
+        elif c in 'CS':
+            if c == 'C':
+                p1 = origin + numbers(2)
+            else:
+                p1 = position if previous is None else 2*position - previous
+            p2, p3 = origin + numbers(2), origin + numbers(2)
+            new = list(flatten_cubic(position, p1, p2, p3, tolerance))
+            control = ('C', p2)
+        elif c in 'QT':
+            if c == 'Q':
+                p1 = origin + numbers(2)
+            else:
+                p1 = position if previous is None else 2*position - previous
+            p2 = origin + numbers(2)
+            new = list(flatten_quadratic(position, p1, p2, tolerance))
+            control = ('Q', p1)
+        elif c == 'A':
+            rx, ry, rotation = numbers(3)
+            large, sweep = flag(), flag()
+            p1 = origin + numbers(2)
+            new = list(flatten_arc(position, rx, ry, rotation, large, sweep, p1, tolerance))
+        else:
+            raise ValueError(f'unsupported svg path command: {command}')
+        points += new
+        position = np.asarray(new[-1], dtype=float)
+    finish(False)
+    return polylines
+
+
+class SVGReader:
+    """ Streaming SVG importer.
+
+    Elements are converted into gfx shapes while the document is parsed
+    (iterparse), finished subtrees are discarded right away so memory does
+    not grow with the size of the document. Lines and axis aligned
+    rectangles map onto Line and Rectangle shapes, everything else
+    (polygons, paths, circles, ...) is flattened into lines within the
+    given tolerance (mm). Shapes are grouped by the id of their enclosing
+    <g>, coordinates are in mm.
+    """
+    def __init__(self, tolerance=0.05):
+        self.tolerance = tolerance
+
+    @staticmethod
+    def length(text, default=0.0):
+        """ parses an svg length into mm (unitless lengths are px). """
+        if text is None:
+            return default
+        text = text.strip()
+        number = SVG_NUMBER.match(text)
+        if number is None:
+            return default
+        unit = text[number.end():].strip()
+        return float(number.group())*SVG_UNITS.get(unit, SVG_UNITS[''])
+
+    @staticmethod
+    def color(value, opacity):
+        """ converts an svg paint into a gfx color ('#rrggbb[aa]'), None for 'none'. """
+        value = (value or '').strip()
+        if value == 'none' or value == '':
+            return None
+        value = SVG_COLORS.get(value.lower(), value)
+        if value.startswith('#') and len(value) == 4:
+            value = '#' + ''.join(c*2 for c in value[1:])
+        if not (value.startswith('#') and len(value) == 7):
+            # gradients, rgb() and named colors are imported as black.
+            value = '#000000'
+        if opacity < 1:
+            value += f'{round(opacity*255):02X}'
+        return value
+
+    @staticmethod
+    def style(attrib):
+        """ returns the presentation attributes of an element, style properties take precedence. """
+        style = {k: attrib[k] for k in SVG_INHERITED + ('display', 'visibility') if k in attrib}
+        for declaration in attrib.get('style', '').split(';'):
+            if ':' in declaration:
+                k, v = declaration.split(':', 1)
+                style[k.strip()] = v.strip()
+        return style
+
+    @staticmethod
+    def viewport(attrib):
+        """ transform of the root viewport from user units into mm. """
+        viewbox = [float(v) for v in SVG_NUMBER.findall(attrib.get('viewBox', ''))]
+        if len(viewbox) != 4 or viewbox[2] == 0 or viewbox[3] == 0:
+            scale = SVG_UNITS['px']
+            return (scale, 0, 0, scale, 0, 0)
+        x, y, w, h = viewbox
+        sx = SVGReader.length(attrib.get('width'), w*SVG_UNITS['px'])/w
+        sy = SVGReader.length(attrib.get('height'), h*SVG_UNITS['px'])/h
+        return (sx, 0, 0, sy, -x*sx, -y*sy)
+
+    def read(self, source, buffer=None):
+        """ imports an svg file (name or file object) into a ShapeBuffer. """
+        buffer = ShapeBuffer() if buffer is None else buffer
+        # lines which are not in the buffer yet, and their (width, color, linecap, group).
+        self.chords, self.run = [], None
+        # (element, transform, style, group) of the open elements.
+        stack = []
+        skipping = 0
+        for event, element in ElementTree.iterparse(source, events=('start', 'end')):
+            tag = element.tag.rsplit('}', 1)[-1]
+            if event == 'end':
+                stack.pop()
+                if skipping > 0:
+                    skipping -= 1
+                # drop the finished subtree.
+                element.clear()
+                if len(stack) > 0:
+                    del stack[-1][0][:]
+                continue
+
+            if len(stack) == 0:
+                transform, style, group = self.viewport(element.attrib), {}, None
+            else:
+                _, transform, style, group = stack[-1]
+            if 'transform' in element.attrib:
+                transform = compose(transform, parse_transform(element.get('transform')))
+            style = {**style, **self.style(element.attrib)}
+            if tag == 'g':
+                group = element.get('id') or element.get('class') or group
+            if skipping > 0 or tag in SVG_SKIPPED or style.get('display') == 'none':
+                skipping += 1
+            stack.append((element, transform, style, group))
+            if skipping == 0 and style.get('visibility') not in ('hidden', 'collapse'):
+                self.element(buffer, tag, element.attrib, transform, style, group)
+        self.flush(buffer)
+        return buffer
+
+    def element(self, buffer, tag, attrib, transform, style, group):
+        """ converts a single svg element into shapes. """
+        # lengths in user units.
+        number = lambda k: SVGReader.length(attrib.get(k))/SVG_UNITS['']
+        if tag == 'line':
+            polylines = [(np.array([[number('x1'), number('y1')], [number('x2'), number('y2')]]), False)]
+        elif tag == 'rect':
+            x, y, w, h = number('x'), number('y'), number('width'), number('height')
+            if w <= 0 or h <= 0:
+                return
+            rx = number('rx' if 'rx' in attrib else 'ry')
+            ry = number('ry' if 'ry' in attrib else 'rx')
+            rx, ry = min(rx, w/2), min(ry, h/2)
+            a, b, c, d, e, f = transform
+            if b == 0 and c == 0:
+                self.rectangle(buffer, (a*x + e, d*y + f, a*(x + w) + e, d*(y + h) + f), (abs(a)*rx, abs(d)*ry),
+                               transform, style, group)
+                return
+            d = (f'M{x + rx},{y}H{x + w - rx}A{rx},{ry} 0 0 1 {x + w},{y + ry}V{y + h - ry}'
+                 f'A{rx},{ry} 0 0 1 {x + w - rx},{y + h}H{x + rx}A{rx},{ry} 0 0 1 {x},{y + h - ry}'
+                 f'V{y + ry}A{rx},{ry} 0 0 1 {x + rx},{y}Z')
+            polylines = path_polylines(d, self.tolerance/self.scale(transform))
+        elif tag in ('circle', 'ellipse'):
+            cx, cy = number('cx'), number('cy')
+            rx = number('r') if tag == 'circle' else number('rx')
+            ry = number('r') if tag == 'circle' else number('ry')
+            if rx <= 0 or ry <= 0:
+                return
+            d = f'M{cx + rx},{cy}A{rx},{ry} 0 0 1 {cx - rx},{cy}A{rx},{ry} 0 0 1 {cx + rx},{cy}Z'
+            polylines = path_polylines(d, self.tolerance/self.scale(transform))
+        elif tag in ('polygon', 'polyline'):
+            values = [float(v) for v in SVG_NUMBER.findall(attrib.get('points', ''))]
+            points = np.array(values[:len(values)//2*2]).reshape(-1, 2)
+            polylines = [(points, tag == 'polygon')] if len(points) > 1 else []
+        elif tag == 'path':
+            polylines = path_polylines(attrib.get('d'), self.tolerance/self.scale(transform))
+        else:
+            return
+        self.lines(buffer, polylines, transform, style, group)
+
+    @staticmethod
+    def scale(transform):
+        """ mean scale factor of a transform. """
+        a, b, c, d, _, _ = transform
+        return math.sqrt(abs(a*d - b*c)) or 1.0
+
+    def paint(self, style, transform):
+        """ returns the (stroke color, fill color, stroke width) of a styled element. """
+        opacity = float(style.get('opacity', 1))
+        stroke = self.color(style.get('stroke', 'none'), opacity*float(style.get('stroke-opacity', 1)))
+        fill = self.color(style.get('fill', 'black'), opacity*float(style.get('fill-opacity', 1)))
+        width = self.length(style.get('stroke-width', '1'), 1.0)/SVG_UNITS['']
+        return stroke, fill, width*self.scale(transform) if stroke is not None else 0.0
+
+    def rectangle(self, buffer, rect, radii, transform, style, group):
+        stroke, fill, width = self.paint(style, transform)
+        if stroke is None and fill is None:
+            return
+        self.flush(buffer)
+        x0, y0, x1, y1 = rect
+        buffer.append(Rectangle(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1),
+                                width=width,
+                                fill=stroke is None,
+                                color=stroke or fill,
+                                rx=radii[0],
+                                ry=radii[1],
+                                group=group))
+
+    def lines(self, buffer, polylines, transform, style, group):
+        """ adds the chords of polylines as lines, filled outlines are imported as their outline. """
+        stroke, fill, width = self.paint(style, transform)
+        if stroke is None and fill is None:
+            return
+        a, b, c, d, e, f = transform
+        linecap = style.get('stroke-linecap') if style.get('stroke-linecap') in LINECAPS else 'butt'
+        # consecutive elements of the same style are added to the buffer at once.
+        run = (width, stroke or fill, linecap, group)
+        if run != self.run:
+            self.flush(buffer)
+            self.run = run
+        # most elements only have a handful of points, plain python beats numpy here.
+        for points, closed in polylines:
+            points = points.tolist()
+            if closed and points[0] != points[-1]:
+                points.append(points[0])
+            xy = [(a*x + c*y + e, b*x + d*y + f) for x, y in points]
+            # degenerate chords (e.g. arcs of zero radius) are dropped.
+            self.chords += [(x0, y0, x1, y1) for (x0, y0), (x1, y1) in zip(xy, xy[1:]) if (x0, y0) != (x1, y1)]
+
+    def flush(self, buffer):
+        """ adds the pending lines of the current style run to the buffer. """
+        if len(self.chords) > 0:
+            width, color, linecap, group = self.run
+            buffer.add_lines(*np.array(self.chords).T, width=width, color=color, linecap=linecap, group=group)
+            self.chords = []
 
 
 class SVG:
     def __init__(self, filename, shapes=[]):
         self.filename = filename
-        self.groups = {}
-        width, height = self.get_size_from(shapes)
-        self.dwg = svgwrite.drawing.Drawing(
-            self.filename,
-            profile='full',
-            size=(f'{width}mm', f'{height}mm'),
-            viewBox=f'0 0 {width} {height}',
-        )
+        self.sources = []
 
         # TODO maybe remove this.
         self.scale = 1#3.543307 # not sure if this is necessary.
-        self.scale_group = self.dwg.g(transform=f'scale({self.scale})')
-        self.dwg.add(self.scale_group)
 
         if len(shapes) > 0:
             self.from_shapes(shapes)
 
-    def get_size_from(self, shapes):
-        return (
-            max([s.get_width() for s in shapes]),
-            max([s.get_height() for s in shapes]),
-        )
+    def bounds(self):
+        """ returns the document extents, measured from the origin. """
+        xmin, ymin, xmax, ymax = union_bounds([bounds_of(shapes) for shapes in self.sources]) or (0, 0, 0, 0)
+        return (min(0, xmin), min(0, ymin), xmax, ymax)
 
-    def import_from_file(self):
-        # TODO (coco|2023.10.14) import from file
-        pass
+    def import_from_file(self, tolerance=0.05):
+        """ imports the shapes of the svg file (see SVGReader), returns them as a ShapeBuffer. """
+        shapes = SVGReader(tolerance).read(self.filename)
+        self.from_shapes(shapes)
+        return shapes
 
     def to_shapes(self):
-        # TODO (coco|2023.10.14) take an existing SVG and convert to a list of our internal representation of shapes
-        pass
+        """ returns all shapes of the document as a single ShapeBuffer. """
+        return ShapeBuffer.concatenate(self.sources)
 
     def from_shapes(self, shapes):
-        for shape in shapes:
-            if shape.group not in self.groups and shape.group != None:
-                self.groups[shape.group] = self.dwg.g(id=shape.group)
-                self.scale_group.add(self.groups[shape.group])
-
-            group = self.dwg if shape.group == None else self.groups[shape.group]
-            c = SVG.convert_hex_color(shape.color)
-
-            if shape.__class__ is Line:
-                group.add(self.dwg.line(
-                    (shape.x0, shape.y0),
-                    (shape.x1, shape.y1),
-                    stroke=c[0],
-                    stroke_opacity=c[1],
-                    stroke_width=shape.width,
-                    stroke_linecap=shape.linecap
-                ))
-            if shape.__class__ is Rectangle:
-                group.add(self.dwg.rect(
-                    (shape.x0, shape.y0),
-                    ((shape.x1-shape.x0), (shape.y1-shape.y0)),
-                    rx=shape.rx,
-                    ry=shape.ry,
-                    fill='none' if not shape.fill else c[0],
-                    opacity=c[1],
-                    stroke=c[0],
-                    stroke_width=0 if shape.fill else shape.width,
-                ))
-            if shape.__class__ is Diamond:
-                group.add(self.dwg.polygon(
-                    [(shape.x0, shape.y0),
-                     (shape.x1, shape.y1),
-                     (shape.x2, shape.y2),
-                     (shape.x3, shape.y3)],
-                    fill='none' if shape.fill < 1 else c[0],
-                    stroke=c[0],
-                    stroke_width=shape.stroke_width,
-                    stroke_linejoin='round',
-                ))
-                self.from_shapes(shape.fill_lines)
+        """ queues shapes (a list, ShapeBuffer or ShapeView) to be streamed out on save. """
+        self.sources.append(shapes)
+
+    @staticmethod
+    def group_order(shapes):
+        """ stable ordering of shapes which keeps each group contiguous (groups in first-seen order). """
+        if isinstance(shapes, ShapeRecords):
+            groups = shapes.data['group']
+        else:
+            ids = {}
+            groups = np.array([ids.setdefault(s.group, len(ids)) for s in shapes], dtype=np.int64)
+        if len(groups) == 0:
+            return groups
+        uniques, first = np.unique(groups, return_index=True)
+        rank = np.zeros(uniques.max() + 1, dtype=np.int64)
+        rank[uniques] = np.argsort(np.argsort(first))
+        return np.argsort(rank[groups], kind='stable')
 
     @staticmethod
     def convert_hex_color(hexc):
@@ -299,4 +1739,55 @@ class SVG:
         return (hexc[:-2], f'{(int(hexc[-2:], 16)/255):.2f}')
 
     def save(self):
-        self.dwg.save(pretty=True)
+        with open(self.filename, 'w') as fd:
+            self.write(fd)
+
+    def write(self, fd):
+        """ streams the document to a file object. """
+        xmin, ymin, xmax, ymax = self.bounds()
+        writer = SVGWriter(fd, xmax - xmin, ymax - ymin, origin=(xmin, ymin), scale=self.scale)
+        for shapes in self.sources:
+            if isinstance(shapes, CellArray):
+                writer.write_cells(shapes)
+                continue
+            order = SVG.group_order(shapes)
+            if isinstance(shapes, ShapeRecords):
+                writer.write_buffer(shapes, order)
+            else:
+                for i in order:
+                    writer.write(shapes[i])
+        writer.close()
+
+
+class DXF:
+    """ DXF document of gfx shapes, streamed out on save (see DXFWriter). """
+    def __init__(self, filename, shapes=[]):
+        self.filename = filename
+        self.sources = []
+        if len(shapes) > 0:
+            self.from_shapes(shapes)
+
+    def from_shapes(self, shapes):
+        """ queues shapes (a list, ShapeBuffer or ShapeView) to be streamed out on save. """
+        self.sources.append(shapes)
+
+    def layers(self):
+        groups = set()
+        for shapes in self.sources:
+            if isinstance(shapes, ShapeRecords):
+                groups.update(shapes.groups[g] for g in np.unique(shapes.data['group']).tolist())
+            else:
+                groups.update(s.group for s in shapes)
+        return groups
+
+    def save(self):
+        bounds = union_bounds([bounds_of(shapes) for shapes in self.sources]) or (0, 0, 0, 0)
+        with open(self.filename, 'w') as fd:
+            writer = DXFWriter(fd, bounds, self.layers())
+            for shapes in self.sources:
+                if isinstance(shapes, ShapeRecords):
+                    writer.write_buffer(shapes)
+                else:
+                    for shape in shapes:
+                        writer.write(shape)
+            writer.close()
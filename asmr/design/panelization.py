@@ -0,0 +1,251 @@
+""" Panelization of capacitive touch sensors.
+
+Sensors are placed in rows on a panel with a rail (frame) around them.
+The boards are separated by routed channels which are bridged by tabs
+perforated with mouse-bites, fiducials sit in the corners of the rail.
+Every distinct sensor design is generated once and instanced for each
+of its boards.
+"""
+
+import json
+import math
+import pathlib
+
+import asmr.kicad
+from .capacitive_grid import CapacitiveGridGenerator, GridPattern
+from .gfx import SVGWriter, union_bounds
+
+
+class Placement:
+    """ board of a sensor design on the panel. """
+    def __init__(self, design, x, y, width, height):
+        self.design = design
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+    def rect(self):
+        return (self.x, self.y, self.x + self.width, self.y + self.height)
+
+
+class Tab:
+    """ bridge across a channel, spanning (lo, hi) along the edges at x or y = start..end. """
+    def __init__(self, axis, start, end, lo, hi):
+        self.axis = axis   # 0: crosses a vertical channel, 1: a horizontal one
+        self.start = start
+        self.end = end
+        self.lo = lo
+        self.hi = hi
+
+
+class SensorPanel:
+    def __init__(self,
+                 filename,
+                 width=None,           # max width of the board area (mm), default: square-ish
+                 spacing=2.0,          # width of the routed channels (mm)
+                 rail=5.0,             # width of the panel frame (mm)
+                 board_margin=1.0,     # copper-free margin around each sensor (mm)
+                 tab_width=3.0,
+                 tab_pitch=40.0,       # approximate distance between tabs on an edge (mm)
+                 hole_diameter=0.5,    # mouse-bite perforation
+                 hole_pitch=0.8,
+                 fiducials=True):
+        self.filename = filename
+        self.ext = pathlib.Path(filename).suffix[1:]
+        self.width = width
+        self.spacing = spacing
+        self.rail = rail
+        self.board_margin = board_margin
+        self.tab_width = tab_width
+        self.tab_pitch = tab_pitch
+        self.hole_diameter = hole_diameter
+        self.hole_pitch = hole_pitch
+        self.fiducials = fiducials
+        self.designs = []     # (generator, pattern, grid)
+        self.instances = []   # design index per board, in placement order
+        self._keys = {}
+
+    def add(self, generator: CapacitiveGridGenerator, pattern: GridPattern, count=1) -> int:
+        """ adds count boards of a sensor design, returns the design index. """
+        key = json.dumps({**vars(generator), 'pattern': pattern.value}, sort_keys=True, default=str)
+        if key not in self._keys:
+            stem = pathlib.Path(self.filename).stem
+            grid = generator.new_grid(f'{stem}-sensor{len(self.designs)}.kicad_mod')
+            generator.build(pattern, grid)
+            self._keys[key] = len(self.designs)
+            self.designs.append((generator, pattern, grid))
+        design = self._keys[key]
+        self.instances += [design]*count
+        return design
+
+    def design_bounds(self, design):
+        grid = self.designs[design][2]
+        return union_bounds([layer.bounds() for layer in grid.layers.values()])
+
+    def layout(self) -> list:
+        """ places the boards left to right in rows, returns them. """
+        sizes = []
+        for design in range(len(self.designs)):
+            xmin, ymin, xmax, ymax = self.design_bounds(design)
+            sizes.append((xmax - xmin + 2*self.board_margin, ymax - ymin + 2*self.board_margin))
+
+        width = self.width
+        if width is None:
+            columns = math.ceil(math.sqrt(len(self.instances)))
+            width = max(w for w, _ in sizes)*columns + self.spacing*(columns - 1)
+
+        boards = []
+        origin = self.rail + self.spacing
+        x, y, row_height = origin, origin, 0
+        for design in self.instances:
+            w, h = sizes[design]
+            if x > origin and x + w > origin + width:
+                x, y, row_height = origin, y + row_height + self.spacing, 0
+            boards.append(Placement(design, x, y, w, h))
+            x += w + self.spacing
+            row_height = max(row_height, h)
+        return boards
+
+    def frame(self, boards):
+        """ returns the outer and inner extents of the rail. """
+        xmax = max(b.x + b.width for b in boards)
+        ymax = max(b.y + b.height for b in boards)
+        inner = (self.rail, self.rail, xmax + self.spacing, ymax + self.spacing)
+        outer = (0, 0, inner[2] + self.rail, inner[3] + self.rail)
+        return outer, inner
+
+    def route(self, boards, inner):
+        """ computes the tabs and the routed channel outlines.
+
+        Edges are (axis, position, lo, hi, normal): axis 0 edges are
+        vertical lines at x=position spanning y=lo..hi. Tabs are only
+        placed from right/bottom board edges (to boards or the rail) and
+        from left/top board edges to the rail, so every bridge is found
+        once. Returns the tabs and the outline segments (x0, y0, x1, y1).
+        """
+        edges = []
+        for b in boards:
+            x0, y0, x1, y1 = b.rect()
+            edges += [(0, x0, y0, y1, -1, b), (0, x1, y0, y1, 1, b), (1, y0, x0, x1, -1, b), (1, y1, x0, x1, 1, b)]
+        rail = [
+            (0, inner[0], inner[1], inner[3], 1, None),
+            (0, inner[2], inner[1], inner[3], -1, None),
+            (1, inner[1], inner[0], inner[2], 1, None),
+            (1, inner[3], inner[0], inner[2], -1, None),
+        ]
+
+        tabs = []
+        cuts = {id(e): [] for e in edges + rail}
+        for edge in edges:
+            axis, position, lo, hi, normal, _ = edge
+            n = max(1, round((hi - lo) / self.tab_pitch))
+            for k in range(n):
+                c = lo + (k + 0.5)*(hi - lo)/n
+                a, b = c - self.tab_width/2, c + self.tab_width/2
+                if a <= lo or b >= hi:
+                    continue
+                # nearest facing edge across the channel which overlaps the tab.
+                facing = [e for e in edges + rail
+                          if e[0] == axis and e[4] == -normal and normal*(e[1] - position) > 0 and e[2] < b and e[3] > a]
+                if len(facing) == 0:
+                    continue
+                target = min(facing, key=lambda e: abs(e[1] - position))
+                if target[2] > a or target[3] < b:
+                    continue
+                if normal < 0 and target[5] is not None:
+                    continue
+                tabs.append(Tab(axis, position, target[1], a, b))
+                cuts[id(edge)].append((a, b))
+                cuts[id(target)].append((a, b))
+
+        segments = []
+        for edge in edges + rail:
+            axis, position, lo, hi, _, _ = edge
+            start = lo
+            for a, b in sorted(cuts[id(edge)]) + [(hi, hi)]:
+                if a > start:
+                    segments.append((position, start, position, a) if axis == 0 else (start, position, a, position))
+                start = max(start, b)
+        for tab in tabs:
+            for side in (tab.lo, tab.hi):
+                segments.append((tab.start, side, tab.end, side) if tab.axis == 0 else (side, tab.start, side, tab.end))
+        return tabs, segments
+
+    def mouse_bites(self, tabs):
+        """ returns the (x, y) perforation holes along both ends of every tab. """
+        holes = []
+        d = self.hole_diameter
+        for tab in tabs:
+            n = math.floor((tab.hi - tab.lo - 2*d) / self.hole_pitch) + 1
+            if n < 1:
+                continue
+            first = (tab.lo + tab.hi)/2 - (n - 1)*self.hole_pitch/2
+            for position in (tab.start, tab.end):
+                for i in range(n):
+                    along = first + i*self.hole_pitch
+                    holes.append((position, along) if tab.axis == 0 else (along, position))
+        return holes
+
+    def fiducial_positions(self, outer):
+        """ three asymmetric fiducials in the rail corners. """
+        if not self.fiducials:
+            return []
+        r = self.rail/2
+        return [(outer[0] + r, outer[1] + r), (outer[2] - r, outer[1] + r), (outer[0] + r, outer[3] - r)]
+
+    def offset(self, board):
+        """ translation of a design's shapes onto its board. """
+        xmin, ymin, _, _ = self.design_bounds(board.design)
+        return (board.x + self.board_margin - xmin, board.y + self.board_margin - ymin)
+
+    def save(self):
+        boards = self.layout()
+        outer, inner = self.frame(boards)
+        tabs, segments = self.route(boards, inner)
+        holes = self.mouse_bites(tabs)
+        fiducials = self.fiducial_positions(outer)
+        x0, y0, x1, y1 = outer
+        segments += [(x0, y0, x1, y0), (x1, y0, x1, y1), (x1, y1, x0, y1), (x0, y1, x0, y0)]
+
+        if self.ext == 'svg':
+            self.save_svg(boards, outer, segments, holes, fiducials)
+        elif self.ext == 'kicad_pcb':
+            self.save_kicad_pcb(boards, segments, holes, fiducials)
+        else:
+            raise ValueError(f'unsupported panel format: {self.filename}')
+
+    def save_svg(self, boards, outer, segments, holes, fiducials):
+        with open(self.filename, 'w') as fd:
+            writer = SVGWriter(fd, outer[2], outer[3])
+            for i, (_, _, grid) in enumerate(self.designs):
+                writer.define(f'sensor-{i}', [
+                    grid.layers['electrodes'],
+                    grid.layers['solder_mask'],
+                    grid.layers['silkscreen'],
+                ])
+            writer.set_group('boards')
+            for board in boards:
+                writer.use(f'sensor-{board.design}', *self.offset(board))
+            writer.set_group('edge_cuts')
+            for x0, y0, x1, y1 in segments:
+                writer.line(x0, y0, x1, y1, asmr.kicad.EDGE_CUTS_WIDTH, '#000000', 'round')
+            for x, y in holes:
+                writer.circle(x, y, self.hole_diameter/2, asmr.kicad.EDGE_CUTS_WIDTH, False, '#000000')
+            writer.set_group('fiducials')
+            for x, y in fiducials:
+                writer.circle(x, y, asmr.kicad.FIDUCIAL_DIAMETER/2 + asmr.kicad.FIDUCIAL_MASK_MARGIN, 0, True, '#86ff3b57')
+                writer.circle(x, y, asmr.kicad.FIDUCIAL_DIAMETER/2, 0, True, '#000000')
+            writer.close()
+
+    def save_kicad_pcb(self, boards, segments, holes, fiducials):
+        pcb = asmr.kicad.Board(self.filename)
+        for i, (_, _, grid) in enumerate(self.designs):
+            pcb.add_footprint(grid.footprint(), [self.offset(b) for b in boards if b.design == i])
+        for segment in segments:
+            pcb.add_edge_cut(*segment)
+        for x, y in holes:
+            pcb.add_hole(x, y, self.hole_diameter)
+        for x, y in fiducials:
+            pcb.add_fiducial(x, y)
+        pcb.save()
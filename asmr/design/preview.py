@@ -0,0 +1,201 @@
+""" Live preview of design specs in the browser.
+
+The designs of a spec (see spec.Workspace) are regenerated whenever it
+changes and the svg previews of the updated designs are pushed to every
+open page over a websocket. Only the standard library is used: the page
+is served by http.server and the websocket is minimal (text messages
+from the server to the page, no fragmentation).
+"""
+
+import base64
+import hashlib
+import http.server
+import json
+import threading
+
+from .spec import Workspace
+
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+PAGE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>asmr design preview</title>
+<style>
+  body { font-family: sans-serif; margin: 1em; background: #f4f4f4; }
+  figure { display: inline-block; margin: 0 1em 1em 0; padding: 0.5em; background: #fff; }
+  figcaption { font-size: small; color: #555; }
+  img { max-width: 90vw; max-height: 80vh; }
+  #status { font-size: small; color: #555; }
+  #status.error { color: #c00; white-space: pre-wrap; }
+</style>
+</head>
+<body>
+<div id="status">connecting...</div>
+<div id="designs"></div>
+<script>
+const designs = document.getElementById('designs');
+const status = document.getElementById('status');
+const figures = {};
+
+function update(message) {
+  status.className = message.error ? 'error' : '';
+  status.textContent = message.error || `revision ${message.revision}`;
+  for (const name of Object.keys(figures)) {
+    if (!message.names.includes(name)) {
+      figures[name].remove();
+      delete figures[name];
+    }
+  }
+  for (const [name, svg] of Object.entries(message.previews)) {
+    if (!(name in figures)) {
+      const figure = figures[name] = document.createElement('figure');
+      figure.innerHTML = '<img><figcaption></figcaption>';
+      figure.querySelector('figcaption').textContent = name;
+      designs.appendChild(figure);
+    }
+    // every design is its own image, so their ids (e.g. svg cells) can't clash.
+    const img = figures[name].querySelector('img');
+    URL.revokeObjectURL(img.src);
+    img.src = URL.createObjectURL(new Blob([svg], {type: 'image/svg+xml'}));
+  }
+}
+
+function connect() {
+  const socket = new WebSocket(`ws://${location.host}/ws`);
+  socket.onmessage = (event) => update(JSON.parse(event.data));
+  socket.onclose = () => {
+    status.textContent = 'disconnected, reconnecting...';
+    setTimeout(connect, 1000);
+  };
+}
+connect();
+</script>
+</body>
+</html>
+'''
+
+
+def websocket_accept(key: str) -> str:
+    """ the Sec-WebSocket-Accept answer to a handshake key. """
+    return base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+
+
+def websocket_frame(text: str) -> bytes:
+    """ an unmasked text frame (server to client). """
+    payload = text.encode()
+    n = len(payload)
+    if n < 126:
+        header = bytes([0x81, n])
+    elif n < 2**16:
+        header = bytes([0x81, 126]) + n.to_bytes(2, 'big')
+    else:
+        header = bytes([0x81, 127]) + n.to_bytes(8, 'big')
+    return header + payload
+
+
+class PreviewHandler(http.server.BaseHTTPRequestHandler):
+    """ Serves the preview page and its websocket. """
+    def do_GET(self):
+        if self.path == '/':
+            body = PAGE.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == '/ws' and 'Sec-WebSocket-Key' in self.headers:
+            self.send_response(101)
+            self.send_header('Upgrade', 'websocket')
+            self.send_header('Connection', 'Upgrade')
+            self.send_header('Sec-WebSocket-Accept', websocket_accept(self.headers['Sec-WebSocket-Key']))
+            self.end_headers()
+            self.push()
+        else:
+            self.send_error(404)
+
+    def push(self):
+        """ sends the previews to the page whenever they change, until it goes away. """
+        server = self.server.preview
+        revision, previews = -1, {}
+        try:
+            while True:
+                revision, message = server.changes(revision, previews)
+                self.wfile.write(websocket_frame(message))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PreviewServer:
+    """ Regenerates a spec and publishes its previews to the connected pages. """
+    def __init__(self, spec, host='127.0.0.1', port=8000):
+        self.workspace = Workspace(spec, preview=True)
+        self.condition = threading.Condition()
+        self.revision = 0
+        self.previews = {}   # name -> (revision, svg markup)
+        self.error = None
+        self.httpd = http.server.ThreadingHTTPServer((host, port), PreviewHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.preview = self
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def start(self):
+        """ serves the page from a background thread. """
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def update(self) -> list:
+        """ regenerates the spec and wakes up the pages.
+
+        returns the results of Workspace.regenerate, or None when it failed
+        (e.g. while the spec is being edited). the error is kept in
+        self.error and shown on the pages.
+        """
+        try:
+            results = self.workspace.regenerate()
+            error = None
+        except Exception as e:
+            results, error = None, f'{self.workspace.path}: {e}'
+        with self.condition:
+            self.revision += 1
+            self.error = error
+            for name, svg in self.workspace.previews.items():
+                if name not in self.previews or self.previews[name][1] is not svg:
+                    self.previews[name] = (self.revision, svg)
+            for name in set(self.previews) - set(self.workspace.previews):
+                del self.previews[name]
+            self.condition.notify_all()
+        return results
+
+    def changes(self, revision, sent) -> tuple:
+        """ blocks until there is a revision newer than the given one.
+
+        returns the new revision and the message of the designs which
+        changed since (sent maps names to the revision the page has).
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.revision > revision)
+            previews = {name: svg for name, (rev, svg) in self.previews.items() if sent.get(name) != rev}
+            sent.clear()
+            sent.update({name: rev for name, (rev, _) in self.previews.items()})
+            message = json.dumps({
+                'revision': self.revision,
+                'error': self.error,
+                'names': list(self.previews),
+                'previews': previews,
+            })
+            return self.revision, message
@@ -0,0 +1,145 @@
+""" Design specs: several designs described in one TOML file.
+
+    [[touch-grid]]
+    filename = ["grid.svg", "grid.kicad_mod"]
+    pattern = "diamond"
+    size = [8, 6]
+    fmt = "0.6,#|0.6,#"
+
+    [[eurorack-panel]]
+    filename = "panel.svg"
+    hp = 8
+    hu = 3
+
+    [[kicad-symbol]]
+    filename = "mcu.kicad_sym"
+    pins = "mcu-pins.csv"
+
+Entries take the parameters of their generator (CapacitiveGridGenerator
+for touch grids, EurorackPanel for panels, kicad.Symbol for symbols),
+filenames and pin tables are relative to the spec file.
+"""
+
+import io
+import os
+import pathlib
+import time
+
+import toml
+
+from .capacitive_grid import CapacitiveGridGenerator, GridPattern
+from .eurorack import EurorackPanel
+
+
+# generator parameters which are tuples (toml only has lists).
+GRID_TUPLES = ('size', 'resolution', 'silk_scaling')
+
+
+def load(path) -> dict:
+    return toml.load(pathlib.Path(path))
+
+
+def plain(value):
+    """ rebuilds the tables and arrays of a toml value as plain dicts and lists.
+
+    inline tables are dict subclasses which can't be pickled (to workers).
+    """
+    if isinstance(value, dict):
+        return {k: plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [plain(v) for v in value]
+    return value
+
+
+def entries(spec: dict, kind: str, root: pathlib.Path):
+    """ yields the parameters and output filenames of every design of a kind. """
+    for entry in spec.get(kind, []):
+        params = plain(entry)
+        filenames = params.pop('filename')
+        if isinstance(filenames, str):
+            filenames = [filenames]
+        yield params, [str(root/f) for f in filenames]
+
+
+def touch_grids(spec: dict, root: pathlib.Path) -> list:
+    """ the touch grids of a spec as (generator, pattern, filenames). """
+    grids = []
+    for params, filenames in entries(spec, 'touch-grid', root):
+        pattern = GridPattern(params.pop('pattern', GridPattern.Interleaved.value))
+        for name in GRID_TUPLES:
+            if name in params:
+                params[name] = tuple(params[name])
+        grids.append((CapacitiveGridGenerator(**params), pattern, filenames))
+    return grids
+
+
+def eurorack_panels(spec: dict, root: pathlib.Path) -> list:
+    """ the eurorack panels of a spec as (parameters, filenames). """
+    return list(entries(spec, 'eurorack-panel', root))
+
+
+class Workspace:
+    """ Regenerates the designs of a spec file, reusing the previous run.
+
+    Grids are matched up by their filenames: when the parameters of a grid
+    are edited only the layers which depend on them are rebuilt (see
+    CapacitiveGrid.stale), unchanged designs are not exported again.
+    With preview, the svg markup of every updated design is kept in
+    previews (keyed by its first filename).
+    """
+    def __init__(self, path, preview=False):
+        self.path = pathlib.Path(path).resolve()
+        self.preview = preview
+        self.grids = {}
+        self.panels = {}
+        self.previews = {}
+
+    def regenerate(self) -> list:
+        """ reloads the spec and updates its outputs.
+
+        returns (filenames, rebuilt layers, seconds) for every design.
+        """
+        spec = load(self.path)
+        results = []
+        grids = {}
+        for generator, pattern, filenames in touch_grids(spec, self.path.parent):
+            start = time.perf_counter()
+            grid = generator.new_grid(filenames[0])
+            filenames = [grid.filename] + filenames[1:]
+            previous = self.grids.get(tuple(filenames))
+            if previous is not None:
+                grid.reuse(previous)
+            rebuilt = generator.build(pattern, grid)
+            if len(rebuilt) > 0 or not all(os.path.exists(f) for f in filenames):
+                grid.export(filenames)
+                self.render(filenames[0], grid)
+            grids[tuple(filenames)] = grid
+            results.append((filenames, rebuilt, time.perf_counter() - start))
+
+        panels = {}
+        for params, filenames in eurorack_panels(spec, self.path.parent):
+            start = time.perf_counter()
+            panel, previous = self.panels.get(tuple(filenames), (None, None))
+            rebuilt = []
+            if previous != params or not all(os.path.exists(f) for f in filenames):
+                panel = EurorackPanel(filenames[0], **params)
+                panel.render()
+                for filename in filenames:
+                    panel.save(filename)
+                self.render(filenames[0], panel)
+                rebuilt = ['outline']
+            panels[tuple(filenames)] = (panel, params)
+            results.append((filenames, rebuilt, time.perf_counter() - start))
+
+        self.grids = grids
+        self.panels = panels
+        names = [f[0] for f in list(grids) + list(panels)]
+        self.previews = {name: svg for name, svg in self.previews.items() if name in names}
+        return results
+
+    def render(self, name, design):
+        """ keeps the svg preview of a grid or panel. """
+        if self.preview:
+            fd = io.StringIO()
+            design.svg().write(fd)
+            self.previews[name] = fd.getvalue()
@@ -124,9 +124,10 @@ class FileSystemWatcher(FileSystemEventHandler):
     (https://michaelcho.me/article/using-pythons-watchdog-to-monitor-changes-to-a-directory)
     """
 
-    def __init__(self, ignore: t.List[pathlib.Path]=[]):
+    def __init__(self, ignore: t.List[pathlib.Path]=[], interval=0.3):
         super()
         self.ignore = ignore
+        self.interval = interval
         self.events = []
 
 
@@ -134,7 +135,7 @@ class FileSystemWatcher(FileSystemEventHandler):
         """ event generator. """
         while True:
             while len(self.events) == 0:
-                time.sleep(0.3)
+                time.sleep(self.interval)
 
             while len(self.events) != 0:
                 event = self.events.pop()
@@ -157,10 +158,11 @@ class FileSystemWatcher(FileSystemEventHandler):
 
 
 def watch(paths: pathlib.Path,
-          ignore: t.List[pathlib.Path]=[]) -> t.Iterator[pathlib.Path]:
-    """ watch directories and file. """
-    event_handler = FileSystemWatcher(ignore)
-    observer = PollingObserver()
+          ignore: t.List[pathlib.Path]=[],
+          interval=1.0) -> t.Iterator[pathlib.Path]:
+    """ watch directories and file, polled every interval seconds. """
+    event_handler = FileSystemWatcher(ignore, interval=min(0.3, interval))
+    observer = PollingObserver(timeout=interval)
     for path in paths:
         observer.schedule(event_handler, str(path), recursive=True)
     observer.start()
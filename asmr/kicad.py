@@ -1,11 +1,16 @@
 """ AMSR KiCAD Tools"""
 
+import csv
+import functools
+import io
 import os
-import math
+import re
 import uuid
 from pathlib import Path
 
 import jinja2
+import numpy as np
+import toml
 
 import asmr.design.gfx
 
@@ -15,11 +20,105 @@ FOOTPRINT_EXT = 'kicad_mod'
 SYMBOL_EXT = 'kicad_sym'
 FOOTPRINT_TEMPLATE = Path(f'{DIR_PATH}/templates/footprint.{FOOTPRINT_EXT}.jinja')
 SYMBOL_TEMPLATE = Path(f'{DIR_PATH}/templates/symbol.{SYMBOL_EXT}.jinja')
+TSTAMP_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, 'https://github.com/asmr-systems/toolkit')
+COURTYARD_CLEARANCE = 0.25
+COURTYARD_WIDTH = 0.05
+EDGE_CUTS_WIDTH = 0.05
+FIDUCIAL_DIAMETER = 1.0
+FIDUCIAL_MASK_MARGIN = 0.5
+BOARD_LAYERS = (
+    '(0 "F.Cu" signal)',
+    '(31 "B.Cu" signal)',
+    '(36 "B.SilkS" user "B.Silkscreen")',
+    '(37 "F.SilkS" user "F.Silkscreen")',
+    '(38 "B.Mask" user)',
+    '(39 "F.Mask" user)',
+    '(44 "Edge.Cuts" user)',
+    '(46 "B.CrtYd" user "B.Courtyard")',
+    '(47 "F.CrtYd" user "F.Courtyard")',
+)
 
-def render_template(output_filename, template, context):
+@functools.lru_cache(maxsize=None)
+def load_template(template):
+    """ reads and compiles a jinja template once per process. """
     with open(template, 'r') as fd:
-        t = jinja2.Template(fd.read())
-    t.stream(**context).dump(str(Path.cwd()/output_filename))
+        return jinja2.Template(fd.read())
+
+def render_template(output_filename, template, context):
+    load_template(Path(template)).stream(**context).dump(str(Path.cwd()/output_filename))
+
+SEXPR_TOKEN = re.compile(r'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"]+))')
+
+
+def parse_sexpr(text):
+    """ parses kicad s-expressions into nested lists of strings. """
+    stack = [[]]
+    for m in SEXPR_TOKEN.finditer(text):
+        if m.group(1) is not None:
+            stack.append([])
+        elif m.group(2) is not None:
+            expr = stack.pop()
+            stack[-1].append(expr)
+        elif m.group(3) is not None:
+            stack[-1].append(m.group(3))
+        else:
+            stack[-1].append(m.group(4))
+    return stack[0]
+
+
+def read_footprint_pads(filename) -> dict:
+    """ minimal .kicad_mod reader for the copper primitives of custom pads.
+
+    returns {pad: {'lines': [(x0, y0, x1, y1, width)], 'polygons': [([(x, y)], width, fill)]}}
+    in footprint coordinates. pads are merged by their number.
+    """
+    def field(expr, name):
+        return next((e for e in expr[1:] if isinstance(e, list) and e and e[0] == name), None)
+
+    with open(filename) as fd:
+        footprint = parse_sexpr(fd.read())[0]
+    pads = {}
+    for pad in footprint[1:]:
+        if not isinstance(pad, list) or pad[0] != 'pad':
+            continue
+        px, py = (float(v) for v in field(pad, 'at')[1:3])
+        primitives = pads.setdefault(pad[1], {'lines': [], 'polygons': []})
+        for primitive in (field(pad, 'primitives') or [])[1:]:
+            width = float(field(primitive, 'width')[1])
+            if primitive[0] == 'gr_line':
+                (x0, y0), (x1, y1) = ((float(v) for v in field(primitive, k)[1:3]) for k in ('start', 'end'))
+                primitives['lines'].append((x0 + px, y0 + py, x1 + px, y1 + py, width))
+            elif primitive[0] == 'gr_poly':
+                points = [(float(xy[1]) + px, float(xy[2]) + py) for xy in field(primitive, 'pts')[1:]]
+                fill = field(primitive, 'fill')
+                primitives['polygons'].append((points, width, fill[1] if fill else 'none'))
+    return pads
+
+
+class TstampProvider:
+    """ Deterministic tstamp generator for the primitives of a kicad object.
+
+    Every tstamp shares the uuid5 of the object name (within TSTAMP_NAMESPACE)
+    and carries the primitive's index in its 48 low bits, so identical inputs
+    always produce identical files and tstamps are only string formatting.
+    """
+    def __init__(self, name):
+        self.prefix = str(uuid.uuid5(TSTAMP_NAMESPACE, name))[:24]
+        self.index = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        tstamp = f'{self.prefix}{self.index:012x}'
+        self.index += 1
+        return tstamp
+
+    def take(self, n):
+        """ returns the next n tstamps. """
+        tstamps = [f'{self.prefix}{i:012x}' for i in range(self.index, self.index + n)]
+        self.index += n
+        return tstamps
 
 class Line:
     def __init__(self,
@@ -29,7 +128,7 @@ class Line:
                  y1,
                  width,
                  layer="F.SilkS"):
-        self.uuid = uuid.uuid4()
+        self.uuid = None
         self.x0 = x0
         self.y0 = y0
         self.x1 = x1
@@ -56,7 +155,7 @@ class Rectangle:
                  y1,
                  width=0,
                  layer="F.SilkS"):
-        self.uuid = uuid.uuid4()
+        self.uuid = None
         self.x0 = x0
         self.y0 = y0
         self.x1 = x1
@@ -89,7 +188,7 @@ class Diamond:
                  fill='none',
                  fill_lines=[],
                  layer='F.Cu',):
-        self.uuid = uuid.uuid4()
+        self.uuid = None
         self.x0 = x0
         self.y0 = y0
         self.x1 = x1
@@ -120,10 +219,59 @@ class Diamond:
             layer=layer,
         )
 
+def merge_collinear(lines, tolerance=1e-6):
+    """ merges collinear lines of equal width which overlap or touch.
+
+    pad primitives always have round ends, so the union of such lines is
+    exactly the line spanning all of them. lines which are not merged
+    keep their coordinates, merged lines take their end points from the
+    outermost originals. the result keeps the order of first appearance.
+    """
+    if len(lines) < 2:
+        return list(lines)
+    x0, y0, x1, y1, width = np.array([(l.x0, l.y0, l.x1, l.y1, l.width) for l in lines]).T
+    length = np.hypot(x1 - x0, y1 - y0)
+    safe = np.where(length > 0, length, 1)
+    ux = np.where(length > 0, (x1 - x0)/safe, 1)
+    uy = np.where(length > 0, (y1 - y0)/safe, 0)
+    # canonical direction, so that opposite lines share their key.
+    flip = (ux < -tolerance) | ((np.abs(ux) <= tolerance) & (uy < 0))
+    ux, uy = np.where(flip, -ux, ux), np.where(flip, -uy, uy)
+    t0, t1 = ux*x0 + uy*y0, ux*x1 + uy*y1
+    start, end = np.minimum(t0, t1), np.maximum(t0, t1)
+    offset = ux*y0 - uy*x0
+    key = np.column_stack([np.round(ux/tolerance), np.round(uy/tolerance), np.round(offset/tolerance), width])
+
+    order = np.lexsort((start, *key.T[::-1]))
+    group = np.concatenate([[0], np.cumsum(np.any(key[order][1:] != key[order][:-1], axis=1))])
+    # running max of the ends within each group (groups are shifted apart).
+    span = end.max() - start.min() + 1
+    reach = np.maximum.accumulate(end[order] + group*span) - group*span
+    run = np.concatenate([[0], np.cumsum((group[1:] != group[:-1]) | (start[order][1:] > reach[:-1] + tolerance))])
+
+    starts = np.flatnonzero(np.concatenate([[True], run[1:] != run[:-1]]))
+    counts = np.diff(np.append(starts, len(run)))
+    # runs are sorted by start, the last member by end is the run's far end.
+    first = order[starts]
+    by_end = np.lexsort((end[order], run))
+    last = order[by_end[np.append(starts[1:], len(run)) - 1]]
+    position = np.minimum.reduceat(order, starts)
+
+    merged = []
+    for f, l, p, count in zip(first.tolist(), last.tolist(), position.tolist(), counts.tolist()):
+        if count == 1:
+            merged.append((p, lines[p]))
+            continue
+        a = (x0[f], y0[f]) if t0[f] <= t1[f] else (x1[f], y1[f])
+        b = (x1[l], y1[l]) if t0[l] <= t1[l] else (x0[l], y0[l])
+        merged.append((p, Line(float(a[0]), float(a[1]), float(b[0]), float(b[1]), lines[p].width, layer=lines[p].layer)))
+    merged.sort(key=lambda m: m[0])
+    return [line for _, line in merged]
+
 class FpPad:
     def __init__(self, id):
         self.id = id
-        self.uuid = uuid.uuid4()
+        self.uuid = None
         self.type = 'smd'
         self.shape = 'custom'
         self.lines = []
@@ -153,16 +301,22 @@ class FpPad:
                 )
         self.width = self.diamonds[-1].width
 
+    def merge_lines(self):
+        self.lines = merge_collinear(self.lines)
+
 class Footprint:
     def __init__(self,
                  filename,
                  pads=[],
                  mask=[],
-                 silkscreen=[]):
+                 silkscreen=[],
+                 courtyard=False):
         self.filename = filename
+        self.has_courtyard = courtyard
         self.pads = {}
         self.mask = {'rects': [], 'lines': []}
         self.silkscreen = {'lines': []}
+        self.bounds = None
         if len(pads) > 0:
             self.pads_from_shapes(pads)
         if len(mask) > 0:
@@ -170,7 +324,33 @@ class Footprint:
         if len(silkscreen) > 0:
             self.silkscreen_from_shapes(silkscreen)
 
+    def extend_bounds(self, shapes):
+        self.bounds = asmr.design.gfx.union_bounds([
+            self.bounds,
+            asmr.design.gfx.bounds_of(shapes),
+        ])
+
+    def merge_primitives(self):
+        """ reduces the primitive count of the pads without changing their copper. """
+        for pad in self.pads.values():
+            pad.merge_lines()
+
+    def courtyard(self):
+        """ rectangle enclosing the whole footprint with some clearance, if enabled. """
+        if not self.has_courtyard or self.bounds is None:
+            return None
+        c = COURTYARD_CLEARANCE
+        return Rectangle(
+            self.bounds[0] - c,
+            self.bounds[1] - c,
+            self.bounds[2] + c,
+            self.bounds[3] + c,
+            width=COURTYARD_WIDTH,
+            layer="F.CrtYd",
+        )
+
     def pads_from_shapes(self, shapes):
+        self.extend_bounds(shapes)
         for shape in shapes:
             pad_id = shape.group.split("=")[-1]
 
@@ -184,24 +364,51 @@ class Footprint:
                 pad.add_line(shape)
             elif shape.__class__ == asmr.design.gfx.Diamond:
                 pad.add_diamond(shape)
+            elif shape.__class__ == asmr.design.gfx.Curve:
+                for line in shape.lines():
+                    pad.add_line(line)
 
 
     def mask_from_shapes(self, shapes):
+        self.extend_bounds(shapes)
         for shape in shapes:
             if shape.__class__ == asmr.design.gfx.Rectangle:
                 self.mask['rects'].append(Rectangle.from_gfx(shape, layer="F.Mask"))
             if shape.__class__ == asmr.design.gfx.Line:
                 self.mask['lines'].append(Line.from_gfx(shape, layer="F.Mask"))
+            if shape.__class__ == asmr.design.gfx.Curve:
+                self.mask['lines'] += [Line.from_gfx(line, layer="F.Mask") for line in shape.lines()]
 
     def silkscreen_from_shapes(self, shapes):
+        self.extend_bounds(shapes)
         for shape in shapes:
             if shape.__class__ == asmr.design.gfx.Line:
                 self.silkscreen['lines'].append(Line.from_gfx(shape, layer="F.SilkS"))
+            if shape.__class__ == asmr.design.gfx.Curve:
+                self.silkscreen['lines'] += [Line.from_gfx(line, layer="F.SilkS") for line in shape.lines()]
 
-    def save(self):
-        name = '.'.join(self.filename.split('.')[:-1])
-        ctx = {
-            'footprint_name': f'{name}',
+    def assign_tstamps(self, name, courtyard):
+        """ assigns tstamps to all primitives in output order. """
+        tstamps = TstampProvider(name)
+        for pad in self.pads.values():
+            for primitive, tstamp in zip(pad.lines + pad.diamonds, tstamps.take(len(pad.lines) + len(pad.diamonds))):
+                primitive.uuid = tstamp
+            pad.uuid = next(tstamps)
+        primitives = [
+            *self.silkscreen['lines'],
+            *([courtyard] if courtyard is not None else []),
+            *self.mask['rects'],
+            *self.mask['lines'],
+        ]
+        for primitive, tstamp in zip(primitives, tstamps.take(len(primitives))):
+            primitive.uuid = tstamp
+
+    def context(self):
+        name = Path(self.filename).stem
+        courtyard = self.courtyard()
+        self.assign_tstamps(name, courtyard)
+        return {
+            'footprint_name': name,
             'date_created': '20230303',
             'generating_program': 'asmr',
             'description': 'a footprint generated by asmr toolkit.',
@@ -210,52 +417,372 @@ class Footprint:
             'pads': self.pads.values(),
             'silkscreen': self.silkscreen,
             'mask': self.mask,
+            'courtyard': courtyard,
         }
-        render_template(self.filename, FOOTPRINT_TEMPLATE, ctx)
+
+    def write(self, fd):
+        """ streams the footprint s-expression to a file handle. """
+        ctx = self.context()
+        layer = ctx['canonical_layer']
+        fd.write(f'(footprint "{ctx["footprint_name"]}" (version 20211014) (generator {ctx["generating_program"]})\n'
+                 f'  (descr "{ctx["description"]}")\n'
+                 f'  (layer "{layer}")\n'
+                 f'  (tedit {ctx["date_created"]})\n'
+                 f'  (descr "{ctx["description"]}")\n'
+                 f'  (attr {ctx["fp_type"]})\n')
+        self.write_primitives(fd, ctx)
+        fd.write(')\n')
+
+    def write_primitives(self, fd, ctx):
+        """ streams the pads and graphic items of the footprint (shared by .kicad_mod and .kicad_pcb). """
+        layer = ctx['canonical_layer']
+        for pad in ctx['pads']:
+            fd.write(f'  (pad "{pad.id}" {pad.type} {pad.shape} (at {pad.x} {pad.y}) (size 0.01 0.01) (layers "{layer}")\n'
+                     '    (primitives\n')
+            fd.writelines(
+                '      (gr_line\n'
+                f'        (start {line.x0} {line.y0})\n'
+                f'        (end {line.x1} {line.y1})\n'
+                f'        (layer "{layer}")\n'
+                f'        (width {line.width})\n'
+                f'        (tstamp {line.uuid})\n'
+                '      )\n'
+                for line in pad.lines
+            )
+            fd.writelines(
+                '      (gr_poly\n'
+                '        (pts\n'
+                f'          (xy {diamond.x0} {diamond.y0})\n'
+                f'          (xy {diamond.x1} {diamond.y1})\n'
+                f'          (xy {diamond.x2} {diamond.y2})\n'
+                f'          (xy {diamond.x3} {diamond.y3})\n'
+                '        )\n'
+                f'        (layer {diamond.layer})\n'
+                f'        (width {diamond.width})\n'
+                f'        (fill {diamond.fill})\n'
+                f'        (tstamp {diamond.uuid})\n'
+                '      )\n'
+                for diamond in pad.diamonds
+            )
+            fd.write('    )\n'
+                     f'    (tstamp {pad.uuid})\n'
+                     '  )\n')
+
+        fd.writelines(
+            f'  (fp_line (start {line.x0} {line.y0}) (end {line.x1} {line.y1}) (layer "F.SilkS") (width {line.width})\n'
+            f'    (tstamp {line.uuid})\n'
+            '  )\n'
+            for line in ctx['silkscreen']['lines']
+        )
+        rects = ctx['mask']['rects']
+        if ctx['courtyard'] is not None:
+            rects = [ctx['courtyard'], *rects]
+        fd.writelines(
+            '  (fp_rect\n'
+            f'    (start {rect.x0} {rect.y0})\n'
+            f'    (end {rect.x1} {rect.y1})\n'
+            f'    (layer "{rect.layer}")\n'
+            f'    (width {rect.width})\n'
+            f'    (fill {"none" if rect is ctx["courtyard"] else "solid"})\n'
+            f'    (tstamp {rect.uuid})\n'
+            '    )\n'
+            for rect in rects
+        )
+        fd.writelines(
+            '  (fp_line\n'
+            f'    (start {line.x0} {line.y0})\n'
+            f'    (end {line.x1} {line.y1})\n'
+            f'    (layer "{line.layer}")\n'
+            f'    (width {line.width})\n'
+            f'    (tstamp {line.uuid})\n'
+            '    )\n'
+            for line in ctx['mask']['lines']
+        )
+
+    def save(self, template=None):
+        """ writes the footprint, rendering it through a jinja template if one is given. """
+        if template is not None:
+            render_template(self.filename, template, self.context())
+            return
+        with open(self.filename, 'w') as fd:
+            self.write(fd)
+
+class Board:
+    """ Streamed kicad_pcb made of footprint instances and board outline items.
+
+    The primitives of each footprint are serialized once and written out
+    for every placement, only the tstamp prefix is swapped per instance
+    (kicad_pcb has no footprint references, every instance is inlined).
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.footprints = []
+        self.edge_cuts = []
+        self.holes = []
+        self.fiducials = []
+
+    def add_footprint(self, footprint: Footprint, positions):
+        """ places a footprint at each of the (x, y) positions. """
+        self.footprints.append((footprint, list(positions)))
+
+    def add_edge_cut(self, x0, y0, x1, y1):
+        self.edge_cuts.append(Line(x0, y0, x1, y1, EDGE_CUTS_WIDTH, layer="Edge.Cuts"))
+
+    def add_hole(self, x, y, diameter):
+        """ adds a circular cutout (e.g. a mouse-bite perforation). """
+        self.holes.append((x, y, diameter))
+
+    def add_fiducial(self, x, y):
+        self.fiducials.append((x, y))
+
+    def write(self, fd):
+        name = Path(self.filename).stem
+        tstamps = TstampProvider(name)
+        fd.write('(kicad_pcb (version 20211014) (generator asmr)\n'
+                 '  (general\n'
+                 '    (thickness 1.6)\n'
+                 '  )\n'
+                 '  (paper "A4")\n'
+                 '  (layers\n')
+        fd.writelines(f'    {layer}\n' for layer in BOARD_LAYERS)
+        fd.write('  )\n'
+                 '  (setup\n'
+                 '    (pad_to_mask_clearance 0)\n'
+                 '  )\n'
+                 '  (net 0 "")\n')
+
+        for footprint, positions in self.footprints:
+            ctx = footprint.context()
+            primitives = io.StringIO()
+            footprint.write_primitives(primitives, ctx)
+            primitives = primitives.getvalue()
+            prefix = TstampProvider(ctx['footprint_name']).prefix
+            for i, (x, y) in enumerate(positions):
+                fd.write(f'  (footprint "{ctx["footprint_name"]}" (layer "{ctx["canonical_layer"]}")\n'
+                         f'    (tedit {ctx["date_created"]}) (tstamp {next(tstamps)})\n'
+                         f'    (at {x} {y})\n'
+                         f'    (descr "{ctx["description"]}")\n'
+                         f'    (attr {ctx["fp_type"]})\n')
+                fd.write(primitives.replace(prefix, TstampProvider(f'{ctx["footprint_name"]}@{i}').prefix))
+                fd.write('  )\n')
+
+        fd.writelines(
+            '  (footprint "Fiducial" (layer "F.Cu")\n'
+            f'    (tedit 20230303) (tstamp {next(tstamps)})\n'
+            f'    (at {x} {y})\n'
+            '    (attr smd board_only exclude_from_pos_files exclude_from_bom)\n'
+            f'    (pad "" smd circle (at 0 0) (size {FIDUCIAL_DIAMETER} {FIDUCIAL_DIAMETER}) (layers "F.Cu" "F.Mask")\n'
+            f'      (solder_mask_margin {FIDUCIAL_MASK_MARGIN}) (clearance {FIDUCIAL_MASK_MARGIN}) (tstamp {next(tstamps)}))\n'
+            '  )\n'
+            for x, y in self.fiducials
+        )
+        fd.writelines(
+            f'  (gr_line (start {line.x0} {line.y0}) (end {line.x1} {line.y1}) (layer "{line.layer}") (width {line.width}) (tstamp {next(tstamps)}))\n'
+            for line in self.edge_cuts
+        )
+        fd.writelines(
+            f'  (gr_circle (center {x} {y}) (end {x + diameter/2} {y}) (layer "Edge.Cuts") (width {EDGE_CUTS_WIDTH}) (fill none) (tstamp {next(tstamps)}))\n'
+            for x, y, diameter in self.holes
+        )
+        fd.write(')\n')
+
+    def save(self):
+        with open(self.filename, 'w') as fd:
+            self.write(fd)
+
+PIN_SIDES = ('top', 'right', 'bottom', 'left')
+# kicad angle of the pins on each side (pointing at the body).
+PIN_ANGLES = np.array([270, 180, 90, 0])
+PIN_TYPES = (
+    'input', 'output', 'bidirectional', 'tri_state', 'passive', 'free', 'unspecified',
+    'power_in', 'power_out', 'open_collector', 'open_emitter', 'no_connect',
+)
+SYMBOL_PIN_PITCH = 2.54
+SYMBOL_MARGIN = 2.54*5
+
+
+def read_pin_table(filename) -> list:
+    """ reads the pins of a symbol from a table.
+
+    .csv files have a header row, .toml files a [[pin]] entry per pin.
+    every pin has a number and optionally a name, type (see PIN_TYPES),
+    side (see PIN_SIDES) and group.
+    """
+    filename = Path(filename)
+    if filename.suffix == '.toml':
+        return [dict(pin) for pin in toml.load(filename).get('pin', [])]
+    with open(filename, newline='') as fd:
+        return [{k.strip(): v.strip() for k, v in row.items() if k is not None and v} for row in csv.DictReader(fd)]
+
+
+def layout_pins(sides, groups, pitch=SYMBOL_PIN_PITCH, margin=SYMBOL_MARGIN):
+    """ places pins around a rectangular body with array operations.
+
+    sides are indices into PIN_SIDES. pins keep their order along a side
+    (clockwise from the top left corner) and a group change on a side
+    leaves an empty slot. without pins on the other sides, top pins form a
+    strip of height margin. returns the x, y and angle arrays and the body
+    width and height (negative, the body extends down from the origin).
+    """
+    sides = np.asarray(sides, dtype=np.int64)
+    groups = np.asarray(groups, dtype=object)
+    n = len(sides)
+    order = np.argsort(sides, kind='stable')
+    side = sides[order]
+    group = groups[order]
+    first = np.searchsorted(side, side)
+    gaps = np.zeros(n, dtype=np.int64)
+    gaps[1:] = (group[1:] != group[:-1]) & (side[1:] == side[:-1])
+    gaps = np.cumsum(gaps)
+    slots = np.empty(n, dtype=np.int64)
+    slots[order] = np.arange(n) - first + gaps - gaps[first]
+
+    counts = np.zeros(len(PIN_SIDES), dtype=np.int64)
+    np.maximum.at(counts, sides, slots + 1)
+    width = float(max(counts[0], counts[2])*pitch + 2*margin)
+    height = float(-(max(counts[1], counts[3])*pitch + 2*margin) if counts[1:].any() else -margin)
+
+    along = slots*pitch + margin
+    # bottom and left pins run back towards the origin.
+    back = (counts[sides] - slots)*pitch + margin
+    x = np.choose(sides, [along, np.full(n, width), back, np.zeros(n)])
+    y = np.choose(sides, [np.zeros(n), -along, np.full(n, height), -back])
+    return x, y, PIN_ANGLES[sides], width, height
+
+
+def sexpr_number(values) -> list:
+    """ formats coordinates without float noise (at most 4 decimals, as kicad). """
+    return [np.format_float_positional(v, precision=4, trim='-') for v in np.round(np.asarray(values, dtype=float), 4) + 0.0]
+
+
+def sexpr_string(s) -> str:
+    """ escapes a string for a quoted s-expression atom (kicad writes empty ones as ~). """
+    return s.replace('\\', '\\\\').replace('"', '\\"') if s else '~'
+
 
 class Symbol:
+    """ Schematic symbol: a rectangular body with pins on its sides.
+
+    The pins are either n_pins generic pins, or a pin table (a list of
+    dicts or a .csv/.toml file, see read_pin_table). Pins without a side
+    are distributed over the sides (sides maps side names to counts,
+    default: evenly, or all on top without symetric_pins).
+    """
     def __init__(self,
                  filename,
-                 n_pins,
+                 n_pins=0,
                  width=-1,
                  height=-1,
-                 symetric_pins=True):
+                 symetric_pins=True,
+                 pins=None,
+                 sides=None):
         self.filename = filename
-        pitch = 2.54
-        margin = 2.54*5
-        max_pins_per_side = n_pins
-        if symetric_pins:
-            max_pins_per_side = math.ceil(n_pins/4)
-            min_pins_per_side = math.floor(n_pins/4)
-            xlim = (0, max_pins_per_side*pitch + 2*margin)
-            ylim = (0, -(max_pins_per_side*pitch + 2*margin))
-            self.pins = []
-            for i in range(n_pins):
-                p = (0, 0, 0)
-                if i < min_pins_per_side:
-                    p = (i*pitch+margin, ylim[0], 270)
-                elif i < min_pins_per_side*2:
-                    p = (xlim[1], -((i%min_pins_per_side)*pitch+margin), 180)
-                elif i < min_pins_per_side*3:
-                    p = ((min_pins_per_side - (i%min_pins_per_side))*pitch+margin, ylim[1], 90)
-                else:
-                    p = (xlim[0], -((max_pins_per_side - (i%max_pins_per_side))*pitch+margin), 0)
-                self.pins.append(p)
-            self.width = max_pins_per_side*pitch + 2*margin
-            self.height = -(max_pins_per_side*pitch + 2*margin)
+        if isinstance(pins, (str, Path)):
+            pins = read_pin_table(pins)
+        if pins is None:
+            pins = [{'number': str(i), 'name': f'X{i}'} for i in range(1, n_pins + 1)]
+        n = len(pins)
+        self.numbers = [str(pin['number']) for pin in pins]
+        self.names = [str(pin.get('name', '')) for pin in pins]
+        self.types = [pin.get('type', 'input') for pin in pins]
+        for t in set(self.types) - set(PIN_TYPES):
+            raise ValueError(f'unknown pin type {t!r} (one of {", ".join(PIN_TYPES)})')
+        groups = [pin.get('group', '') for pin in pins]
+
+        placed = [pin.get('side') for pin in pins]
+        if all(side is None for side in placed):
+            if sides is None:
+                counts = [n//4 + (i < n%4) for i in range(4)] if symetric_pins else [n, 0, 0, 0]
+            else:
+                counts = [sides.get(side, 0) for side in PIN_SIDES]
+            if sum(counts) != n:
+                raise ValueError(f'the sides have room for {sum(counts)} pins, not {n}')
+            self.sides = np.repeat(np.arange(len(PIN_SIDES)), counts)
+        elif any(side is None for side in placed):
+            raise ValueError('either all or none of the pins have a side')
         else:
-            self.pins = [(x*pitch+margin, 0, 270) for x in range(n_pins)]
-            self.width = max_pins_per_side*pitch + 2*margin
-            self.height = -margin
+            unknown = set(side.lower() for side in placed) - set(PIN_SIDES)
+            if unknown:
+                raise ValueError(f'unknown pin side(s) {", ".join(sorted(unknown))} (one of {", ".join(PIN_SIDES)})')
+            self.sides = np.array([PIN_SIDES.index(side.lower()) for side in placed], dtype=np.int64)
 
-    def save(self):
-        name = '.'.join(self.filename.split('.')[:-1])
-        ctx = {
-            'name': f'{name}',
+        self.x, self.y, self.angles, self.width, self.height = layout_pins(self.sides, groups)
+        self.pins = list(zip(self.x.tolist(), self.y.tolist(), self.angles.tolist()))
+
+    def context(self):
+        return {
+            'name': Path(self.filename).stem,
             'generating_program': 'asmr',
             'description': 'a symbol generated by asmr toolkit.',
             'width': self.width,
             'height': self.height,
-            'pins': self.pins,
+            'pins': list(zip(sexpr_number(self.x), sexpr_number(self.y), self.angles.tolist())),
+            'numbers': [sexpr_string(number) for number in self.numbers],
+            'names': [sexpr_string(pin_name) for pin_name in self.names],
+            'types': self.types,
         }
-        render_template(self.filename, SYMBOL_TEMPLATE, ctx)
+
+    def write(self, fd):
+        """ streams the symbol library s-expression to a file handle. """
+        write_symbol_library(fd, [self])
+
+    def write_symbol(self, fd):
+        """ streams the (symbol ...) expression of a library. """
+        ctx = self.context()
+        name = ctx['name']
+        font = '(effects (font (size 1.27 1.27)))'
+        fd.write(f'  (symbol "{name}" (in_bom yes) (on_board yes)\n'
+                 '    (property "Reference" "U" (id 0) (at 0 5.08 0)\n'
+                 f'      {font}\n'
+                 '    )\n'
+                 f'    (property "Value" "{name}" (id 1) (at 0 2.54 0)\n'
+                 f'      {font}\n'
+                 '    )\n'
+                 '    (property "Footprint" "" (id 2) (at 0 0 0)\n'
+                 '      (effects (font (size 1.27 1.27)) hide)\n'
+                 '    )\n'
+                 '    (property "Datasheet" "" (id 3) (at 0 0 0)\n'
+                 '      (effects (font (size 1.27 1.27)) hide)\n'
+                 '    )\n'
+                 f'    (symbol "{name}_1_1"\n')
+        fd.writelines(
+            f'      (pin {pin_type} line (at {x} {y} {angle}) (length 4)\n'
+            f'        (name "{sexpr_string(pin_name)}" {font})\n'
+            f'        (number "{sexpr_string(number)}" {font})\n'
+            '      )\n'
+            for x, y, angle, pin_type, pin_name, number in zip(
+                sexpr_number(self.x), sexpr_number(self.y), self.angles.tolist(), self.types, self.names, self.numbers)
+        )
+        width, height = sexpr_number([self.width, self.height])
+        fd.write('    )\n'
+                 f'    (symbol "{name}_0_1"\n'
+                 f'      (rectangle (start 0 0) (end {width} {height})\n'
+                 '        (stroke (width 0.1524) (type default) (color 0 0 0 0))\n'
+                 '        (fill (type background))\n'
+                 '      )\n'
+                 '    )\n'
+                 '  )\n')
+
+    def save(self, template=None):
+        """ writes the symbol library, rendering it through a jinja template if one is given. """
+        if template is not None:
+            render_template(self.filename, template, self.context())
+            return
+        with open(self.filename, 'w') as fd:
+            self.write(fd)
+
+
+def write_symbol_library(fd, symbols):
+    """ streams a .kicad_sym library of several symbols (named after their filename). """
+    fd.write('(kicad_symbol_lib\n'
+             '  (version 20211014)\n'
+             '  (generator asmr)\n'
+             '\n')
+    for symbol in symbols:
+        symbol.write_symbol(fd)
+    fd.write(')\n')
+
+
+def save_symbol_library(filename, symbols):
+    with open(filename, 'w') as fd:
+        write_symbol_library(fd, symbols)